@@ -0,0 +1,212 @@
+import logging
+import threading
+import time
+
+from event_stream import ANY
+
+log = logging.getLogger(__name__)
+
+PLAYING = "playing"
+ACTIVE = "active"
+IDLE = "idle"
+CLASSES = (PLAYING, ACTIVE, IDLE)
+
+# Game started / ended, as general poll exceptions or real time events
+GAME_CODES = frozenset(("7e", "7f"))
+# Doors (11-1e), bills (47-50), tickets, handpays, cash outs and AFT
+ACTIVITY_CODES = frozenset(
+    [f"{code:02x}" for code in range(0x11, 0x1f)]
+    + [f"{code:02x}" for code in range(0x47, 0x51)]
+    + ["3d", "3e", "51", "52", "66", "67", "68", "69"]
+)
+
+# Seconds between two meter reads of a machine, per activity class
+METER_INTERVALS = {PLAYING: 10, ACTIVE: 60, IDLE: 600}
+
+
+class ActivityClassifier:
+    """Classify machines by their recent events
+
+    A machine is ``playing`` while it reported a game (7E / 7F) within
+    ``playing_window`` seconds, ``active`` while it reported other player
+    or floor activity (bills, tickets, handpays, doors, AFT) within
+    ``active_window`` seconds, ``idle`` otherwise. The codes come from
+    general polls or real time events alike; others (00, tilts...) do not
+    count as activity.
+
+    Parameters
+    ----------
+    playing_window : float
+    active_window : float
+    """
+
+    def __init__(self, playing_window=120, active_window=600):
+        self.playing_window = playing_window
+        self.active_window = active_window
+        self._last_game = {}
+        self._last_activity = {}
+        self._lock = threading.Lock()
+
+    def observe(self, machine, code, now=None):
+        """Account for event ``code`` of ``machine`` (any hashable id, e.g. the address)
+
+        Returns
+        -------
+        bool
+            True when the event ends an idle period (activity onset)
+        """
+        code = code.lower()
+        if code not in GAME_CODES and code not in ACTIVITY_CODES:
+            return False
+
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            onset = self._state(machine, now) == IDLE
+            if code in GAME_CODES:
+                self._last_game[machine] = now
+            self._last_activity[machine] = now
+        return onset
+
+    def _state(self, machine, now):
+        if now - self._last_game.get(machine, float("-inf")) < self.playing_window:
+            return PLAYING
+        if now - self._last_activity.get(machine, float("-inf")) < self.active_window:
+            return ACTIVE
+        return IDLE
+
+    def state(self, machine, now=None):
+        """``playing``, ``active`` or ``idle``"""
+        with self._lock:
+            return self._state(machine, time.monotonic() if now is None else now)
+
+
+class MeterScheduler:
+    """Meter refresh intervals adapted to the activity of each machine
+
+    Busy machines get their meters read every few seconds, idle ones every
+    few minutes, and a machine leaving the idle class is read at once so
+    the start of a session is not missed. Machines never read are due. A
+    failed read leaves the machine due and is retried after a short
+    backoff, doubling up to ``retry_backoff[1]`` (never beyond the interval
+    of the machine's class) until a read succeeds.
+
+        meters = MeterScheduler()
+        meters.attach(stream, sas.send_meters_10_15)   # an event_stream.EventStream
+
+    or, from a custom loop::
+
+        meters.observe(address, code)
+        if meters.due(address):
+            if read_meters(address):
+                meters.done(address)
+            else:
+                meters.failed(address)
+
+    Parameters
+    ----------
+    intervals : dict | float
+        Seconds between two reads per activity class (see ``METER_INTERVALS``),
+        or one interval for every class
+    classifier : ActivityClassifier, optional
+    retry_backoff : tuple
+        (first, maximum) seconds before retrying a failed read
+    """
+
+    def __init__(self, intervals=None, classifier=None, retry_backoff=(1, 30)):
+        if intervals is None:
+            intervals = METER_INTERVALS
+        elif not isinstance(intervals, dict):
+            intervals = dict.fromkeys(CLASSES, intervals)
+        self.intervals = dict(intervals)
+        self.classifier = classifier or ActivityClassifier()
+        self.retry_backoff = retry_backoff
+        self.reads = dict.fromkeys(CLASSES, 0)
+        self.failures = 0
+        self.onsets = 0
+        self._last_read = {}
+        self._pending = set()
+        self._failed = {}  # machine: consecutive failed reads
+        self._retry_at = {}
+        self._lock = threading.Lock()
+
+    def observe(self, machine, code, now=None):
+        """Feed an event of ``machine``; an activity onset makes its meters due"""
+        if self.classifier.observe(machine, code, now):
+            log.debug(f"{machine}: activity onset ({code}), meters due")
+            with self._lock:
+                self._pending.add(machine)
+                self.onsets += 1
+
+    def interval(self, machine, now=None):
+        """Current refresh interval of ``machine``"""
+        return self.intervals[self.classifier.state(machine, now)]
+
+    def due(self, machine, now=None):
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            if now < self._retry_at.get(machine, now):
+                return False
+            if machine in self._pending or machine not in self._last_read:
+                return True
+            last = self._last_read[machine]
+        return now - last >= self.interval(machine, now)
+
+    def done(self, machine, now=None):
+        """Record a successful read of the meters of ``machine``"""
+        now = time.monotonic() if now is None else now
+        state = self.classifier.state(machine, now)
+        with self._lock:
+            self._last_read[machine] = now
+            self._pending.discard(machine)
+            self._failed.pop(machine, None)
+            self._retry_at.pop(machine, None)
+            self.reads[state] += 1
+
+    def failed(self, machine, now=None):
+        """Record a failed read: ``machine`` stays due, retried after the backoff"""
+        now = time.monotonic() if now is None else now
+        first, longest = self.retry_backoff
+        delay = min(longest, self.interval(machine, now))
+        with self._lock:
+            count = self._failed[machine] = self._failed.get(machine, 0) + 1
+            self._retry_at[machine] = now + min(delay, first * 2 ** (count - 1))
+            self.failures += 1
+
+    def attach(self, stream, read, machine=None):
+        """Drive the meter reads of an ``EventStream``
+
+        Parameters
+        ----------
+        stream : event_stream.EventStream
+        read : callable
+            Reads the meters, called between two general polls when due;
+            returning None (or raising) counts as a failed read
+        machine : optional
+            Id of the machine, the address of the stream's EGM by default
+        """
+        machine = stream.sas.address if machine is None else machine
+        stream.subscribe(ANY, lambda code: self.observe(machine, code))
+
+        def task():
+            if not self.due(machine):
+                return
+            try:
+                values = read()
+            except Exception:
+                self.failed(machine)
+                raise
+            if values is None:
+                self.failed(machine)
+            else:
+                self.done(machine)
+
+        stream.add_task(task)
+
+    def summary(self, now=None):
+        """Machines per activity class and reads done per class"""
+        with self._lock:
+            machines = list(self._last_read)
+        classes = dict.fromkeys(CLASSES, 0)
+        for machine in machines:
+            classes[self.classifier.state(machine, now)] += 1
+        return {"machines": classes, "reads": dict(self.reads), "failures": self.failures, "onsets": self.onsets}
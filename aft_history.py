@@ -0,0 +1,85 @@
+import logging
+
+from utils.SeenIndex import SeenIndex
+
+log = logging.getLogger(__name__)
+
+
+class AftHistoryReader:
+    """Incremental reader of the EGM AFT transaction history buffer
+
+    The EGM keeps up to 127 completed transfers (72 buffer indexes 01-7F).
+    Each ``sync`` starts from the most recent transfer and walks the buffer
+    backwards, handing every new record to ``sink`` as soon as it is parsed.
+    It stops at the first transaction id already present in the local index,
+    so a nightly run only reads the transfers made since the previous one.
+
+    Parameters
+    ----------
+    sas : igtsas.Sas
+        Started connection to the EGM
+    sink : callable
+        Called with each record dict (newest first)
+    index : utils.SeenIndex.SeenIndex, optional
+        Already synced ids; pass one with a ``path`` to persist between runs
+    """
+
+    NO_TRANSFER_INFO = "ff"
+
+    def __init__(self, sas, sink, index=None):
+        self.sas = sas
+        self.sink = sink
+        self.index = index if index is not None else SeenIndex()
+
+    @staticmethod
+    def _key(record):
+        return f"{record.get('asset_number', '')}:{record['transaction_id']}"
+
+    def _is_new(self, record):
+        if not record or record["transfer_status"] == self.NO_TRANSFER_INFO:
+            return False
+        if "transaction_id" not in record:
+            return False
+
+        return self._key(record) not in self.index
+
+    def sync(self):
+        """Stream the transfers made since the last sync into the sink
+
+        Returns
+        -------
+        int
+            Number of records handed to the sink
+        """
+        current = self.sas.aft_transaction_history(0x00)
+        if not self._is_new(current):
+            log.debug("AFT history: nothing new")
+            return 0
+
+        max_index = self.sas.aft_max_buffer_index()
+        if not max_index:
+            log.warning("AFT history: unable to read max buffer index")
+            return 0
+
+        position = current["transaction_buffer_position"]
+        count = 0
+        try:
+            for _ in range(max_index):
+                if not 0 < position <= max_index:
+                    break
+
+                record = self.sas.aft_transaction_history(position)
+                if not self._is_new(record):
+                    break
+
+                self.sink(record)
+                self.index.add(self._key(record))
+                count += 1
+
+                # The buffer is circular: wrap from 01 back to the last index
+                position = position - 1 if position > 1 else max_index
+        finally:
+            self.index.save()
+
+        log.info(f"AFT history: {count} new transfers synced")
+        return count
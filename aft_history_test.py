@@ -0,0 +1,42 @@
+from aft_history import AftHistoryReader
+from igtsas import Sas
+from simulated_egm import LoopbackConnection, SimulatedEgm
+
+
+def _reader(egm):
+    sas = Sas("/dev/ttyS0", connection=LoopbackConnection(egm), address=egm.address, debug_level="CRITICAL")
+    records = []
+    return AftHistoryReader(sas, records.append), records
+
+
+def test_empty_buffer():
+    reader, records = _reader(SimulatedEgm(seed=1))
+
+    assert reader.sync() == 0
+    assert records == []
+
+
+def test_wrapped_buffer():
+    egm = SimulatedEgm(seed=1)
+    entries = [egm.aft_transfer(100 * (n + 1)) for n in range(130)]
+    reader, records = _reader(egm)
+
+    assert reader.sync() == 0x7F
+    # Newest first, from position 03 back through 01 to 7F: the three oldest were overwritten
+    assert [r["transaction_buffer_position"] for r in records[:4]] == [0x03, 0x02, 0x01, 0x7F]
+    assert [r["transaction_id"] for r in records] == [e[6].hex() for e in reversed(entries[3:])]
+    assert records[0]["cashable_amount"] == 13000
+
+
+def test_second_sync_reads_only_new_entries():
+    egm = SimulatedEgm(seed=1)
+    for n in range(5):
+        egm.aft_transfer(500)
+    reader, records = _reader(egm)
+    assert reader.sync() == 5
+
+    new = [egm.aft_transfer(2500 + n) for n in range(3)]
+
+    assert reader.sync() == 3
+    assert [r["transaction_id"] for r in records[5:]] == [e[6].hex() for e in reversed(new)]
+    assert reader.sync() == 0
@@ -0,0 +1,298 @@
+"""Benchmarks of the SAS hot paths
+
+Covers CRC, frame building, BCD decoding, the long poll decoders, event
+decoding and end-to-end polls per second against a simulated EGM (in
+process, or on a pty with --pty). Results are written as JSON with the
+machine metadata and, given a baseline, compared case by case:
+
+    python benchmark.py --output base.json
+    ...
+    python benchmark.py --baseline base.json --fail-on-regression
+"""
+import argparse
+import binascii
+import contextlib
+import datetime
+import fnmatch
+import json
+import os
+import platform
+import socket
+import statistics
+import subprocess
+import sys
+import time
+
+from igtsas import Sas
+from models import GPoll
+from simulated_egm import LoopbackConnection, PtyEgmServer, PtySerial, SimulatedEgm, crc
+from utils import Crc
+
+CASES = {}
+
+
+def case(name):
+    """Register ``setup`` as benchmark ``name``; it returns the callable to time"""
+
+    def register(setup):
+        CASES[name] = setup
+        return setup
+
+    return register
+
+
+def _busy_egm(seed=1):
+    egm = SimulatedEgm(address=1, seed=seed)
+    for _ in range(200):
+        egm.tick()
+    egm.hit_handpay(125000)
+    egm.exceptions.clear()
+    return egm
+
+
+def _sas(connection):
+    return Sas("benchmark", connection=connection, address=1, debug_level="CRITICAL")
+
+
+# Answer to a 0F long poll, six 4 bytes BCD meters (CRC from the simulator, Crc.calculate prints)
+FRAME = bytes([0x01, 0x0F]) + bytes.fromhex("00001234" * 6)
+FRAME += crc(FRAME)
+
+
+@case("crc_calculate")
+def _crc_calculate():
+    payload = FRAME[:-2]
+    return lambda: Crc.calculate(payload)
+
+
+@case("crc_validate")
+def _crc_validate():
+    return lambda: Crc.validate(FRAME)
+
+
+@case("frame_build_aft_transfer")
+def _frame_build():
+    def build():
+        cmd = [0x01, 0x72, 0x00, 0x00, 0x00, 0x00]
+        cmd.extend(Sas._bcd_coder_array(12345, 5))
+        cmd.extend(Sas._bcd_coder_array(0, 5))
+        cmd.extend(Sas._bcd_coder_array(0, 5))
+        cmd.extend([0x00] + [0x01, 0x00, 0x00, 0x00] + [0x00] * 20 + [0x04] + [0x30, 0x30, 0x30, 0x31])
+        cmd[2] = len(cmd) - 3
+        cmd.extend(Crc.calculate(bytes(cmd)))
+        return bytes(cmd)
+
+    return build
+
+
+@case("bcd_decode_meters")
+def _bcd_decode():
+    data = FRAME[1:-2]
+
+    def decode():
+        return [int(binascii.hexlify(bytearray(data[i:i + 4]))) for i in range(1, 25, 4)]
+
+    return decode
+
+
+@case("event_decode")
+def _event_decode():
+    codes = ["00", "7e", "7f", "3d", "4a", "51", "11", "12", "69", "1f"]
+    state = {"i": 0}
+
+    def decode():
+        state["i"] = (state["i"] + 1) % len(codes)
+        return GPoll.GPoll.get_status(codes[state["i"]])
+
+    return decode
+
+
+# Long poll decoders, fed with the validated answer of a simulated EGM (no I/O)
+DECODERS = {
+    "send_meters_10_15": ([0x0F], lambda sas: sas.send_meters_10_15()),
+    "meters_11_15": ([0x19], lambda sas: sas.meters_11_15()),
+    "current_credits": ([0x1A], lambda sas: sas.current_credits()),
+    "total_cancelled_credits": ([0x10], lambda sas: sas.total_cancelled_credits()),
+    "handpay_record": ([0x1B], lambda sas: sas.handpay_record()),
+    "gaming_machine_id": ([0x1F], lambda sas: sas.gaming_machine_id()),
+    "sas_version_gaming_machine_serial_id": ([0x54, 0x00], lambda sas: sas.sas_version_gaming_machine_serial_id()),
+    "selected_game_number": ([0x55], lambda sas: sas.selected_game_number()),
+    "current_date_time": ([0x7E], lambda sas: sas.current_date_time()),
+    "aft_game_lock_and_status_request": (
+        [0x74, 0x00, 0x00, 0x00, 0x00],
+        lambda sas: sas.aft_game_lock_and_status_request(),
+    ),
+}
+
+
+def _decoder_case(name, request, call):
+    def setup():
+        egm = _busy_egm()
+        if len(request) > 2:
+            body = bytes([1] + request)
+            request_frame = bytes(request) + crc(body)
+        else:
+            request_frame = bytes(request)
+        answer = egm.long_poll(request_frame)
+        validated = answer[1:-2]
+
+        sas = _sas(LoopbackConnection(egm))
+        sas._send_command = lambda *args, **kwargs: validated
+        return lambda: call(sas)
+
+    CASES[f"decode_{name}"] = setup
+
+
+for _name, (_request, _call) in DECODERS.items():
+    _decoder_case(_name, _request, _call)
+
+
+def _end_to_end(poll):
+    def setup():
+        return (lambda sas: lambda: poll(sas))(_sas(LoopbackConnection(_busy_egm())))
+
+    return setup
+
+
+CASES["e2e_general_poll"] = _end_to_end(lambda sas: sas.general_poll())
+CASES["e2e_current_credits"] = _end_to_end(lambda sas: sas.current_credits())
+CASES["e2e_send_meters_10_15"] = _end_to_end(lambda sas: sas.send_meters_10_15())
+CASES["e2e_aft_transaction_history"] = _end_to_end(lambda sas: sas.aft_transaction_history(0))
+
+
+def _pty_cases():
+    """Same end-to-end polls through a pseudo terminal; returns the server to stop"""
+    server = PtyEgmServer()
+    port = server.add(_busy_egm())
+    server.start()
+    sas = Sas(port, connection=PtySerial(port, timeout=0.5), timeout=0.5, address=1, debug_level="CRITICAL")
+    CASES["e2e_pty_general_poll"] = lambda: lambda: sas.general_poll()
+    CASES["e2e_pty_current_credits"] = lambda: lambda: sas.current_credits()
+    CASES["e2e_pty_send_meters_10_15"] = lambda: lambda: sas.send_meters_10_15()
+    return server, sas
+
+
+def run_case(function, min_time=0.2, repeat=5):
+    """Time ``function``; returns ops/s and ns/op (median of ``repeat`` runs)"""
+    loops = 1
+    while True:
+        started = time.perf_counter()
+        for _ in range(loops):
+            function()
+        elapsed = time.perf_counter() - started
+        if elapsed >= min_time / 10:
+            break
+        loops *= 10
+    loops = max(1, int(loops * min_time / elapsed))
+
+    rates = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for _ in range(loops):
+            function()
+        rates.append(loops / (time.perf_counter() - started))
+
+    ops = statistics.median(rates)
+    return {
+        "ops_per_sec": round(ops, 1),
+        "ns_per_op": round(1e9 / ops, 1),
+        "loops": loops,
+        "runs": [round(rate, 1) for rate in rates],
+        "spread": round((max(rates) - min(rates)) / ops, 3),
+    }
+
+
+def metadata():
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)), timeout=5,
+        ).stdout.strip()
+    except Exception:
+        commit = None
+
+    return {
+        "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+        "hostname": socket.gethostname(),
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "processor": platform.processor(),
+        "cpu_count": os.cpu_count(),
+        "python": platform.python_version(),
+        "implementation": platform.python_implementation(),
+        "commit": commit,
+    }
+
+
+def compare(results, baseline, threshold=0.10):
+    """Ratio of each case to the baseline; a case is a regression below 1 - ``threshold``"""
+    report = {}
+    for name, result in results.items():
+        base = baseline.get("results", {}).get(name)
+        if not base:
+            continue
+        ratio = result["ops_per_sec"] / base["ops_per_sec"]
+        report[name] = {
+            "baseline_ops_per_sec": base["ops_per_sec"],
+            "ratio": round(ratio, 3),
+            "regression": ratio < 1 - threshold,
+        }
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="SAS protocol benchmarks")
+    parser.add_argument("--only", default="*", help="glob of the cases to run, e.g. 'decode_*'")
+    parser.add_argument("--output", default="benchmark_results.json")
+    parser.add_argument("--baseline", help="previous results to compare with")
+    parser.add_argument("--threshold", type=float, default=0.10, help="slowdown flagged as a regression")
+    parser.add_argument("--min-time", type=float, default=0.2, help="seconds per run")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--pty", action="store_true", help="also run the end-to-end polls through a pty")
+    parser.add_argument("--fail-on-regression", action="store_true")
+    parser.add_argument("--list", action="store_true")
+    args = parser.parse_args(argv)
+
+    pty = _pty_cases() if args.pty else None
+    names = [name for name in CASES if fnmatch.fnmatch(name, args.only)]
+    if args.list:
+        print("\n".join(names))
+        return 0
+
+    results = {}
+    try:
+        for name in names:
+            # The library prints every frame and CRC step; keep that off the terminal
+            with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+                results[name] = run_case(CASES[name](), args.min_time, args.repeat)
+            print(f"{name:45s} {results[name]['ops_per_sec']:>12,.0f} ops/s {results[name]['ns_per_op']:>12,.0f} ns/op")
+    finally:
+        if pty is not None:
+            pty[1].close()
+            pty[0].stop()
+
+    document = {"metadata": metadata(), "results": results}
+    regressions = []
+    if args.baseline:
+        with open(args.baseline, "r") as baseline_file:
+            baseline = json.load(baseline_file)
+        document["baseline"] = {"metadata": baseline.get("metadata"), "comparison": compare(results, baseline, args.threshold)}
+        for name, row in document["baseline"]["comparison"].items():
+            flag = "REGRESSION" if row["regression"] else ""
+            print(f"{name:45s} x{row['ratio']:<6} {flag}")
+            if row["regression"]:
+                regressions.append(name)
+
+    with open(args.output, "w") as output_file:
+        json.dump(document, output_file, indent=2)
+    print(f"Results written to {args.output}")
+
+    if regressions:
+        print(f"{len(regressions)} regression(s): {', '.join(regressions)}")
+        if args.fail_on_regression:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
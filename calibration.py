@@ -0,0 +1,215 @@
+"""Find the fastest reliable line settings of an EGM model
+
+Machines differ in the poll address they expect before a long poll (0x82
+on most, 0x80 on some) and in how long they need between their address
+and the body of the poll (``Sas.wait_for_wake_up``). ``Calibrator`` tries
+every poll address with increasing wake-up delays, using read-only long
+polls only (1A credits, 0F meters, 1F game information, 54 version),
+keeps for each address the shortest delay answering every
+poll, confirms it with a longer run and picks the fastest. The result is
+stored per model in ``utils.ModelProfiles``; a ``Sas`` given the same
+profiles applies it when ``Sas.identify`` has identified its EGM.
+
+    python calibration.py /dev/ttyUSB0 --address 1 --profiles sas_profiles.json
+"""
+import argparse
+import contextlib
+import datetime
+import logging
+import os
+import statistics
+import sys
+import time
+
+from igtsas import Sas
+from utils.ModelProfiles import ModelProfiles
+
+log = logging.getLogger(__name__)
+
+# (name, poll) - nothing here changes the state of the EGM. No general poll: it would dequeue
+# (and lose) the pending exceptions of a live machine, and it does not use the wake-up delay anyway
+PROBES = (
+    ("current_credits", lambda sas, timeout: sas._send_command([0x1A], crc_need=False, size=8, timeout=timeout)),
+    ("meters_10_15", lambda sas, timeout: sas._send_command([0x0F], crc_need=False, size=28, timeout=timeout)),
+    ("game_info", lambda sas, timeout: sas._send_command([0x1F], crc_need=False, size=24, timeout=timeout)),
+    ("sas_version", lambda sas, timeout: sas._send_command([0x54, 0x00], crc_need=False, var_length=True,
+                                                            timeout=timeout)),
+)
+
+POLL_ADDRESSES = (0x82, 0x80)
+WAKE_UP_DELAYS = (0.0, 0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1)
+
+
+class Calibrator:
+    """Probe one EGM for its fastest reliable poll address and wake-up delay
+
+    Parameters
+    ----------
+    sas : Sas
+        Handle of the EGM, its address known
+    poll_addresses : tuple
+        Candidates, in order of preference on a tie
+    wake_up_delays : tuple
+        Candidate ``wait_for_wake_up`` seconds, tried from the shortest
+    attempts : int
+        Polls per trial; a setting is reliable when all of them are answered,
+        the trial stops at the first miss
+    confirm : int
+        Polls of the confirmation run of the shortest reliable delay
+    timeout : float
+        Read timeout of the probes
+    """
+
+    def __init__(self, sas, poll_addresses=POLL_ADDRESSES, wake_up_delays=WAKE_UP_DELAYS, attempts=20, confirm=100,
+                 timeout=0.2):
+        self.sas = sas
+        self.poll_addresses = poll_addresses
+        self.wake_up_delays = sorted(wake_up_delays)
+        self.attempts = attempts
+        self.confirm = confirm
+        self.timeout = timeout
+        self.trials = []
+
+    def trial(self, poll_address, wait_for_wake_up, attempts=None):
+        """Run the probes ``attempts`` times with these settings"""
+        attempts = attempts or self.attempts
+        self.sas.poll_address = poll_address
+        self.sas.wait_for_wake_up = wait_for_wake_up
+        self.sas.flush_hard()
+
+        answered, seconds = 0, []
+        for i in range(attempts):
+            _, probe = PROBES[i % len(PROBES)]
+            started = time.monotonic()
+            try:
+                ok = probe(self.sas, self.timeout) is not None
+            except Exception as e:
+                log.debug(f"Probe failed: {e}")
+                ok = False
+            seconds.append(time.monotonic() - started)
+            if not ok:
+                # One miss is enough to reject the setting, no need to wait out more timeouts
+                self.sas.flush_hard()
+                break
+            answered += 1
+
+        result = {
+            "poll_address": poll_address,
+            "wait_for_wake_up": wait_for_wake_up,
+            "attempts": attempts,
+            "answered": answered,
+            "reliable": answered == attempts,
+            "median_ms": round(statistics.median(seconds) * 1000, 2),
+        }
+        self.trials.append(result)
+        log.info(f"poll address {poll_address:02x} wake up {wait_for_wake_up}s: "
+                 f"{'reliable' if result['reliable'] else f'missed poll {answered + 1}'}, "
+                 f"median {result['median_ms']} ms")
+        return result
+
+    def _shortest_reliable(self, poll_address):
+        for wait in self.wake_up_delays:
+            if not self.trial(poll_address, wait)["reliable"]:
+                continue
+            # A marginal delay can pass a short trial, it has to hold a longer one too
+            confirmed = self.trial(poll_address, wait, self.confirm)
+            if confirmed["reliable"]:
+                return confirmed
+        return None
+
+    def run(self):
+        """Calibrate and return the best settings, None if nothing was reliable
+
+        The EGM handle is left with the best settings (or its previous ones).
+        Its link monitor and profiles are detached while probing: the
+        failures of the bad settings are expected.
+        """
+        sas = self.sas
+        previous = sas.poll_address, sas.wait_for_wake_up
+        link, sas.link = sas.link, None
+        profiles, sas.profiles = sas.profiles, None
+        try:
+            candidates = [result for result in map(self._shortest_reliable, self.poll_addresses) if result]
+        finally:
+            sas.link, sas.profiles = link, profiles
+
+        if not candidates:
+            sas.poll_address, sas.wait_for_wake_up = previous
+            return None
+
+        best = min(candidates, key=lambda result: result["median_ms"])
+        sas.poll_address, sas.wait_for_wake_up = best["poll_address"], best["wait_for_wake_up"]
+        return {
+            "poll_address": best["poll_address"],
+            "wait_for_wake_up": best["wait_for_wake_up"],
+            "median_ms": best["median_ms"],
+            "calibrated_at": datetime.datetime.now().isoformat(timespec="seconds"),
+        }
+
+
+def calibrate(sas, profiles, **kwargs):
+    """Calibrate the EGM of ``sas`` and store the profile of its model
+
+    Returns
+    -------
+    Mixed
+        tuple - (model, profile) | None if the EGM could not be identified or
+        no setting was reliable
+    """
+    calibrator = Calibrator(sas, **kwargs)
+    # The identification needs one working setting: the first reliable one found
+    model = sas.machine_model()
+    if model is None:
+        for poll_address in calibrator.poll_addresses:
+            sas.poll_address, sas.wait_for_wake_up = poll_address, calibrator.wake_up_delays[-1]
+            model = sas.machine_model()
+            if model is not None:
+                break
+    if model is None:
+        log.error("The EGM does not answer 1F / 54, nothing to calibrate")
+        return None
+
+    profile = calibrator.run()
+    if profile is None:
+        log.error(f"No reliable setting for model {model['key']}")
+        return None
+
+    profile["trials"] = len(calibrator.trials)
+    profiles.put(model["key"], profile, serial=model["serial"])
+    profiles.save()
+    sas.model, sas.profile = model, profiles.get(model["key"])
+    return model, sas.profile
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Calibrate the poll address and wake-up delay of an EGM model")
+    parser.add_argument("port")
+    parser.add_argument("--address", type=lambda value: int(value, 0), required=True)
+    parser.add_argument("--profiles", default="sas_profiles.json")
+    parser.add_argument("--attempts", type=int, default=20, help="polls per trial")
+    parser.add_argument("--confirm", type=int, default=100, help="polls confirming the shortest reliable delay")
+    parser.add_argument("--timeout", type=float, default=0.2)
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    sas = Sas(args.port, timeout=args.timeout, address=args.address, debug_level="CRITICAL")
+    # Failed probes are logged as CRITICAL with their traceback: expected here
+    sas.log.setLevel(logging.CRITICAL + 1)
+    profiles = ModelProfiles(args.profiles)
+    try:
+        # The library prints every frame; keep the terminal for the report
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            result = calibrate(sas, profiles, attempts=args.attempts, confirm=args.confirm, timeout=args.timeout)
+    finally:
+        sas.close()
+
+    if result is None:
+        return 1
+    model, profile = result
+    print(f"{model['key']} (serial {model['serial']}): poll address {profile['poll_address']:#04x}, "
+          f"wake up {profile['wait_for_wake_up']}s, {profile['median_ms']} ms per poll -> {args.profiles}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
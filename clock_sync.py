@@ -0,0 +1,167 @@
+import datetime
+import logging
+import sqlite3
+import threading
+import time
+
+log = logging.getLogger(__name__)
+
+# Asset number of a Sas handle created without one
+DEFAULT_ASSET_NUMBER = "1"
+
+
+def machine_key(sas):
+    """Drift key of an EGM: its asset number when one was set, else port and address (port alone without one)"""
+    if sas.asset_number is not None and str(sas.asset_number) != DEFAULT_ASSET_NUMBER:
+        return str(sas.asset_number)
+    if sas.address is None:
+        return str(sas.port)
+    return f"{sas.port}:{sas.address:02x}"
+
+
+class DriftStore:
+    """SQLite time series of clock drift samples
+
+    Samples are keyed by ``machine_key`` (stored in the ``asset_number`` column).
+    """
+
+    def __init__(self, path=":memory:"):
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(
+            """CREATE TABLE IF NOT EXISTS clock_samples (
+                asset_number TEXT NOT NULL,
+                sampled_at REAL NOT NULL,
+                drift REAL NOT NULL,
+                round_trip REAL NOT NULL
+            )"""
+        )
+        self._db.execute(
+            "CREATE INDEX IF NOT EXISTS clock_samples_asset ON clock_samples (asset_number, sampled_at)"
+        )
+        self._db.commit()
+
+    def add(self, asset_number, sampled_at, drift, round_trip):
+        with self._lock:
+            self._db.execute(
+                "INSERT INTO clock_samples VALUES (?, ?, ?, ?)",
+                (asset_number, sampled_at, drift, round_trip),
+            )
+            self._db.commit()
+
+    def series(self, asset_number, since=0):
+        """List of (sampled_at, drift, round_trip) for one EGM"""
+        with self._lock:
+            return self._db.execute(
+                "SELECT sampled_at, drift, round_trip FROM clock_samples "
+                "WHERE asset_number = ? AND sampled_at >= ? ORDER BY sampled_at",
+                (asset_number, since),
+            ).fetchall()
+
+    def close(self):
+        self._db.close()
+
+
+class ClockSync:
+    """Fleet date/time sync with drift monitoring
+
+    Every ``interval`` seconds the date and time (7F) is broadcast once per
+    loop, instead of one round trip per EGM. In between, ``sample_size``
+    EGMs per run are asked for their clock (7E) in rotation; the drift
+    (EGM clock minus host clock at the middle of the round trip) is stored
+    in ``store`` and only the EGMs drifting by more than ``threshold``
+    seconds get an addressed 7F right away. Drifts are keyed by
+    ``machine_key``: the asset number, or port and address for handles
+    left with the default asset number, which every EGM would share.
+
+    Parameters
+    ----------
+    links : list
+        One ``igtsas.Sas`` per loop, used for the broadcasts
+    machines : list
+        ``igtsas.Sas`` handles of the EGMs to sample
+    interval : float
+        Seconds between two broadcasts
+    sample_size : int
+        EGMs sampled per ``run_once``
+    threshold : float
+        Drift in seconds above which an EGM is re-synced
+    store : DriftStore, optional
+    """
+
+    def __init__(self, links, machines, interval=3600, sample_size=4, threshold=2.0, store=None):
+        self.links = list(links)
+        self.machines = list(machines)
+        self.interval = interval
+        self.sample_size = sample_size
+        self.threshold = threshold
+        self.store = store if store is not None else DriftStore()
+        self.drift = {}
+        self._next = 0
+        self._last_broadcast = None
+        self._stop = threading.Event()
+
+    def broadcast(self):
+        """Send the host date and time to every loop"""
+        now = datetime.datetime.now()
+        for link in self.links:
+            link.set_date_time(now, broadcast=True)
+        self._last_broadcast = time.monotonic()
+        log.info(f"Date/time broadcast to {len(self.links)} loop(s)")
+
+    def sample(self, sas):
+        """Measure the drift of one EGM in seconds, None if it did not answer"""
+        before = time.time()
+        egm_time = sas.current_date_time()
+        after = time.time()
+        if egm_time is None:
+            return None
+
+        drift = egm_time.timestamp() - (before + after) / 2
+        key = machine_key(sas)
+        self.store.add(key, after, drift, after - before)
+        self.drift[key] = drift
+        return drift
+
+    def _rotation(self):
+        count = min(self.sample_size, len(self.machines))
+        for _ in range(count):
+            yield self.machines[self._next % len(self.machines)]
+            self._next += 1
+
+    def run_once(self):
+        """Broadcast if due, then sample the next EGMs and re-sync the drifting ones
+
+        Returns
+        -------
+        list
+            ``machine_key`` of the EGMs that were re-synced
+        """
+        if self._last_broadcast is None or time.monotonic() - self._last_broadcast >= self.interval:
+            self.broadcast()
+
+        resynced = []
+        for sas in self._rotation():
+            try:
+                drift = self.sample(sas)
+            except Exception as e:
+                log.error(f"Clock sample failed for {machine_key(sas)}: {e}", exc_info=True)
+                continue
+
+            # EGM clocks have a 1 second resolution, the threshold should stay above it
+            if drift is not None and abs(drift) > self.threshold:
+                log.warning(f"EGM {machine_key(sas)} drifted {drift:.1f}s, re-syncing")
+                sas.set_date_time()
+                resynced.append(machine_key(sas))
+
+        return resynced
+
+    def run(self, period=60):
+        """Call ``run_once`` every ``period`` seconds until ``stop``"""
+        self._stop.clear()
+        while not self._stop.is_set():
+            self.run_once()
+            self._stop.wait(period)
+
+    def stop(self):
+        self._stop.set()
@@ -0,0 +1,26 @@
+from clock_sync import ClockSync, machine_key
+from igtsas import Sas
+from simulated_egm import LoopbackConnection, SimulatedEgm
+
+
+def _sas(connection, address, **kwargs):
+    return Sas("/dev/ttyS0", connection=connection, address=address, debug_level="CRITICAL", **kwargs)
+
+
+def test_set_date_time_acknowledged_by_address_12():
+    sas = _sas(LoopbackConnection(SimulatedEgm(address=0x12)), 0x12)
+
+    assert sas.set_date_time() is True
+
+
+def test_drift_keyed_by_port_and_address_without_asset_number():
+    connection = LoopbackConnection([SimulatedEgm(address=0x01), SimulatedEgm(address=0x12)])
+    machines = [_sas(connection, 0x01), _sas(connection, 0x12), _sas(connection, 0x01, asset_number="1042")]
+    clock = ClockSync([], machines, sample_size=3)
+    clock.run_once()
+
+    assert sorted(clock.drift) == ["/dev/ttyS0:01", "/dev/ttyS0:12", "1042"]
+
+
+def test_machine_key_without_address():
+    assert machine_key(_sas(LoopbackConnection(SimulatedEgm()), None)) == "/dev/ttyS0"
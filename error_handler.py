@@ -39,4 +39,9 @@ class EMGGpollBadResponse(ErrorHandler):
 
 class BadCommandIsRunning(ErrorHandler):
     def __init__(self, message="BadCommand response", error_code=None):
-        super().__init__(message, error_code)
\ No newline at end of file
+        super().__init__(message, error_code)
+
+
+class BusTimeout(ErrorHandler):
+    def __init__(self, message="Bus not granted in time", error_code=None):
+        super().__init__(message, error_code)
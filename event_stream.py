@@ -0,0 +1,117 @@
+import logging
+import threading
+from collections import defaultdict
+
+log = logging.getLogger(__name__)
+
+# General poll answers that are not exceptions
+IDLE_CODES = ("00", "1f")
+ANY = "*"
+
+
+class EventStream:
+    """General poll loop that dispatches exception codes to subscribers
+
+    Subsystems (TITO sync, handpays, progressives...) register the GPoll codes
+    they care about instead of running their own scheduled long polls:
+
+        events = EventStream(sas)
+        events.subscribe(["3d", "3e"], tito.on_event)
+        events.run()
+
+    Handlers are called from the polling thread with the exception code, so
+    they can issue their long polls right away on the same connection.
+    Periodic work that must share the connection (e.g. progressive broadcasts)
+    is registered with ``add_task`` and runs between two general polls.
+
+    Parameters
+    ----------
+    sas : igtsas.Sas
+        Started connection to the EGM
+    interval : float
+        Pause between two general polls when the EGM is idle
+    """
+
+    def __init__(self, sas, interval=0.2):
+        self.sas = sas
+        self.interval = interval
+        self.handlers = defaultdict(list)
+        self.tasks = []
+        self._stop = threading.Event()
+
+    def subscribe(self, codes, handler):
+        """Call ``handler(code)`` for every exception in ``codes``
+
+        Parameters
+        ----------
+        codes : str | list
+            GPoll code(s) as lower case hex strings (see ``models.GPoll``), or "*" for all of them
+        handler : callable
+        """
+        if isinstance(codes, str):
+            codes = [codes]
+
+        for code in codes:
+            self.handlers[code.lower()].append(handler)
+
+    def unsubscribe(self, codes, handler):
+        if isinstance(codes, str):
+            codes = [codes]
+
+        for code in codes:
+            if handler in self.handlers.get(code.lower(), []):
+                self.handlers[code.lower()].remove(handler)
+
+    def add_task(self, task):
+        """Call ``task()`` after every general poll; it must return quickly"""
+        self.tasks.append(task)
+
+    def run_tasks(self):
+        for task in self.tasks:
+            try:
+                task()
+            except Exception as e:
+                log.error(f"Task {task} failed: {e}", exc_info=True)
+
+    def dispatch(self, code):
+        """Hand ``code`` to its subscribers; a failing handler never stops the loop"""
+        for handler in self.handlers.get(code, []) + self.handlers.get(ANY, []):
+            try:
+                handler(code)
+            except Exception as e:
+                log.error(f"Handler {handler} failed on event {code}: {e}", exc_info=True)
+
+    def poll_once(self):
+        """Run one general poll and dispatch its exception
+
+        Returns
+        -------
+        Mixed
+            str - the exception code | None if the EGM did not answer or was idle
+        """
+        code = self.sas.general_poll()
+        if code is None or code in IDLE_CODES:
+            return None
+
+        metrics = getattr(self.sas, "metrics", None)
+        if metrics is not None:
+            metrics.event(self.sas.address, code)
+        self.dispatch(code)
+        return code
+
+    def run(self):
+        """Poll until ``stop`` is called; back to back while the EGM has exceptions queued"""
+        self._stop.clear()
+        while not self._stop.is_set():
+            try:
+                code = self.poll_once()
+            except Exception as e:
+                log.error(f"General poll failed: {e}", exc_info=True)
+                code = None
+
+            self.run_tasks()
+            if code is None:
+                self._stop.wait(self.interval)
+
+    def stop(self):
+        self._stop.set()
@@ -0,0 +1,194 @@
+"""Resilience benchmark: throughput and recovery of Sas under injected faults
+
+For every fault mode of ``SimulatedEgm`` (corrupted CRC, truncated frame,
+wrong command, silence, chirp, delayed bytes, exception buffer overflow)
+and every fault rate, a simulated EGM on a pty is polled for a while with a
+mix of general polls, 1A credits and 0F meters. Each run reports the good
+polls per second and the throughput lost against a fault-free run, the
+recovery after a failed poll (polls and milliseconds until the next good
+one), the errors the library saw (``metrics.SasMetrics`` counters) and the
+faults actually injected. The ``--recovery`` strategies compare doing
+nothing, ``flush_hard`` and ``reset_connection`` after a failed poll, whose
+own cost is measured too.
+
+    python fault_benchmark.py --modes corrupt_crc,delay --rates 0.01,0.1 --output faults.json
+"""
+import argparse
+import contextlib
+import json
+import logging
+import os
+import statistics
+import sys
+import time
+
+from igtsas import Sas
+from metrics import Registry, SasMetrics
+from simulated_egm import FAULTS, PtyEgmServer, PtySerial, SimulatedEgm
+from utils.PhaseTracer import Histogram
+
+RECOVERIES = {
+    "none": None,
+    "flush": lambda sas: sas.flush_hard(),
+    "reset": lambda sas: sas.reset_connection(),
+}
+
+WORKLOAD = (
+    ("general_poll", lambda sas: sas.general_poll()),
+    ("current_credits", lambda sas: sas.current_credits()),
+    ("send_meters_10_15", lambda sas: sas.send_meters_10_15()),
+)
+
+
+@contextlib.contextmanager
+def _served(egm, timeout):
+    server = PtyEgmServer()
+    port = server.add(egm)
+    server.start()
+    registry = Registry()
+    sas = Sas(port, connection=PtySerial(port, timeout=timeout), timeout=timeout, address=egm.address,
+              debug_level="CRITICAL", metrics=registry)
+    # Every failed poll is logged as CRITICAL with its traceback: expected here, the counters tell
+    sas.log.setLevel(logging.CRITICAL + 1)
+    try:
+        yield sas, registry
+    finally:
+        sas.connection.close()
+        server.stop()
+
+
+def _counters(registry):
+    metrics = SasMetrics(registry)
+    return {
+        "timeouts": sum(value for _, value in metrics.timeouts.samples()),
+        "bad_crc": sum(value for _, value in metrics.crc_failures.samples()),
+        "bad_command": sum(value for _, value in metrics.bad_commands.samples()),
+        "other_errors": sum(value for _, value in metrics.errors.samples()),
+    }
+
+
+def run(mode, rate, recovery, duration, timeout, delay, seed):
+    """Poll an EGM injecting ``mode`` faults at ``rate`` for ``duration`` seconds"""
+    egm = SimulatedEgm(address=1, seed=seed, faults={mode: rate} if mode else None, fault_delay=delay)
+    for _ in range(50):
+        egm.tick()
+    recover = RECOVERIES[recovery]
+
+    polls = good = 0
+    recovery_polls, recovery_ms = [], Histogram()
+    failed_at, failed_polls = None, 0
+    with _served(egm, timeout) as (sas, registry):
+        started = time.monotonic()
+        while time.monotonic() - started < duration:
+            _, poll = WORKLOAD[polls % len(WORKLOAD)]
+            polls += 1
+            sent = time.monotonic()
+            # The general poll answers 00 when idle, so any answer counts as good
+            ok = poll(sas) is not None
+            if ok:
+                good += 1
+                if failed_at is not None:
+                    recovery_polls.append(failed_polls)
+                    recovery_ms.record((time.monotonic() - failed_at) * 1e6)
+                    failed_at = None
+                continue
+
+            if failed_at is None:
+                # Recovery time runs from the start of the first failed poll (its timeout included)
+                failed_at, failed_polls = sent, 0
+            failed_polls += 1
+            if recover is not None:
+                recover(sas)
+        elapsed = time.monotonic() - started
+        errors = _counters(registry)
+
+    latency = recovery_ms.summary()
+    return {
+        "mode": mode or "none",
+        "rate": rate,
+        "recovery": recovery,
+        "seconds": round(elapsed, 2),
+        "polls": polls,
+        "good_polls": good,
+        "good_per_sec": round(good / elapsed, 1),
+        "success_ratio": round(good / polls, 4) if polls else None,
+        "recoveries": len(recovery_polls),
+        "recovery_polls_mean": round(statistics.mean(recovery_polls), 2) if recovery_polls else None,
+        "recovery_ms": {key: round(value / 1000, 1) if value is not None and key != "count" else value
+                        for key, value in latency.items()},
+        "errors": errors,
+        "injected": {key: value for key, value in egm.injected.items() if value},
+    }
+
+
+def reset_cost(timeout, repeat=5):
+    """Milliseconds taken by ``flush_hard`` and ``reset_connection`` (send_break + flushes)
+
+    ``PtySerial.send_break`` takes the duration of the break like a UART,
+    so the reset figure includes the 500 ms break of ``reset_connection``.
+    """
+    costs = {}
+    with _served(SimulatedEgm(address=1), timeout) as (sas, _):
+        for name, recover in (("flush", RECOVERIES["flush"]), ("reset", RECOVERIES["reset"])):
+            samples, result = [], None
+            for _ in range(repeat):
+                started = time.monotonic()
+                result = recover(sas)
+                samples.append(time.monotonic() - started)
+            costs[name] = {"median_ms": round(statistics.median(samples) * 1000, 2), "result": str(result)}
+    return costs
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Sas throughput and recovery under injected faults")
+    parser.add_argument("--modes", default=",".join(FAULTS), help=f"comma separated, among {', '.join(FAULTS)}")
+    parser.add_argument("--rates", default="0.01,0.05,0.2", help="fault probability per answer")
+    parser.add_argument("--recovery", default="none,reset", help=f"among {', '.join(RECOVERIES)}")
+    parser.add_argument("--duration", type=float, default=5, help="seconds per run")
+    parser.add_argument("--timeout", type=float, default=0.2, help="read timeout of the host")
+    parser.add_argument("--delay", type=float, help="seconds of the delay fault, default 1.5 x timeout")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="write the results as JSON")
+    args = parser.parse_args(argv)
+
+    modes = [mode for mode in args.modes.split(",") if mode]
+    rates = [float(rate) for rate in args.rates.split(",")]
+    recoveries = args.recovery.split(",")
+    delay = args.delay if args.delay is not None else args.timeout * 1.5
+
+    results = {"reset_cost": None, "runs": []}
+    # The library prints every frame; keep the terminal for the report
+    with open(os.devnull, "w") as devnull:
+        with contextlib.redirect_stdout(devnull):
+            results["reset_cost"] = reset_cost(args.timeout)
+        cost = results["reset_cost"]
+        print(f"flush_hard {cost['flush']['median_ms']} ms, "
+              f"reset_connection {cost['reset']['median_ms']} ms ({cost['reset']['result']})")
+
+        for recovery in recoveries:
+            with contextlib.redirect_stdout(devnull):
+                baseline = run(None, 0.0, recovery, args.duration, args.timeout, delay, args.seed)
+            results["runs"].append(baseline)
+            print(f"{'no faults':14s}        {recovery:6s} {baseline['good_per_sec']:8.1f} good/s")
+
+            for mode in modes:
+                for rate in rates:
+                    with contextlib.redirect_stdout(devnull):
+                        result = run(mode, rate, recovery, args.duration, args.timeout, delay, args.seed)
+                    result["throughput_loss"] = round(1 - result["good_per_sec"] / baseline["good_per_sec"], 3)
+                    results["runs"].append(result)
+                    print(
+                        f"{mode:14s} {rate:5.2f} {recovery:6s} {result['good_per_sec']:8.1f} good/s "
+                        f"loss {result['throughput_loss']:6.1%}  success {result['success_ratio']:.1%}  "
+                        f"recovery {result['recovery_polls_mean']} polls / p50 {result['recovery_ms']['p50']} ms  "
+                        f"errors {result['errors']}"
+                    )
+
+    if args.output:
+        with open(args.output, "w") as output_file:
+            json.dump({"arguments": vars(args), **results}, output_file, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,238 @@
+import logging
+import shlex
+import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass
+
+log = logging.getLogger(__name__)
+
+REMOTE_REPO = "/home/hercules/TWLVGaming/sasprotocol"
+REMOTE_VENV = "/home/hercules/TWLVGaming/freshtest"
+
+# Fleet actions and the sas_cli.py arguments they run on each Pi
+ACTIONS = {
+    "meter_snapshot": "meters",
+    "startup": "startup",
+    "shutdown": "shutdown",
+    "enable_bill_acceptor": "enable_bill_acceptor",
+    "disable_bill_acceptor": "disable_bill_acceptor",
+    "enable_game": "enable_game",
+    "disable_game": "disable_game",
+}
+
+# Fleet actions that need a game number
+GAME_ACTIONS = {"enable_game", "disable_game"}
+
+
+@dataclass(slots=True)
+class FleetResult:
+    """Outcome of one action on one machine"""
+
+    machine_id: int
+    host: str
+    action: str
+    exit_status: int
+    stdout: str
+    stderr: str
+    elapsed: float  # seconds, including the SSH connection when it had to be opened
+
+    @property
+    def ok(self):
+        return self.exit_status == 0
+
+
+class StaticInventory:
+    """Inventory from a list of rows (dicts with machine_id, ip_address, username, ...)"""
+
+    def __init__(self, rows):
+        self.rows = [dict(row) for row in rows]
+
+    def select(self, selector=None):
+        return select_rows(self.rows, selector)
+
+
+def select_rows(rows, selector=None):
+    """Filter inventory rows
+
+    Parameters
+    ----------
+    selector :
+        None = every machine | iterable of machine ids | dict {column: value or list of values} |
+        callable(row) -> bool
+    """
+    if selector is None:
+        return list(rows)
+    if callable(selector):
+        return [row for row in rows if selector(row)]
+    if isinstance(selector, dict):
+        def match(row):
+            for column, wanted in selector.items():
+                values = wanted if isinstance(wanted, (list, tuple, set)) else [wanted]
+                if row.get(column) not in values:
+                    return False
+            return True
+
+        return [row for row in rows if match(row)]
+
+    wanted = set(selector)
+    return [row for row in rows if row["machine_id"] in wanted]
+
+
+class SubprocessTransport:
+    """Run the commands locally (tests, or a gateway driving its own ports)"""
+
+    def run(self, row, command, timeout=None):
+        completed = subprocess.run(
+            ["/bin/sh", "-c", command], capture_output=True, text=True, timeout=timeout
+        )
+        return completed.returncode, completed.stdout, completed.stderr
+
+    def close(self):
+        pass
+
+
+class SSHTransport:
+    """Run the commands over SSH, keeping one session open per host
+
+    Sessions are opened on first use and reused by the following actions,
+    so only the first action on a Pi pays for the TCP and SSH handshakes.
+
+    Parameters
+    ----------
+    key_file_path : str
+        Private RSA key
+    passphrase : str, optional
+    port : int
+    connect_timeout : float
+    """
+
+    def __init__(self, key_file_path, passphrase=None, port=22, connect_timeout=10):
+        import paramiko
+
+        self._paramiko = paramiko
+        self.key = paramiko.RSAKey.from_private_key_file(key_file_path, password=passphrase)
+        self.port = port
+        self.connect_timeout = connect_timeout
+        self._clients = {}
+        self._locks = {}
+        self._lock = threading.Lock()
+
+    def _client(self, row):
+        host = row["ip_address"]
+        with self._lock:
+            host_lock = self._locks.setdefault(host, threading.Lock())
+
+        with host_lock:
+            client = self._clients.get(host)
+            transport = client.get_transport() if client else None
+            if transport is None or not transport.is_active():
+                client = self._paramiko.SSHClient()
+                client.set_missing_host_key_policy(self._paramiko.AutoAddPolicy())
+                client.connect(
+                    host,
+                    self.port,
+                    username=row["username"],
+                    pkey=self.key,
+                    timeout=self.connect_timeout,
+                )
+                self._clients[host] = client
+
+            return client
+
+    def run(self, row, command, timeout=None):
+        client = self._client(row)
+        stdin, stdout, stderr = client.exec_command(command, timeout=timeout)
+        # Drain the output before waiting for the exit status: a command filling
+        # the channel window would otherwise block and never exit
+        out, err = stdout.read().decode(), stderr.read().decode()
+        return stdout.channel.recv_exit_status(), out, err
+
+    def close(self):
+        with self._lock:
+            for client in self._clients.values():
+                client.close()
+            self._clients.clear()
+
+
+class FleetExecutor:
+    """Run an action on many machines concurrently
+
+    Hosts are resolved from ``inventory`` (anything with a ``select(selector)``
+    returning rows with machine_id / ip_address / username), then the action
+    runs on a bounded thread pool. Results are yielded as they complete.
+
+        executor = FleetExecutor(inventory, SSHTransport("~/.ssh/id_rsa"))
+        for result in executor.run({"location_id": 10}, "meter_snapshot"):
+            print(result.machine_id, result.ok, result.elapsed)
+
+    Parameters
+    ----------
+    inventory :
+        Machine inventory
+    transport : SSHTransport | SubprocessTransport
+    max_workers : int
+        Maximum number of machines handled at the same time
+    timeout : float
+        Per machine command timeout in seconds
+    repo_path, venv_path : str
+        Location of this repository and of its virtualenv on the machines
+    """
+
+    def __init__(self, inventory, transport, max_workers=16, timeout=60,
+                 repo_path=REMOTE_REPO, venv_path=REMOTE_VENV):
+        self.inventory = inventory
+        self.transport = transport
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self.repo_path = repo_path
+        self.venv_path = venv_path
+
+    def command(self, action, game=None):
+        """Shell command running ``action`` on a machine"""
+        if action not in ACTIONS:
+            raise ValueError(f"Unknown fleet action {action}, expected one of {sorted(ACTIONS)}")
+        if action in GAME_ACTIONS and game is None:
+            raise ValueError(f"Fleet action {action} needs a game number")
+
+        command = f"python {shlex.quote(self.repo_path + '/sas_cli.py')} {ACTIONS[action]}"
+        if game is not None:
+            command += f" --game {int(game)}"
+        if self.venv_path:
+            command = f". {shlex.quote(self.venv_path + '/bin/activate')} && {command}"
+        return command
+
+    def _run_one(self, row, action, command):
+        started = time.monotonic()
+        try:
+            exit_status, stdout, stderr = self.transport.run(row, command, timeout=self.timeout)
+        except Exception as e:
+            exit_status, stdout, stderr = -1, "", str(e)
+
+        return FleetResult(
+            machine_id=row["machine_id"],
+            host=row.get("ip_address", ""),
+            action=action,
+            exit_status=exit_status,
+            stdout=stdout,
+            stderr=stderr,
+            elapsed=time.monotonic() - started,
+        )
+
+    def run(self, selector, action, game=None):
+        """Yield a ``FleetResult`` per selected machine, in completion order"""
+        rows = self.inventory.select(selector)
+        command = self.command(action, game)
+        log.info(f"Fleet {action} on {len(rows)} machine(s)")
+
+        with ThreadPoolExecutor(max_workers=max(1, min(self.max_workers, len(rows)))) as pool:
+            futures = [pool.submit(self._run_one, row, action, command) for row in rows]
+            for future in as_completed(futures):
+                result = future.result()
+                if not result.ok:
+                    log.error(f"{action} failed on machine {result.machine_id}: {result.stderr.strip()}")
+                yield result
+
+    def close(self):
+        self.transport.close()
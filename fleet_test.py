@@ -0,0 +1,62 @@
+import json
+import os
+import shlex
+import sys
+
+import pytest
+
+from fleet import FleetExecutor, StaticInventory, SubprocessTransport
+
+REPO = os.path.dirname(os.path.abspath(__file__))
+
+ROWS = [
+    {"machine_id": 1, "ip_address": "10.0.0.1", "username": "pi", "location_id": 10},
+    {"machine_id": 2, "ip_address": "10.0.0.2", "username": "pi", "location_id": 10},
+    {"machine_id": 3, "ip_address": "10.0.0.3", "username": "pi", "location_id": 20},
+]
+
+
+def _fake_repo(tmp_path, script):
+    """Repository whose sas_cli.py is ``script``, run with the python on PATH like on the Pis"""
+    (tmp_path / "sas_cli.py").write_text(script)
+    return str(tmp_path)
+
+
+def test_run_on_selected_machines(tmp_path):
+    repo = _fake_repo(tmp_path, "import json, sys\nprint(json.dumps(sys.argv[1:]))\n")
+    executor = FleetExecutor(StaticInventory(ROWS), SubprocessTransport(), repo_path=repo, venv_path="")
+
+    results = sorted(executor.run({"location_id": 10}, "enable_game", game=3), key=lambda r: r.machine_id)
+
+    assert [r.machine_id for r in results] == [1, 2]
+    assert all(r.ok and r.host.startswith("10.0.0.") for r in results)
+    assert json.loads(results[0].stdout) == ["enable_game", "--game", "3"]
+
+
+def test_failure_reported_per_machine(tmp_path):
+    repo = _fake_repo(tmp_path, "import sys\nsys.stderr.write('no port')\nsys.exit(1)\n")
+    executor = FleetExecutor(StaticInventory(ROWS), SubprocessTransport(), repo_path=repo, venv_path="")
+
+    results = list(executor.run([3], "meter_snapshot"))
+
+    assert len(results) == 1
+    assert not results[0].ok
+    assert results[0].stderr == "no port"
+
+
+def test_game_actions_need_a_game():
+    executor = FleetExecutor(StaticInventory(ROWS), SubprocessTransport())
+
+    with pytest.raises(ValueError):
+        executor.command("disable_game")
+    assert executor.command("disable_game", 2).endswith("sas_cli.py disable_game --game 2")
+
+
+@pytest.mark.parametrize("action", ["enable_game", "disable_game"])
+def test_sas_cli_requires_game(action):
+    command = f"{shlex.quote(sys.executable)} {shlex.quote(os.path.join(REPO, 'sas_cli.py'))} {action}"
+
+    exit_status, stdout, stderr = SubprocessTransport().run(ROWS[0], command, timeout=30)
+
+    assert exit_status == 2
+    assert "--game is required" in stderr
@@ -0,0 +1,68 @@
+import dataclasses
+import logging
+import queue
+import time
+from collections import deque
+
+from utils.LatencyRecorder import LatencyRecorder
+
+log = logging.getLogger(__name__)
+
+# GPoll exceptions of the handpay lifecycle
+HANDPAY_PENDING = "51"
+HANDPAY_RESET = "52"
+HANDPAY_CANCELLED = "55"
+
+
+class HandpayMonitor:
+    """Track handpays from the general poll exceptions
+
+    A 51 exception immediately triggers the handpay information long poll
+    (1B); the decoded ``HandpayRecord`` is put on ``queue`` with status
+    "pending". A later 52 (reset by the attendant) or 55 (cancelled by the
+    player) closes the oldest pending handpay, which goes on ``queue`` again
+    with its reset time and pending to reset duration. No long poll is sent
+    unless the EGM reports a handpay.
+
+    Parameters
+    ----------
+    sas : igtsas.Sas
+        Started connection to the EGM
+    """
+
+    def __init__(self, sas):
+        self.sas = sas
+        self.queue = queue.Queue()
+        self.pending = deque()
+        self.durations = LatencyRecorder()
+
+    def attach(self, events):
+        """Subscribe to the handpay exceptions on an ``EventStream``"""
+        events.subscribe(HANDPAY_PENDING, self.on_pending)
+        events.subscribe([HANDPAY_RESET, HANDPAY_CANCELLED], self.on_reset)
+
+    def on_pending(self, code=HANDPAY_PENDING):
+        record = self.sas.handpay_record()
+        if record is None:
+            log.error("Handpay pending but 1B returned nothing")
+            return None
+
+        self.pending.append(record)
+        # Queue a copy: the pending record is updated in place on reset
+        self.queue.put(dataclasses.replace(record))
+        log.info(f"Handpay pending: {record.amount} cents, level {record.level:02x}")
+        return record
+
+    def on_reset(self, code=HANDPAY_RESET):
+        if not self.pending:
+            log.warning(f"Handpay reset ({code}) without a pending handpay")
+            return None
+
+        record = self.pending.popleft()
+        record.status = "cancelled" if code == HANDPAY_CANCELLED else "reset"
+        record.reset_at = time.time()
+        record.duration = record.reset_at - record.pending_at
+        self.durations.record(record.duration)
+        self.queue.put(record)
+        log.info(f"Handpay {record.status} after {record.duration:.1f}s")
+        return record
@@ -1,11 +1,21 @@
 import serial
 import time
+import contextlib
+import functools
 import binascii
 import logging
 import datetime
 
 from utils import Crc
-from utils.Decorators import deprecated
+from utils.BusLock import BusLock
+from utils.Decorators import deprecated, coalesced
+from utils.SingleFlight import SingleFlight
+from utils.TimeoutEstimator import TimeoutEstimator
+from utils.PhaseTracer import PhaseTracer
+from utils.LinkMonitor import LinkMonitor
+from utils.ModelProfiles import ModelProfiles
+from metrics import SasMetrics
+from wire_capture import CaptureConnection, CaptureWriter
 from multiprocessing import log_to_stderr
 
 from models import *
@@ -13,6 +23,20 @@ from error_handler import *
 
 __author__ = "Jake Watts"
 
+# Seconds between two automatic identify attempts while the EGM does not answer
+IDENTIFY_RETRY = 60
+
+
+def _bus_transaction(method):
+    """Run ``method`` while holding the bus (see ``Sas._transaction``)"""
+
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self._transaction():
+            return method(self, *args, **kwargs)
+
+    return wrapper
+
 
 class Sas:
     """Main SAS Library Class"""
@@ -30,12 +54,33 @@ class Sas:
             debug_level="DEBUG",  # Debug Level
             perpetual=False,  # When this is true the lib will try forever to connect to the serial
             check_last_transaction = True,
-            wait_for_wake_up = 0.00
+            wait_for_wake_up = 0.00,
+            connection=None,  # Already open serial connection, shared by the handles of a SasBus
+            address=None,  # EGM address; when known there is no need to call start()
+            thread_safe=False,  # Serialize the transactions of threads sharing this handle
+            lock_timeout=None,  # Seconds a transaction waits for the bus in thread safe mode, None = forever
+            adaptive_timeouts=False,  # Learn the read timeout of each command from its observed latency
+            trace=False,  # Time every phase of the long polls, see utils.PhaseTracer
+            metrics=None,  # metrics.Registry receiving the poll counters and latencies
+            capture=None,  # File path (or wire_capture.CaptureWriter) recording every byte on the wire
+            monitor_link=False,  # Track the link health, fail fast and reconnect in the background when down
+            profiles=None  # utils.ModelProfiles (or its JSON path) of calibrated settings, applied by identify() on first use
     ):
         # Let's address some internal var
+        self.port = port
         self.poll_timeout = timeout
-        self.address = None
-        self.machine_n = None
+        self.address = address
+        self.machine_n = f"{address:02x}" if address is not None else None
+        self.scheduler = BusLock() if thread_safe else None  # Shared by the handles of a SasBus
+        self.lock_timeout = lock_timeout
+        self.single_flight = SingleFlight()  # Identical concurrent long polls share one transaction
+        self.coalesce_windows = {}  # Per poll coalescing window in seconds, by method name
+        self.deadlines = TimeoutEstimator(ceiling=timeout) if adaptive_timeouts else None
+        self.tracer = PhaseTracer() if trace else None
+        self.metrics = SasMetrics(metrics) if metrics is not None else None
+        if self.metrics is not None and self.scheduler is not None:
+            self.metrics.watch_bus(self.scheduler, port)
+        self._marks = None
         self.check_last_transaction = check_last_transaction
         self.denom = denom
         self.asset_number = asset_number
@@ -46,30 +91,54 @@ class Sas:
         self.poll_address= poll_address
         self.perpetual = perpetual
         self.wait_for_wake_up = wait_for_wake_up
+        self.profiles = ModelProfiles(profiles) if isinstance(profiles, str) else profiles
+        self.model = None  # See machine_model, set by identify() when profiles are set
+        self.profile = None
+        self._identify_at = 0.0 if profiles is not None else None  # Next automatic identify, None = not needed
 
         # Init the Logging system
         self.log = log_to_stderr()
         self.log.setLevel(logging.getLevelName(debug_level))
         self.last_gpoll_event = None
+        # With perpetual the port is retried in the background instead of blocking here
+        self.link = LinkMonitor(self._reconnect, name=str(port)) if monitor_link or perpetual else None
+        self._owns_connection = connection is None
+
+        if connection is not None:
+            self.connection = connection
+            self.timeout = timeout
+            self._capture(capture)
+            return
 
         # Open the serial connection
-        while 1:
-            try:
-                self.connection = serial.Serial(
-                    port=port,
-                    baudrate=19200,
-                    timeout=timeout,
-                )
-                # self.close() # Not Sure if this is needed or not
-                self.timeout = timeout
-                self.log.info("Connection Successful")
-                break
-            except Exception as e:
-                self.log.critical(f"Error while connecting to the machine: {e}")
-                if not self.perpetual:
-                    self.log.critical("Quitting due to connection failure...")
-                    exit(1)
-                time.sleep(1)
+        self.timeout = timeout
+        try:
+            self.connection = serial.Serial(
+                port=port,
+                baudrate=19200,
+                timeout=timeout,
+            )
+            self.log.info("Connection Successful")
+        except Exception as e:
+            self.log.critical(f"Error while connecting to the machine: {e}")
+            if not self.perpetual:
+                raise SASOpenError(f"Unable to open {port}: {e}") from e
+
+            # Polls fail fast until the link monitor manages to open the port
+            self.connection = serial.Serial(baudrate=19200, timeout=timeout)
+            self.connection.port = port
+            self.link.mark_down(f"unable to open {port}")
+
+        self._capture(capture)
+
+    def _capture(self, capture):
+        """Record the session on the wire, see ``wire_capture``"""
+        if capture is None:
+            return
+
+        if isinstance(capture, str):
+            capture = CaptureWriter(capture)
+        self.connection = CaptureConnection(self.connection, capture)
     
     def is_open(self):
         return self.connection.is_open
@@ -111,7 +180,8 @@ class Sas:
             backoff_factor (int): Factor by which the wait time increases after each retry.
     
         Returns:
-            machine_n (str): The hexadecimal address of the EGM once the connection is successfully established and recognized.
+            machine_n (str): The hexadecimal address of the EGM once the connection is successfully established and recognized,
+            None if the EGM is unreachable (the link, when monitored, is then marked down and retried in the background).
         """
         self.log.info("Connecting to the Machine...")
         retry_count = 0
@@ -139,6 +209,8 @@ class Sas:
                     self.address = int(binascii.hexlify(response), 16)
                     self.machine_n = response.hex()
                     self.log.info("Address Recognized: " + str(self.address))
+                    if self.model is None:
+                        self.identify()
                     self.close()
                     return self.machine_n
                 else:
@@ -147,8 +219,70 @@ class Sas:
                     retry_count += 1
     
         self.log.error("Maximum retries reached. Unable to establish a connection.")
-        return "Error: Device unreachable"
+        if self.link is not None:
+            self.link.mark_down("no answer to start")
+        return None
     
+    def discover_address(self, candidates=range(0x01, 0x80), timeout=0.04):
+        """Find the EGM address by general polling the candidates
+
+        Active alternative to ``start`` for EGMs that do not chirp their
+        address: each candidate gets one general poll with a short ``timeout``
+        and the scan stops at the first one that answers.
+
+        Parameters
+        ----------
+        candidates : iterable
+            Addresses to try, in order (put the last known address first)
+        timeout : float
+            Read timeout per address; SAS EGMs answer within 20 ms
+
+        Returns
+        -------
+        Mixed
+            str - hexadecimal address (as ``start``) | None if nothing answered
+        """
+        previous = self.address
+        link, self.link = self.link, None  # Silent candidates are not link failures
+        identify_at, self._identify_at = self._identify_at, None  # Nor models to identify
+        # 0x82 (the default) is also the general poll of address 02, which would answer for every candidate
+        poll_address, self.poll_address = self.poll_address, 0x80
+        try:
+            for address in candidates:
+                self.address = address
+                try:
+                    if self.general_poll(timeout=timeout) is not None:
+                        self.machine_n = f"{address:02x}"
+                        self.log.info("Address Discovered: " + str(address))
+                        return self.machine_n
+                except Exception as e:
+                    self.log.debug(f"Address {address:02x}: {e}")
+        finally:
+            self.link = link
+            self.poll_address = poll_address
+            self._identify_at = identify_at
+
+        self.address = previous
+        return None
+
+    def _reconnect(self):
+        """Reopen the port when needed and check the EGM answers (called by the link monitor)"""
+        try:
+            if self._owns_connection and self.link.last_failure == "error" and self.is_open():
+                # I/O errors usually mean the device went away: reopen it for real
+                self.close()
+            self.open()
+            self.flush_hard()
+        except SASOpenError:
+            return False
+
+        if self.address is None:
+            return self.is_open()
+        answered = self.general_poll(timeout=min(self.poll_timeout, 0.5)) is not None
+        if answered and self.model is None:
+            self.identify(timeout=min(self.poll_timeout, 0.5))
+        return answered
+
     def close(self):
         """Close the connection to the serial Port"""
         self.connection.close()
@@ -229,7 +363,7 @@ class Sas:
     #     return None
 
     def _send_command(
-            self,command, no_response=False, timeout=None, crc_need=True, size=1
+            self,command, no_response=False, timeout=None, crc_need=True, size=1, var_length=False
     ):
         """Main Fucntion to send commands to the EGM
         
@@ -242,22 +376,134 @@ class Sas:
     Parameters:
         command (list): The command bytes to be sent to the EGM.
         no_response (bool): If True, does not attempt to read a response after sending the command.
-        timeout (int, optional): The timeout in seconds for waiting for a response. If None, uses the default timeout.
+        timeout (int, optional): The timeout in seconds for waiting for a response. If None, uses the deadline
+            learned for this command when ``adaptive_timeouts`` is on, otherwise the default timeout.
         crc_need (bool): If True, calculates and appends a CRC to the command before sending.
         size (int): The number of bytes to read from the response. Default is 1.
+        var_length (bool): If True, ignores size and reads a variable length response using its length byte
+            (address, command, length, data, CRC) instead of waiting for the timeout to end the read.
 
     Returns:
         If no_response is False and a response is received, returns the response bytes.
-        If no_response is True, attempts to return an integer representation of the response.
+        If no_response is True, attempts to return the integer value of the response (the ACK address byte).
         Returns None if no response is required or an error occurs during command transmission or response reading.
 
     Raises:
         BadCommandIsRunning: If the response received does not match the command sent."""
+        if self.link is not None and self.link.blocked():
+            self.log.debug(f"Link {self.link.state}, {command[0]:02x} not sent")
+            return None
+
+        self._identify_on_first_use()
+        with self._transaction():
+            if self.tracer is None:
+                return self._transmit(command, no_response, timeout, crc_need, size, var_length)
+
+            marks = self._marks = self.tracer.begin()
+            try:
+                return self._transmit(command, no_response, timeout, crc_need, size, var_length)
+            finally:
+                self._marks = None
+                self.tracer.record(command[0], marks)
+
+    def identify(self, timeout=0.2):
+        """Identify the EGM model and switch to its calibrated settings, see ``calibration``
 
+        Called by ``start`` once the EGM answered, by the link monitor when
+        the link comes back up and, for handles created with their
+        ``address`` (i.e. by ``SasBus``), before their first poll. The bus is
+        held for the whole identification and the probes use the short
+        ``timeout``, so an EGM that is down costs a few short reads once
+        instead of delaying the polls of other threads.
 
+        Parameters
+        ----------
+        timeout : float
+            Read timeout of the 1F / 54 probes
+
+        Returns
+        -------
+        Mixed
+            dict - the model, see ``machine_model`` | None without profiles or when the EGM did not answer
+        """
+        if self.profiles is None or self.address is None:
+            return None
+
+        with self._transaction():
+            initial = self.poll_address, self.wait_for_wake_up
+            # A machine may need its calibrated settings to answer at all: try the known ones in turn
+            model = None
+            for self.poll_address, self.wait_for_wake_up in [initial] + self.profiles.settings():
+                model = self.machine_model(timeout=timeout)
+                if model is not None:
+                    break
+            if model is None:
+                self.poll_address, self.wait_for_wake_up = initial
+                return None
+
+        self.model = model
+        self._identify_at = None
+        profile = self.profiles.get(model["key"])
+        if profile is None:
+            self.log.info(f"No calibrated profile for model {model['key']}")
+            return model
+
+        self.profile = profile
+        self.poll_address = profile["poll_address"]
+        self.wait_for_wake_up = profile["wait_for_wake_up"]
+        self.log.info(
+            f"Model {model['key']}: poll address {self.poll_address:02x}, wake up {self.wait_for_wake_up}s"
+        )
+        return model
+
+    def _identify_on_first_use(self):
+        """Identify a handle with profiles before its first poll
+
+        While the EGM does not answer the attempt is repeated every
+        ``IDENTIFY_RETRY`` seconds, not on every poll.
+        """
+        if self._identify_at is None or self.model is not None or self.profiles is None or self.address is None:
+            return
+        if time.monotonic() < self._identify_at:
+            return
+
+        self._identify_at = None  # The probes of identify() are polls too
+        model = None
+        try:
+            model = self.identify(timeout=min(self.poll_timeout, 0.5))
+        finally:
+            if model is None:
+                self._identify_at = time.monotonic() + IDENTIFY_RETRY
+
+    def _transaction(self):
+        """Hold the bus for one complete write/read exchange
+
+        A no-op on a dedicated port used by a single thread. In thread safe
+        mode, or on a multi-drop bus, the ``BusLock`` serializes the callers
+        (reentrant, so composite commands keep the bus between their polls)
+        and rotates fairly between the EGM addresses.
+
+        Raises
+        ------
+        BusTimeout
+            The bus was not granted within ``lock_timeout``
+        """
+        if self.scheduler is None:
+            return contextlib.nullcontext()
+
+        return self.scheduler.slot(self.address, timeout=self.lock_timeout)
+
+    def _transmit(
+            self, command, no_response=False, timeout=None, crc_need=True, size=1, var_length=False
+    ):
+        """Write one long poll and read its response, see ``_send_command``"""
+        marks = self._marks  # Phase timestamps, only when a tracer is set (see utils.PhaseTracer)
+        began = time.monotonic()
         try:
             buf_header = [self.address]
             self._conf_port()
+            if marks is not None:
+                marks[1] = time.perf_counter()
 
             self.log.info(f"Configured port. Initial buffer header with address: {buf_header}")
 
@@ -268,6 +514,8 @@ class Sas:
                 crc = Crc.calculate(bytes(buf_header))
                 buf_header.extend(crc)
                 self.log.info(f"Extended buffer header with CRC: {crc} resulting in {buf_header}")
+            if marks is not None:
+                marks[2] = time.perf_counter()
             
             # self.log.info(f"Writing to connection: poll address {self.poll_address}, Device address {self.address}")
             # self.connection.write(bytes([self.poll_address, self.address]))  # Ensure it's in bytes
@@ -291,17 +539,50 @@ class Sas:
             
             self.connection.parity = serial.PARITY_SPACE
             self.log.info(f"Set connection parity to SPACE. Sleeping for {self.wait_for_wake_up} seconds.")
+            if marks is not None:
+                marks[3] = time.perf_counter()
             time.sleep(self.wait_for_wake_up)
+            if marks is not None:
+                marks[4] = time.perf_counter()
 
             self.log.info(f"Writing header to connection: {buf_header[1:]}")
             self.connection.write((buf_header[1:]))
+            if marks is not None:
+                marks[5] = time.perf_counter()
             self.log.info("Header written to connection")
 
         except Exception as e:
             self.log.error(e, exc_info=True)
 
+        response = b""
+        error = None
         try:
-            response = self.connection.read(size)
+            default_timeout = self.connection.timeout
+            if timeout is None and self.deadlines is not None:
+                timeout = self.deadlines.deadline(self.address, command[0], default_timeout)
+            if timeout is not None and timeout != default_timeout:
+                self.connection.timeout = timeout
+            started = time.monotonic()
+            try:
+                if var_length:
+                    expected = 3
+                    response = self.connection.read(3)
+                    if len(response) == 3:
+                        expected += response[2] + 2
+                        response += self.connection.read(response[2] + 2)
+                else:
+                    expected = size
+                    response = self.connection.read(size)
+            finally:
+                # Setting the timeout of a pyserial port costs a tcsetattr, only restore it when changed
+                if timeout is not None and timeout != default_timeout:
+                    self.connection.timeout = default_timeout
+            if marks is not None:
+                marks[6] = time.perf_counter()
+            if self.deadlines is not None:
+                self.deadlines.observe(
+                    self.address, command[0], time.monotonic() - started, len(response), expected
+                )
             print(response)
 
             #check if the response is empty
@@ -309,7 +590,8 @@ class Sas:
                 self.log.critical("Received Empty Response")
             if no_response:
                 try:
-                    return int(binascii.hexlify(response))
+                    # The ACK is the address byte: its value, not its hex digits read as decimal
+                    return int(binascii.hexlify(response), 16)
                 except ValueError as e:
                     self.log.critical("No Sas Response %s" % (str(buf_header[1:])))
                     return None
@@ -319,14 +601,35 @@ class Sas:
             print(response)
 
             response = Crc.validate(response)
+            if marks is not None:
+                marks[7] = time.perf_counter()
 
             self.log.debug("sas response %s", binascii.hexlify(response))
 
             return response
         
         except Exception as e:
+            error = e
             self.log.critical(e,exc_info=True)
+        finally:
+            if self.metrics is not None:
+                self.metrics.poll(self.address, command[0], time.monotonic() - began, error, not response)
+            if self.link is not None:
+                self.link.record(self._link_failure(error, response))
         return None
+
+    def _link_failure(self, error, response):
+        """Classify the outcome of a long poll for the link monitor (None = good answer)"""
+        if error is None and response:
+            return None
+        if not response:
+            return "timeout"
+        if isinstance(error, BadCRC):
+            return "crc"
+        if isinstance(error, BadCommandIsRunning):
+            # A chirped address byte shifts the answer: address, address, command...
+            return "chirp" if bytes(response[:2]) == bytes([self.address, self.address]) else "bad_command"
+        return "error"
     
 
 
@@ -345,8 +648,31 @@ class Sas:
         else:
             return rsp[1:-2]
     
+    @staticmethod
+    def _bcd_coder_array(value=0, length=4):
+        """Encode an integer as a list of BCD bytes, MSB first
+
+        Parameters
+        ----------
+        value : int | str
+            Decimal value to encode
+        length : int
+            Number of bytes of the resulting array
+
+        Returns
+        -------
+        list
+            ``length`` ints, each holding two BCD digits
+        """
+        digits = str(int(value)).rjust(length * 2, "0")
+        if len(digits) > length * 2:
+            raise ValueError(f"{value} does not fit in {length} BCD bytes")
+
+        return [int(digits[i: i + 2], 16) for i in range(0, length * 2, 2)]
+
     import logging
 
+    @_bus_transaction
     def events_poll(self):
         """Events Poll function
 
@@ -354,6 +680,7 @@ class Sas:
         --------
         WiKi : https://github.com/zacharytomlinson/saspy/wiki/4.-Important-To-Know#event-reporting
         """
+        self._identify_on_first_use()
         logging.debug("Configuring event port.")
         self._conf_event_port()
 
@@ -386,6 +713,52 @@ class Sas:
 
         return event
     
+    @_bus_transaction
+    def general_poll(self, timeout=None):
+        """Send a general poll and return the raw exception code
+
+        Unlike ``events_poll`` the code is not translated nor compared with
+        the previous one, so repeated exceptions (e.g. two tickets printed in
+        a row) are all reported.
+
+        Parameters
+        ----------
+        timeout : float, optional
+            Read timeout for this poll only, defaults to ``poll_timeout``
+
+        Returns
+        -------
+        Mixed
+            str - lower case hex exception code (i.e. "3d") | None if the EGM did not answer
+        """
+        if self.link is not None and self.link.blocked():
+            return None
+
+        self._identify_on_first_use()
+        try:
+            self._conf_event_port()
+            if timeout is not None:
+                self.connection.timeout = timeout
+            self.connection.write([self.poll_address])
+            self.connection.write([0x80 | self.address])
+            event = self.connection.read(1)
+        except Exception:
+            if self.link is not None:
+                self.link.record("error")
+            raise
+
+        if self.link is not None:
+            if event == bytes([self.address]) and getattr(self.connection, "in_waiting", 0):
+                # The address followed by more bytes is a chirp, not an exception code
+                self.link.record("chirp")
+                return None
+            self.link.record(None if event else "timeout")
+        if not event:
+            return None
+
+        return event.hex()
+
+    @_bus_transaction
     def realtime_events_poll(self):
         self._conf_event_port()
 
@@ -671,6 +1044,7 @@ class Sas:
 
 
     
+    @coalesced()
     def send_meters_10_15(self, denom=True):
         """Send meters 10 through 15
 
@@ -976,6 +1350,7 @@ class Sas:
 
         return None
 
+    @coalesced()
     def meters_11_15(self, denom=True):
         """Send meters 11 through 15
 
@@ -1033,6 +1408,7 @@ class Sas:
 
         return None
 
+    @coalesced()
     def current_credits(self, denom=True):
         """Send current credits
 
@@ -1073,27 +1449,50 @@ class Sas:
 
         Notes
         -------
-        This is a LONG POLL COMMAND - Warning: is missing 2-byte BCD Partial pay amount @todo FIX ME !
+        This is a LONG POLL COMMAND
+        """
+        record = self.handpay_record()
+        if record:
+            Meters.Meters.STATUS_MAP["bin_progressive_group"] = record.progressive_group
+            Meters.Meters.STATUS_MAP["bin_level"] = record.level
+            Meters.Meters.STATUS_MAP["amount"] = record.amount
+            Meters.Meters.STATUS_MAP["partial_pay_amount"] = record.partial_pay_amount
+            Meters.Meters.STATUS_MAP["bin_reset_ID"] = record.reset_id
+            return Meters.Meters.get_non_empty_status_map()
+
+        return None
+
+    def handpay_record(self):
+        """Send handpay information as a ``HandpayRecord``
+
+        Reads the whole fixed length response: address, 1B, progressive group,
+        level, 5 BCD amount, 2 BCD partial pay amount, reset ID, 10 unused
+        bytes and CRC (24 bytes).
+
+        Returns
+        -------
+        Mixed
+            HandpayRecord | None
+
+        Notes
+        -------
+        This is a LONG POLL COMMAND
         """
         cmd = [0x1B]
-        data = self._send_command(cmd, crc_need=False)
-        if data:
-            Meters.Meters.STATUS_MAP["bin_progressive_group"] = int(
-                binascii.hexlify(bytearray(data[1:2]))
-            )
-            Meters.Meters.STATUS_MAP["bin_level"] = int(
-                binascii.hexlify(bytearray(data[2:3]))
-            )
-            Meters.Meters.STATUS_MAP["amount"] = int(
-                binascii.hexlify(bytearray(data[3:8]))
-            )
-            Meters.Meters.STATUS_MAP["bin_reset_ID"] = int(
-                binascii.hexlify(bytearray(data[8:]))
+        data = self._send_command(cmd, crc_need=False, size=24)
+        if data and len(data) >= 11:
+            return HandpayRecord.HandpayRecord(
+                progressive_group=data[1],
+                level=data[2],
+                amount=int(binascii.hexlify(bytearray(data[3:8]))),
+                partial_pay_amount=int(binascii.hexlify(bytearray(data[8:10]))),
+                reset_id=data[10],
+                pending_at=time.time(),
             )
-            return Meters.Meters.get_non_empty_status_map()
 
         return None
 
+    @coalesced()
     def meters(self, denom=True):
         """Send Meters
 
@@ -1208,6 +1607,7 @@ class Sas:
 
         return None
 
+    @coalesced()
     def gaming_machine_id(self):
         """Gaming machine information command
         @todo Check this one...something smell bad
@@ -1928,9 +2328,8 @@ class Sas:
         mixed :
             dict | none
         """
-        # FIXME: enhanced_validation_information
         cmd = [0x4D, curr_validation_info]
-        data = self._send_command(cmd, True, crc_need=True)
+        data = self._send_command(cmd, crc_need=True, size=35)
         if data:
             TitoStatement.Tito.STATUS_MAP["validation_type"] = int(
                 binascii.hexlify(bytearray(data[1:2]))
@@ -1967,6 +2366,40 @@ class Sas:
 
         return None
 
+    def enhanced_validation_record(self, curr_validation_info=0xFF):
+        """Read one validation buffer entry as a ``ValidationRecord``
+
+        Same long poll as ``enhanced_validation_information`` but the response
+        is decoded into its own record instead of the shared ``Tito.STATUS_MAP``.
+
+        Parameters
+        ----------
+        curr_validation_info :
+            Function code; 00 = read current validation info | 01-1F = validation info from buffer index n | FF = look ahead at current validation info
+
+        Returns
+        -------
+        mixed :
+            ValidationRecord | none - none also when the requested entry is empty
+        """
+        cmd = [0x4D, curr_validation_info]
+        data = self._send_command(cmd, crc_need=True, size=35)
+        if data and len(data) >= 32 and data[2]:
+            return ValidationRecord.ValidationRecord(
+                validation_type=data[1],
+                index_number=data[2],
+                date=bytearray(data[3:7]).hex(),
+                time=bytearray(data[7:10]).hex(),
+                validation_number=bytearray(data[10:18]).hex(),
+                amount=int(binascii.hexlify(bytearray(data[18:23]))),
+                ticket_number=int(binascii.hexlify(bytearray(data[23:25]))),
+                validation_system_id=int(binascii.hexlify(bytearray(data[25:26]))),
+                expiration=bytearray(data[26:30]).hex(),
+                pool_id=int.from_bytes(data[30:32], "big"),
+            )
+
+        return None
+
     def current_hopper_status(self):
         """Send Current Hopper Status
         Returns
@@ -2028,6 +2461,7 @@ class Sas:
 
         return None
 
+    @coalesced()
     def validation_meters(self, type_of_validation=0x00):
         """Send validation meters
         Parameters
@@ -2085,6 +2519,7 @@ class Sas:
 
         return None
 
+    @coalesced()
     def total_number_of_games_implemented(self):
         # 51
         cmd = [0x51]
@@ -2095,6 +2530,7 @@ class Sas:
 
         return None
 
+    @coalesced()
     def game_meters(self, n=None, denom=True):
         # 52
         cmd = [0x52]
@@ -2143,6 +2579,7 @@ class Sas:
 
         return None
 
+    @coalesced()
     def game_configuration(self, n=None):
         # 53
         cmd = [0x53]
@@ -2182,6 +2619,40 @@ class Sas:
 
         return None
 
+    def machine_model(self, timeout=None):
+        """Identify the EGM model from its 1F game information and 54 SAS version
+
+        Parameters
+        ----------
+        timeout : float, optional
+            Read timeout of the two long polls
+
+        Returns
+        -------
+        Mixed
+            dict - game_id, additional_id, paytable_id, sas_version, serial and
+            the ``utils.ModelProfiles`` key | None if the EGM did not answer
+        """
+        info = self._send_command([0x1F], crc_need=False, size=24, timeout=timeout)
+        if not info:
+            return None
+        version = self._send_command([0x54, 0x00], crc_need=False, var_length=True, timeout=timeout)
+        if not version:
+            return None
+
+        model = {
+            "game_id": info[1:3].decode("ascii", "replace"),
+            "additional_id": info[3:6].decode("ascii", "replace"),
+            "paytable_id": info[11:17].decode("ascii", "replace"),
+            "sas_version": version[2:5].decode("ascii", "replace"),
+            "serial": version[5:].decode("ascii", "replace").strip(),
+        }
+        model["key"] = ModelProfiles.model_key(
+            model["game_id"], model["additional_id"], model["paytable_id"], model["sas_version"]
+        )
+        return model
+
+    @coalesced()
     def sas_version_gaming_machine_serial_id(self):
         # 54
         """
@@ -2201,6 +2672,7 @@ class Sas:
 
         return None
 
+    @coalesced()
     def selected_game_number(self, in_hex=True):
         # 55
         cmd = [0x55]
@@ -2213,6 +2685,7 @@ class Sas:
 
         return None
 
+    @coalesced()
     def enabled_game_numbers(self):
         # 56
         cmd = [0x56]
@@ -2231,13 +2704,14 @@ class Sas:
     def pending_cashout_info(self):
         # 57
         cmd = [0x57]
-        data = self._send_command(cmd, crc_need=False)
+        # address, 57, cashout type, 5 BCD bytes amount, CRC
+        data = self._send_command(cmd, crc_need=False, size=10)
         if data:
             TitoStatement.Tito.STATUS_MAP["cashout_type"] = int(
                 binascii.hexlify(bytearray(data[1:2]))
             )
-            TitoStatement.Tito.STATUS_MAP["cashout_amount"] = str(
-                binascii.hexlify(bytearray(data[2:]))
+            TitoStatement.Tito.STATUS_MAP["cashout_amount"] = int(
+                binascii.hexlify(bytearray(data[2:7]))
             )
             return TitoStatement.Tito.get_non_empty_status_map()
 
@@ -2250,18 +2724,19 @@ class Sas:
         validation_id : int
             Validation System ID Code (00 = system validation denied)
 
-        valid_number : int
-            validation number to use for cashout (not used if validation denied)
+        valid_number : int | str
+            16 digits validation number to use for cashout (not used if validation denied)
 
         Returns
         -------
         Mixed
             str | none - 00 = command ack | 80 = Not in cashout | 81 = Improper validation rejected
         """
-        cmd = [0x58, self._bcd_coder_array(validation_id, 1), self._bcd_coder_array(valid_number, 8)]
-        data = self._send_command(cmd, crc_need=True)
+        cmd = [0x58, validation_id]
+        cmd.extend(self._bcd_coder_array(valid_number, 8))
+        data = self._send_command(cmd, crc_need=True, size=5)
         if data:
-            return str(binascii.hexlify(bytearray(data[1])))
+            return bytearray(data[1:2]).hex()
 
         return None
 
@@ -2368,29 +2843,36 @@ class Sas:
         return None
 
     def ticket_validation_data(self):
+        """Send ticket validation data
+
+        Returns
+        -------
+        Mixed
+            dict | None
+
+        Notes
+        -------
+        Understanding the response:
+            - ticket_status : 00 = ticket in escrow, data follows | FF = no ticket in escrow
+            - ticket_amount : 5 BCD, in cents (zero if unknown to the EGM)
+            - parsing_code : 00 = validation data is a 18 digit (9 BCD) validation number
+            - validation_data : hex string; with parsing code 00 the first two digits are the
+              system ID code and the remaining 16 digits the validation number
+        """
         # 70
-        # FIXME: ticket_validation_data
-        # @todo This is wrong for sure....this should reply 9 BCD BCD-encoded 18 digit decimal validation number. The first two digits are a 2
-        # digit system ID code indicating how to interpret the following 16 digits.
-        # System ID code 00 indicates that the following 16 digits represent a SAS
-        # secure enhanced validation number. Other system ID codes and parsing codes
-        # will be assigned by IGT as needed
         cmd = [0x70]
-        data = self._send_command(cmd, True, crc_need=False)
-        if data:
-            Meters.Meters.STATUS_MAP["ticket_status"] = int(
-                binascii.hexlify(bytearray(data[2:3]))
-            )
-            Meters.Meters.STATUS_MAP["ticket_amount"] = str(
-                binascii.hexlify(bytearray(data[3:8]))
-            )
-            Meters.Meters.STATUS_MAP["parsing_code"] = int(
-                binascii.hexlify(bytearray(data[8:9]))
-            )
-            Meters.Meters.STATUS_MAP["validation_data"] = str(
-                binascii.hexlify(bytearray(data[9:]))
-            )
-            return Meters.Meters.get_non_empty_status_map()
+        data = self._send_command(cmd, crc_need=False, var_length=True)
+        if data and len(data) > 2:
+            response = {"ticket_status": data[2]}
+            if len(data) > 8:
+                response.update(
+                    {
+                        "ticket_amount": int(binascii.hexlify(bytearray(data[3:8]))),
+                        "parsing_code": data[8],
+                        "validation_data": bytearray(data[9:]).hex(),
+                    }
+                )
+            return response
 
         return None
 
@@ -2403,36 +2885,58 @@ class Sas:
             restricted_expiration=0,
             pool_id=0
     ):
+        """Redeem ticket
+
+        Parameters
+        ----------
+        transfer_code : int
+            00 = valid cashable ticket | 01 = valid restricted promotional ticket | 02 = valid
+            nonrestricted promotional ticket | 80-8F = ticket rejected (see SAS table 15.13b) |
+            FF = request for current ticket status (all the other parameters are ignored)
+        transfer_amount : int
+            Amount in cents
+        parsing_code : int
+        validation_data : int | str
+            18 digits validation data as read by ``ticket_validation_data``
+        restricted_expiration : int
+            MMDDYYYY or number of days for restricted tickets
+        pool_id : int
+            Restricted pool ID
+
+        Returns
+        -------
+        Mixed
+            dict | None - machine_status: 00 = ticket redeemed | 20 = waiting for long poll 71 |
+            40 = redemption pending | 80-8F = ticket rejected
+        """
         # 71
-        # FIXME: redeem_ticket
-        cmd = [
-            0x71,
-            0x21,
-            transfer_code,
-            self._bcd_coder_array(transfer_amount, 5),
-            parsing_code,
-            self._bcd_coder_array(validation_data, 8),
-            self._bcd_coder_array(restricted_expiration, 4),
-            self._bcd_coder_array(pool_id, 2),
-        ]
-        data = self._send_command(cmd, True, crc_need=True)
-        if data:
-            Meters.Meters.STATUS_MAP["machine_status"] = int(
-                binascii.hexlify(bytearray(data[2:3]))
-            )
-            Meters.Meters.STATUS_MAP["transfer_amount"] = int(
-                binascii.hexlify(bytearray(data[3:8]))
-            )
-            Meters.Meters.STATUS_MAP["parsing_code"] = int(
-                binascii.hexlify(bytearray(data[8:9]))
-            )
-            Meters.Meters.STATUS_MAP["validation_data"] = str(
-                binascii.hexlify(bytearray(data[9:]))
-            )
-            return Meters.Meters.get_non_empty_status_map()
+        if transfer_code == 0xFF:
+            cmd = [0x71, 0x01, 0xFF]
+        else:
+            cmd = [0x71, 0x00, transfer_code]
+            cmd.extend(self._bcd_coder_array(transfer_amount, 5))
+            cmd.append(parsing_code)
+            cmd.extend(self._bcd_coder_array(validation_data, 9))
+            cmd.extend(self._bcd_coder_array(restricted_expiration, 4))
+            cmd.extend([(pool_id >> 8) & 0xFF, pool_id & 0xFF])
+            cmd[1] = len(cmd) - 2
+
+        data = self._send_command(cmd, crc_need=True, var_length=True)
+        if data and len(data) > 2:
+            response = {"machine_status": data[2]}
+            if len(data) > 8:
+                response.update(
+                    {
+                        "transfer_amount": int(binascii.hexlify(bytearray(data[3:8]))),
+                        "parsing_code": data[8],
+                        "validation_data": bytearray(data[9:]).hex(),
+                    }
+                )
+            return response
 
         return None
 
+    @_bus_transaction
     def aft_jp(self, money, amount=1, lock_timeout=0, games=None):
         # FIXME: make logically coherent
         # self.lock_emg(lock_time=500, condition=1)
@@ -2544,6 +3048,7 @@ class Sas:
 
         return response
 
+    @_bus_transaction
     def aft_out(self, money=None, amount=1, lock_timeout=0):
         """
         aft_out is a function to make a machine cashout (effectively removes the credit in the machine)
@@ -2645,6 +3150,7 @@ class Sas:
 
         return response
 
+    @_bus_transaction
     def aft_cashout_enable(self, amount=1, money="0000000000"):
         money_1 = money_2 = money_3 = "0000000000"
 
@@ -2732,6 +3238,7 @@ class Sas:
 
         return True
 
+    @_bus_transaction
     def aft_won(
             self, money="0000000000", amount=1, games=None, lock_timeout=0
     ):
@@ -2834,6 +3341,7 @@ class Sas:
 
         return response
 
+    @_bus_transaction
     def aft_in(self, money, amount=1):
         """
         aft_in is the function you want to use to charge money into your machine
@@ -3147,6 +3655,83 @@ class Sas:
 
         return self.transaction
 
+    def aft_max_buffer_index(self):
+        """Size of the AFT transaction history buffer
+
+        Sends a 74 status only request (lock code FF) and reads the maximum
+        history buffer index, which tells how many entries can be interrogated
+        with ``aft_transaction_history``.
+
+        Returns
+        -------
+        Mixed
+            int (00-7F) | None
+        """
+        data = self._send_command([0x74, 0xFF, 0x00, 0x00, 0x00], crc_need=True, var_length=True)
+        if data and len(data) > 10:
+            return data[10]
+
+        return None
+
+    def aft_transaction_history(self, index=0x00):
+        """Interrogate one entry of the AFT transaction history buffer
+
+        Parameters
+        ----------
+        index : int
+            Transaction index; 00 = current or most recent transfer | 01-7F = history buffer position n
+
+        Returns
+        -------
+        Mixed
+            dict | None - see ``_parse_aft_transfer``
+
+        Notes
+        -------
+        This is a LONG POLL COMMAND (72, transfer code FF = interrogation only, no transfer is started)
+        """
+        cmd = [0x72, 0x02, 0xFF, index]
+        data = self._send_command(cmd, crc_need=True, var_length=True)
+        if data:
+            return self._parse_aft_transfer(data)
+
+        return None
+
+    @staticmethod
+    def _parse_aft_transfer(data):
+        """Decode a 72 response into a standalone dict
+
+        Unlike ``aft_transfer_funds`` this does not write into
+        ``AftStatements.STATUS_MAP``, so records can be collected in bulk.
+        Amounts are in cents, dates are MMDDYYYY and times HHMMSS.
+        """
+        record = {
+            "transaction_buffer_position": data[2],
+            "transfer_status": bytearray(data[3:4]).hex(),
+        }
+        # Entries without transfer information stop right after the status
+        if len(data) < 27:
+            return record
+
+        id_length = data[26]
+        pos = 27 + id_length
+        record.update(
+            {
+                "receipt_status": bytearray(data[4:5]).hex(),
+                "transfer_type": bytearray(data[5:6]).hex(),
+                "cashable_amount": int(binascii.hexlify(bytearray(data[6:11]))),
+                "restricted_amount": int(binascii.hexlify(bytearray(data[11:16]))),
+                "nonrestricted_amount": int(binascii.hexlify(bytearray(data[16:21]))),
+                "transfer_flags": bytearray(data[21:22]).hex(),
+                "asset_number": bytearray(data[22:26]).hex(),
+                "transaction_id": bytearray(data[27:pos]).hex(),
+                "transaction_date": bytearray(data[pos: pos + 4]).hex(),
+                "transaction_time": bytearray(data[pos + 4: pos + 7]).hex(),
+            }
+        )
+
+        return record
+
     def aft_format_transaction(self, from_egm=False):
         if from_egm:
             self.aft_get_last_trx()
@@ -3235,14 +3820,10 @@ class Sas:
             self, lock_code=0x00, transfer_condition=00, lock_timeout=0
     ):
         # 74
-        cmd = [
-            0x74,
-            lock_code,
-            transfer_condition,
-            self._bcd_coder_array(lock_timeout, 2),
-        ]
+        cmd = [0x74, lock_code, transfer_condition]
+        cmd.extend(self._bcd_coder_array(lock_timeout, 2))
 
-        data = self._send_command(cmd, crc_need=True, size=40)
+        data = self._send_command(cmd, crc_need=True, var_length=True)
         if data:
             AftStatements.AftStatements.STATUS_MAP["asset_number"] = str(
                 binascii.hexlify(bytearray(data[2:6]))
@@ -3282,6 +3863,7 @@ class Sas:
 
         return None
 
+    @_bus_transaction
     def aft_cancel_request(self):
         cmd = [0x72, 0x01, 0x80]
         self.aft_register()
@@ -3373,59 +3955,221 @@ class Sas:
         # TODO: 7D
         return NotImplemented
 
+    @coalesced()
     def current_date_time(self):
+        """Send current date and time
+
+        Returns
+        -------
+        Mixed
+            datetime.datetime | None
+        """
         # 7E
         cmd = [0x7E]
         data = self._send_command(cmd, crc_need=False, size=11)
-        if data:
-            data = str(binascii.hexlify(bytearray(data[1:8])))
-            return datetime.datetime.strptime(data, "%m%d%Y%H%M%S")
+        if data and len(data) >= 8:
+            digits = bytearray(data[1:8]).hex()  # MMDDYYYYHHMMSS
+            return datetime.datetime(
+                int(digits[4:8]),
+                int(digits[0:2]),
+                int(digits[2:4]),
+                int(digits[8:10]),
+                int(digits[10:12]),
+                int(digits[12:14]),
+            )
 
         return None
 
-    def receive_date_time(self, dates, times):
+    def set_date_time(self, when=None, broadcast=False):
+        """Receive date and time
+
+        Parameters
+        ----------
+        when : datetime.datetime, optional
+            Date and time to set, defaults to now
+        broadcast : bool
+            True sends to address 00 so every EGM on the loop is set with one frame
+
+        Returns
+        -------
+        bool
+            True if acknowledged (or sent when broadcast)
+        """
         # 7F
+        if when is None:
+            when = datetime.datetime.now()
+
         cmd = [0x7F]
-        fmt_cmd = "" + dates.replace(".", "") + times.replace(":", "") + "00"
-        count = 0
-        for i in range(len(fmt_cmd) // 2):
-            cmd.append(int(fmt_cmd[count: count + 2], 16))
-            count += 2
+        cmd.extend(self._bcd_coder_array(when.strftime("%m%d%Y%H%M%S"), 7))
+        if broadcast:
+            return self._send_broadcast(cmd)
 
-        if self._send_command(cmd, True, crc_need=True) == self.address:
+        return self._send_command(cmd, True, crc_need=True) == self.address
+
+    def receive_date_time(self, dates, times):
+        """Receive date and time
+
+        Parameters
+        ----------
+        dates : str
+            MM.DD.YYYY
+        times : str
+            HH:MM or HH:MM:SS
+
+        Returns
+        -------
+        bool
+            True if acknowledged
+        """
+        # 7F
+        digits = dates.replace(".", "") + times.replace(":", "").ljust(6, "0")
+        return self.set_date_time(datetime.datetime.strptime(digits, "%m%d%Y%H%M%S"))
+
+    def _send_broadcast(self, command):
+        """Send a long poll to the broadcast address (00)
+
+        Every EGM on the loop processes the frame but none of them answers,
+        so nothing is read back.
+        """
+        try:
+            buf_header = [0x00]
+            buf_header.extend(command)
+            buf_header.extend(Crc.calculate(bytes(buf_header)))
+
+            with self._transaction():
+                self._conf_port()
+                self.connection.write([self.poll_address, 0x00])
+                self.connection.flush()
+                self.connection.parity = serial.PARITY_SPACE
+                time.sleep(self.wait_for_wake_up)
+                self.connection.write(buf_header[1:])
+                self.connection.flush()
             return True
+        except Exception as e:
+            self.log.error(e, exc_info=True)
 
         return False
 
-    @staticmethod
-    def receive_progressive_amount():
-        # TODO: 80
-        return NotImplemented
+    def receive_progressive_amount(self, group, level, amount, broadcast=True):
+        """Single level progressive broadcast
+
+        Parameters
+        ----------
+        group : int
+            Progressive group (01-FF)
+        level : int
+            Progressive level (01-20)
+        amount : int
+            Level amount in cents
+        broadcast : bool
+            True sends to address 00 (every EGM on the loop), False to this EGM only
+
+        Returns
+        -------
+        bool
+            True if the frame was sent (or acknowledged when not broadcast)
+        """
+        # 80
+        cmd = [0x80, group, level]
+        cmd.extend(self._bcd_coder_array(amount, 5))
+        if broadcast:
+            return self._send_broadcast(cmd)
+
+        return self._send_command(cmd, True, crc_need=True) == self.address
 
     @staticmethod
     def cumulative_progressive_wins():
         # TODO: 83
         return NotImplemented
 
-    @staticmethod
-    def progressive_win_amount():
-        # TODO: 84
-        return NotImplemented
+    def _parse_progressive_win(self, data):
+        return {
+            "group": data[1],
+            "level": data[2],
+            "amount": int(binascii.hexlify(bytearray(data[3:8]))),
+        }
 
-    @staticmethod
-    def sas_progressive_win_amount():
-        # TODO: 85
-        return NotImplemented
+    def progressive_win_amount(self):
+        """Send progressive win amount (non SAS progressive, cashout device/credit paid)
 
-    @staticmethod
-    def receive_multiple_progressive_levels():
-        # TODO: 86
-        return NotImplemented
+        Returns
+        -------
+        Mixed
+            dict (group, level, amount in cents) | None
+        """
+        # 84
+        data = self._send_command([0x84], crc_need=False, size=11)
+        if data and len(data) >= 8:
+            return self._parse_progressive_win(data)
 
-    @staticmethod
-    def multiple_sas_progressive_win_amounts():
-        # TODO: 87
-        return NotImplemented
+        return None
+
+    def sas_progressive_win_amount(self):
+        """Send SAS progressive win amount
+
+        Returns
+        -------
+        Mixed
+            dict (group, level, amount in cents) | None - level 00 when no win is pending
+        """
+        # 85
+        data = self._send_command([0x85], crc_need=False, size=11)
+        if data and len(data) >= 8:
+            return self._parse_progressive_win(data)
+
+        return None
+
+    def receive_multiple_progressive_levels(self, group, levels, broadcast=True):
+        """Multiple SAS progressive levels broadcast
+
+        Parameters
+        ----------
+        group : int
+            Progressive group (01-FF)
+        levels : dict
+            {level (01-20): amount in cents}
+        broadcast : bool
+            True sends to address 00 (every EGM on the loop), False to this EGM only
+
+        Returns
+        -------
+        bool
+            True if the frame was sent (or acknowledged when not broadcast)
+        """
+        # 86
+        cmd = [0x86, 0x00, group]
+        for level, amount in sorted(levels.items()):
+            cmd.append(level)
+            cmd.extend(self._bcd_coder_array(amount, 5))
+        cmd[1] = len(cmd) - 2
+
+        if broadcast:
+            return self._send_broadcast(cmd)
+
+        return self._send_command(cmd, True, crc_need=True) == self.address
+
+    def multiple_sas_progressive_win_amounts(self):
+        """Send multiple SAS progressive win amounts
+
+        Returns
+        -------
+        Mixed
+            dict | None - group and the list of won levels as {"level", "amount"} (cents)
+        """
+        # 87
+        data = self._send_command([0x87], crc_need=False, var_length=True)
+        if data and len(data) >= 4:
+            wins = []
+            for pos in range(4, 4 + 6 * data[3], 6):
+                wins.append(
+                    {
+                        "level": data[pos],
+                        "amount": int(binascii.hexlify(bytearray(data[pos + 1: pos + 6]))),
+                    }
+                )
+            return {"group": data[2], "wins": wins}
+
+        return None
 
     def initiate_legacy_bonus_pay(self, money, tax="00", games=None, ):
         # 8A
@@ -0,0 +1,156 @@
+import configparser
+import hashlib
+import logging
+import threading
+import time
+
+from fleet import select_rows
+
+log = logging.getLogger(__name__)
+
+
+def connection_string(db_config):
+    """Build the ODBC connection string of a config.ini database section"""
+    conn_str = f"DRIVER={{{db_config['driver']}}};SERVER={db_config['server']};"
+    if "port" in db_config:
+        conn_str += f"PORT={db_config['port']};"
+    conn_str += f"DATABASE={db_config['database']};UID={db_config['username']};PWD={db_config['password']};"
+    if "tds_version" in db_config:
+        conn_str += f"TDS_Version={db_config['tds_version']};"
+    return conn_str + (
+        f"Encrypt={db_config.get('encrypt', 'yes')};"
+        f"TrustServerCertificate={db_config.get('trustservercertificate', 'no')};"
+        f"Connection Timeout=30;"
+    )
+
+
+class InventoryClient:
+    """In-process cache of ``dbo.asset_inventory``
+
+    The whole table is loaded with a single query and indexed by machine_id,
+    location_id and IP address; lookups never touch the database. Once the
+    cache is older than ``ttl`` seconds the next access reloads it. Changes
+    between two loads are reported in ``last_changes`` (and to ``on_change``);
+    if a reload fails the previous data keeps being served.
+
+    Parameters
+    ----------
+    connect : callable
+        Returns a DB-API connection (e.g. ``lambda: pyodbc.connect(conn_str)``)
+    ttl : float
+        Seconds before the cache is refreshed
+    table : str
+    on_change : callable, optional
+        Called with the ``last_changes`` dict when a refresh found differences
+    """
+
+    def __init__(self, connect, ttl=300, table="dbo.asset_inventory", on_change=None):
+        self.connect = connect
+        self.ttl = ttl
+        self.table = table
+        self.on_change = on_change
+        self.rows = []
+        self.loaded_at = None
+        self.last_changes = {"added": [], "removed": [], "changed": []}
+        self._by_machine = {}
+        self._by_location = {}
+        self._by_ip = {}
+        self._hashes = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, path, section="master_monitoring_database", **kwargs):
+        """Client for a database section of config.ini"""
+        import pyodbc
+
+        config = configparser.ConfigParser()
+        config.read(path)
+        conn_str = connection_string(config[section])
+        return cls(lambda: pyodbc.connect(conn_str), **kwargs)
+
+    def _fetch(self):
+        conn = self.connect()
+        try:
+            cursor = conn.cursor()
+            cursor.execute(f"SELECT * FROM {self.table}")
+            columns = [column[0] for column in cursor.description]
+            return [dict(zip(columns, row)) for row in cursor.fetchall()]
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _row_hash(row):
+        return hashlib.sha1(repr(sorted(row.items())).encode()).hexdigest()
+
+    def refresh(self):
+        """Reload the table and rebuild the indexes
+
+        Returns
+        -------
+        dict
+            Machine ids added / removed / changed since the previous load
+        """
+        rows = self._fetch()
+        hashes = {row["machine_id"]: self._row_hash(row) for row in rows}
+
+        with self._lock:
+            changes = {
+                "added": [m for m in hashes if m not in self._hashes],
+                "removed": [m for m in self._hashes if m not in hashes],
+                "changed": [m for m in hashes if m in self._hashes and self._hashes[m] != hashes[m]],
+            }
+            self.loaded_at = time.monotonic()
+            first_load = not self._hashes
+            if first_load or any(changes.values()):
+                self.rows = rows
+                self._hashes = hashes
+                self._by_machine = {row["machine_id"]: row for row in rows}
+                self._by_location = {}
+                self._by_ip = {}
+                for row in rows:
+                    self._by_location.setdefault(row.get("location_id"), []).append(row)
+                    if row.get("ip_address"):
+                        self._by_ip[row["ip_address"]] = row
+            self.last_changes = changes
+
+        if not first_load and any(changes.values()):
+            log.info(f"Inventory changed: {changes}")
+            if self.on_change is not None:
+                self.on_change(changes)
+
+        return changes
+
+    def _ensure_fresh(self):
+        if self.loaded_at is not None and time.monotonic() - self.loaded_at < self.ttl:
+            return
+
+        try:
+            self.refresh()
+        except Exception as e:
+            if self.loaded_at is None:
+                raise
+            log.error(f"Inventory refresh failed, serving cached data: {e}")
+            self.loaded_at = time.monotonic()
+
+    def lookup(self, machine_id):
+        """Inventory row of a machine, None if unknown"""
+        self._ensure_fresh()
+        return self._by_machine.get(machine_id)
+
+    def by_location(self, location_id):
+        self._ensure_fresh()
+        return list(self._by_location.get(location_id, []))
+
+    def by_ip(self, ip_address):
+        self._ensure_fresh()
+        return self._by_ip.get(ip_address)
+
+    def select(self, selector=None):
+        """Rows matching a ``fleet.select_rows`` selector (FleetExecutor inventory)"""
+        self._ensure_fresh()
+        if isinstance(selector, dict) and set(selector) == {"location_id"} and not isinstance(
+            selector["location_id"], (list, tuple, set)
+        ):
+            return self.by_location(selector["location_id"])
+
+        return select_rows(self.rows, selector)
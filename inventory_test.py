@@ -0,0 +1,73 @@
+import sqlite3
+
+import pytest
+
+from fleet import FleetExecutor, SubprocessTransport
+from inventory import InventoryClient
+
+ROWS = [
+    (1, "10.0.0.1", "pi", 10),
+    (2, "10.0.0.2", "pi", 10),
+    (3, "10.0.0.3", "pi", 20),
+]
+
+
+def _database(tmp_path, rows=ROWS):
+    path = str(tmp_path / "inventory.db")
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE asset_inventory (machine_id, ip_address, username, location_id)")
+    conn.executemany("INSERT INTO asset_inventory VALUES (?, ?, ?, ?)", rows)
+    conn.commit()
+    conn.close()
+    return path
+
+
+def _client(path, **kwargs):
+    return InventoryClient(lambda: sqlite3.connect(path), table="asset_inventory", **kwargs)
+
+
+def test_lookups(tmp_path):
+    client = _client(_database(tmp_path))
+
+    assert client.lookup(2)["ip_address"] == "10.0.0.2"
+    assert [row["machine_id"] for row in client.by_location(10)] == [1, 2]
+    assert client.by_ip("10.0.0.3")["machine_id"] == 3
+    assert client.lookup(4) is None
+
+
+def test_refresh_reports_changes(tmp_path):
+    path = _database(tmp_path)
+    changes = []
+    client = _client(path, ttl=0, on_change=changes.append)
+    client.lookup(1)
+
+    conn = sqlite3.connect(path)
+    conn.execute("UPDATE asset_inventory SET ip_address = '10.0.0.9' WHERE machine_id = 2")
+    conn.execute("DELETE FROM asset_inventory WHERE machine_id = 3")
+    conn.execute("INSERT INTO asset_inventory VALUES (4, '10.0.0.4', 'pi', 20)")
+    conn.commit()
+    conn.close()
+
+    assert client.by_ip("10.0.0.9")["machine_id"] == 2
+    assert changes == [{"added": [4], "removed": [3], "changed": [2]}]
+
+
+def test_failed_refresh_serves_cached_rows(tmp_path):
+    path = _database(tmp_path)
+    client = _client(path, ttl=0)
+    client.lookup(1)
+    client.connect = lambda: sqlite3.connect(str(tmp_path / "missing" / "inventory.db"))
+
+    assert client.lookup(1)["machine_id"] == 1
+    with pytest.raises(sqlite3.Error):
+        _client(str(tmp_path / "missing" / "inventory.db")).lookup(1)
+
+
+def test_fleet_run_from_inventory(tmp_path):
+    (tmp_path / "sas_cli.py").write_text("import sys\nprint(' '.join(sys.argv[1:]))\n")
+    client = _client(_database(tmp_path))
+    executor = FleetExecutor(client, SubprocessTransport(), repo_path=str(tmp_path), venv_path="")
+
+    results = list(executor.run({"location_id": 20}, "shutdown"))
+
+    assert [(r.machine_id, r.ok, r.stdout.strip()) for r in results] == [(3, True, "shutdown")]
@@ -0,0 +1,494 @@
+"""Scale test of one gateway process against many simulated EGMs
+
+A child process serves N ``SimulatedEgm`` on pseudo terminals with random
+play, bill, ticket, door and AFT activity. This process is the gateway: one
+thread per port runs the general poll loop of every EGM on it (event sink,
+periodic 0F meters, AFT history sync on 69) like a collector would. For
+every N the report gives:
+
+* the general poll cadence seen by each EGM (rate and interval percentiles)
+* the event to sink latency, from the exception being queued in the EGM to
+  the gateway sink receiving it
+* the gateway CPU and RSS, and the simulator CPU
+
+With ``--adaptive-meters`` the meters are read as often as the activity
+of each EGM calls for (``activity.MeterScheduler``) instead of every
+``--meter-interval``; ``--idle-share`` leaves part of the floor without
+activity to see the reads it saves.
+
+With ``--reactor`` the gateway is a single ``reactor.SasReactor`` thread
+driving every port instead of one thread per port (general polls and 0F
+meters only, no AFT history sync).
+
+Runs anywhere without hardware:
+
+    python load_test.py --egms 10,50,100,200 --duration 30
+    python load_test.py --egms 120 --per-port 8 --output load.json
+    python load_test.py --egms 50,200 --reactor
+    python load_test.py --egms 200 --idle-share 0.7 --adaptive-meters
+"""
+import argparse
+import contextlib
+import json
+import multiprocessing
+import os
+import random
+import resource
+import statistics
+import sys
+import threading
+import time
+from collections import deque
+
+from activity import MeterScheduler
+from aft_history import AftHistoryReader
+from event_stream import ANY, IDLE_CODES, EventStream
+from igtsas import Sas
+from reactor import SasReactor
+from simulated_egm import PtyEgmServer, PtySerial, SimulatedEgm
+from utils.BusLock import BusLock
+from utils.PhaseTracer import Histogram
+
+
+class _TimedEgm(SimulatedEgm):
+    """Simulated EGM stamping its exceptions and general polls for the report"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.queued_at = deque()
+        self.reset_measures()
+
+    def reset_measures(self):
+        with self._lock:
+            self.delivered = []  # (code, queued at) in the order the host received them
+            self.intervals = Histogram()
+            self.last_poll = None
+            self.measured_polls = 0
+
+    def queue_exception(self, code):
+        super().queue_exception(code)
+        with self._lock:
+            while len(self.queued_at) < len(self.exceptions):
+                self.queued_at.append(time.monotonic())
+
+    def general_poll(self):
+        now = time.monotonic()
+        self.polls += 1
+        with self._lock:
+            self.measured_polls += 1
+            if self.last_poll is not None:
+                self.intervals.record((now - self.last_poll) * 1e6)
+            self.last_poll = now
+            if not self.exceptions:
+                return b"\x00"
+            code = self.exceptions.popleft()
+            self.delivered.append((code, self.queued_at.popleft()))
+        return bytes([code])
+
+
+def _raise_file_limit():
+    # Every EGM costs a pty pair here and an open port in the gateway
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft != hard:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+
+def _cpu_seconds():
+    times = os.times()
+    return times.user + times.system
+
+
+def _simulate(count, per_port, activity, aft_rate, seed, pipe, idle_share=0.0):
+    """Simulator process: serve ``count`` EGMs until told to report and exit
+
+    The first ``idle_share`` of the EGMs get no activity at all.
+    """
+    _raise_file_limit()
+    rnd = random.Random(seed)
+    egms = [
+        _TimedEgm(address=i % per_port + 1, asset_number=i + 1, serial=f"SIM{i:09d}", seed=seed + i)
+        for i in range(count)
+    ]
+    server = PtyEgmServer()
+    ports = []
+    for first in range(0, count, per_port):
+        group = egms[first:first + per_port]
+        ports.append((server.add(group), [egm.address for egm in group]))
+    server.start()
+
+    stop = threading.Event()
+
+    playing = egms[int(count * idle_share):]
+
+    def generate(step=0.05):
+        while not stop.wait(step):
+            for egm in playing:
+                if rnd.random() < activity * step:
+                    egm.tick()
+                if rnd.random() < aft_rate * step:
+                    egm.aft_transfer(rnd.choice((500, 1000, 2000, 5000)))
+
+    generator = threading.Thread(target=generate, name="activity", daemon=True)
+    generator.start()
+    pipe.send(ports)
+
+    cpu = _cpu_seconds()
+    while True:
+        message = pipe.recv()
+        if message == "reset":
+            for egm in egms:
+                egm.reset_measures()
+            cpu = _cpu_seconds()
+        elif message == "report":
+            pipe.send({
+                "cpu_seconds": _cpu_seconds() - cpu,
+                "egms": [
+                    {
+                        "port": ports[i // per_port][0],
+                        "address": egm.address,
+                        "polls": egm.measured_polls,
+                        "interval_us": egm.intervals.summary(),
+                        "delivered": list(egm.delivered),
+                        "bad_crc": egm.bad_crc,
+                    }
+                    for i, egm in enumerate(egms)
+                ],
+            })
+        else:
+            break
+
+    stop.set()
+    generator.join()
+    server.stop()
+
+
+class _Gateway:
+    """The collector side: one polling thread per port, shared by its EGMs"""
+
+    def __init__(self, ports, interval=0.2, meter_interval=30, timeout=0.5, poll_address=None, meters=None):
+        self.interval = interval
+        self.meter_interval = meter_interval
+        self.meters = meters  # activity.MeterScheduler replacing the fixed meter_interval
+        self.received = {}  # (port, address) -> [(code, received at)]
+        self.meter_reads = 0
+        self.aft_records = 0
+        self.errors = 0
+        self._stop = threading.Event()
+        self._threads = []
+        self._connections = []
+
+        for port, addresses in ports:
+            connection = PtySerial(port, baudrate=19200, timeout=timeout)
+            self._connections.append(connection)
+            lock = BusLock()
+            streams = []
+            options = {}
+            if poll_address is not None:
+                options["poll_address"] = poll_address
+            elif len(addresses) > 1:
+                # Sas writes its poll address before every poll: 0x82 is also the general
+                # poll of address 02, which would lose that EGM's exceptions on a shared bus
+                options["poll_address"] = 0x80
+            for address in addresses:
+                sas = Sas(port, timeout=timeout, connection=connection, address=address,
+                          debug_level="CRITICAL", **options)
+                sas.scheduler = lock
+                streams.append(self._stream(sas, port))
+            self._threads.append(threading.Thread(target=self._poll, args=(streams,), name=port, daemon=True))
+
+    def _stream(self, sas, port):
+        stream = EventStream(sas, self.interval)
+        received = self.received[(port, sas.address)] = []
+        stream.subscribe(ANY, lambda code: received.append((int(code, 16), time.monotonic())))
+
+        reader = AftHistoryReader(sas, sink=self._on_aft_record)
+        pending = {"aft": False, "meters_at": time.monotonic() - random.random() * self.meter_interval}
+        stream.subscribe("69", lambda code: pending.update(aft=True))
+
+        def task():
+            if pending["aft"]:
+                pending["aft"] = False
+                reader.sync()
+            if self.meters is None and time.monotonic() - pending["meters_at"] >= self.meter_interval:
+                pending["meters_at"] = time.monotonic()
+                read_meters()
+
+        def read_meters():
+            # An EGM with all its meters at zero answers an empty map
+            values = sas.send_meters_10_15()
+            if values is not None:
+                self.meter_reads += 1
+            return values
+
+        stream.add_task(task)
+        if self.meters is not None:
+            self.meters.attach(stream, read_meters, machine=(port, sas.address))
+        return stream
+
+    def _on_aft_record(self, record):
+        self.aft_records += 1
+
+    def _poll(self, streams):
+        while not self._stop.is_set():
+            busy = False
+            for stream in streams:
+                try:
+                    busy = stream.poll_once() is not None or busy
+                except Exception:
+                    self.errors += 1
+                stream.run_tasks()
+            if not busy:
+                self._stop.wait(self.interval)
+
+    def reset(self):
+        for received in self.received.values():
+            received.clear()
+        self.meter_reads = self.aft_records = self.errors = 0
+
+    def start(self):
+        for thread in self._threads:
+            thread.start()
+
+    def stop(self):
+        self._stop.set()
+        for thread in self._threads:
+            thread.join()
+        for connection in self._connections:
+            connection.close()
+
+
+class _ReactorGateway:
+    """The collector side on one reactor thread: every EGM has its own poll chain"""
+
+    def __init__(self, ports, interval=0.2, meter_interval=30, timeout=0.5, poll_address=None, meters=None):
+        self.interval = interval
+        self.meter_interval = meter_interval
+        self.meters = meters  # activity.MeterScheduler replacing the fixed meter_interval
+        self.received = {}
+        self.meter_reads = 0
+        self.aft_records = 0
+        self.errors = 0
+        self._stop = threading.Event()
+        self.reactor = SasReactor()
+
+        for port, addresses in ports:
+            if poll_address is None:
+                # Same reason as _Gateway: 0x82 is also the general poll of address 02
+                options = {"poll_address": 0x80} if len(addresses) > 1 else {}
+            else:
+                options = {"poll_address": poll_address}
+            link = self.reactor.add_port(port, connection=PtySerial(port, baudrate=19200, timeout=0),
+                                         timeout=timeout, **options)
+            for address in addresses:
+                self._chain(link, port, address)
+
+    def _chain(self, link, port, address):
+        received = self.received[(port, address)] = []
+        state = {"meters_at": time.monotonic() - random.random() * self.meter_interval}
+
+        def poll():
+            if not self._stop.is_set():
+                link.general_poll(address).add_done_callback(polled)
+
+        def polled(future):
+            try:
+                code = future.result()
+            except Exception:
+                self.errors += 1
+                code = None
+            busy = code is not None and code not in IDLE_CODES
+            if busy:
+                received.append((int(code, 16), time.monotonic()))
+
+            if self.meters is not None:
+                if busy:
+                    self.meters.observe((port, address), code)
+                due = self.meters.due((port, address))
+                if due:
+                    self.meters.done((port, address))
+            else:
+                due = time.monotonic() - state["meters_at"] >= self.meter_interval
+                if due:
+                    state["meters_at"] = time.monotonic()
+            if due:
+                link.submit(address, [0x0F], size=28, crc_need=False).add_done_callback(metered)
+            # Back to back while the EGM has exceptions queued, like EventStream.run
+            self.reactor.call_later(0 if busy else self.interval, poll)
+
+        def metered(future):
+            if future.exception() is None and future.result():
+                self.meter_reads += 1
+
+        self.reactor.call_soon(poll)
+
+    def reset(self):
+        for received in self.received.values():
+            received.clear()
+        self.meter_reads = self.aft_records = self.errors = 0
+
+    def start(self):
+        self.reactor.start()
+
+    def stop(self):
+        self._stop.set()
+        self.reactor.stop()
+        for link in list(self.reactor.ports):
+            link.close()
+
+
+def _rss_mb():
+    try:
+        with open("/proc/self/status") as status:
+            for line in status:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    # ru_maxrss is the peak, in kB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _match_latencies(delivered, received, lookahead=8):
+    """Pair the events an EGM handed out with the ones the sink got, in order
+
+    Returns the latencies in seconds and the number of delivered events the
+    sink never saw (lost on a timeout, or across the measurement start).
+    """
+    latencies = []
+    position = 0
+    for code, received_at in received:
+        for offset, (sent_code, queued_at) in enumerate(delivered[position:position + lookahead]):
+            if sent_code == code:
+                latencies.append(received_at - queued_at)
+                position += offset + 1
+                break
+    return latencies, len(delivered) - len(latencies)
+
+
+def run_step(count, args):
+    """Run the gateway against ``count`` EGMs and return the report"""
+    context = multiprocessing.get_context("spawn")
+    pipe, child_pipe = context.Pipe()
+    simulator = context.Process(
+        target=_simulate,
+        args=(count, args.per_port, args.activity, args.aft_rate, args.seed, child_pipe, args.idle_share),
+        name="egm-simulator",
+        daemon=True,
+    )
+    simulator.start()
+    ports = pipe.recv()
+
+    meters = MeterScheduler() if args.adaptive_meters else None
+    gateway = (_ReactorGateway if args.reactor else _Gateway)(
+        ports, args.interval, args.meter_interval, args.timeout, args.poll_address, meters
+    )
+    gateway.start()
+    try:
+        time.sleep(args.warmup)
+        pipe.send("reset")
+        gateway.reset()
+        cpu, started = _cpu_seconds(), time.monotonic()
+
+        time.sleep(args.duration)
+        pipe.send("report")
+        cpu, elapsed = _cpu_seconds() - cpu, time.monotonic() - started
+        rss = _rss_mb()
+        received = {key: list(events) for key, events in gateway.received.items()}
+        meter_reads, aft_records, errors = gateway.meter_reads, gateway.aft_records, gateway.errors
+        simulated = pipe.recv()
+    finally:
+        gateway.stop()
+        pipe.send("exit")
+        simulator.join(timeout=10)
+
+    rates, worst_p99, worst_max = [], 0, 0
+    latency = Histogram()
+    lost = 0
+    for egm in simulated["egms"]:
+        rates.append(egm["polls"] / elapsed)
+        worst_p99 = max(worst_p99, egm["interval_us"]["p99"] or 0)
+        worst_max = max(worst_max, egm["interval_us"]["max"] or 0)
+        latencies, missed = _match_latencies(egm["delivered"], received.get((egm["port"], egm["address"]), []))
+        lost += missed
+        for seconds in latencies:
+            latency.record(seconds * 1e6)
+
+    target = 1 / args.interval
+    events = latency.summary()
+    return {
+        "egms": count,
+        "ports": len(ports),
+        "gateway": "reactor" if args.reactor else "threads",
+        "seconds": round(elapsed, 2),
+        "cadence": {
+            "target_hz": round(target, 2),
+            "median_hz": round(statistics.median(rates), 2),
+            "min_hz": round(min(rates), 2),
+            "worst_interval_p99_ms": round(worst_p99 / 1000, 1),
+            "worst_interval_max_ms": round(worst_max / 1000, 1),
+            "degraded": min(rates) < target * args.degraded_ratio,
+        },
+        "event_latency_ms": {
+            key: round(value / 1000, 2) if key not in ("count",) and value is not None else value
+            for key, value in events.items()
+        },
+        "events_lost": lost,
+        "meter_reads": meter_reads,
+        "meter_classes": meters.summary()["machines"] if meters is not None else None,
+        "aft_records": aft_records,
+        "poll_errors": errors,
+        "gateway_cpu_percent": round(100 * cpu / elapsed, 1),
+        "gateway_rss_mb": round(rss, 1),
+        "simulator_cpu_percent": round(100 * simulated["cpu_seconds"] / elapsed, 1),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Gateway scale test against simulated EGMs on ptys")
+    parser.add_argument("--egms", default="10,50,100", help="comma separated EGM counts, one run each")
+    parser.add_argument("--per-port", type=int, default=1, help="EGMs sharing a port (multi-drop)")
+    parser.add_argument("--duration", type=float, default=20, help="measured seconds per run")
+    parser.add_argument("--warmup", type=float, default=3)
+    parser.add_argument("--interval", type=float, default=0.2, help="general poll interval when idle")
+    parser.add_argument("--meter-interval", type=float, default=30)
+    parser.add_argument("--timeout", type=float, default=0.5, help="read timeout of the gateway")
+    parser.add_argument("--activity", type=float, default=0.5, help="activity ticks per second per EGM")
+    parser.add_argument("--aft-rate", type=float, default=0.01, help="AFT transfers per second per EGM")
+    parser.add_argument("--degraded-ratio", type=float, default=0.8,
+                        help="cadence below this share of the target marks the run degraded")
+    parser.add_argument("--poll-address", type=lambda value: int(value, 0),
+                        help="default: the library's (0x82), 0x80 with --per-port above 1")
+    parser.add_argument("--idle-share", type=float, default=0.0, help="share of the EGMs without any activity")
+    parser.add_argument("--adaptive-meters", action="store_true",
+                        help="meter reads adapted to the activity (activity.MeterScheduler)")
+    parser.add_argument("--reactor", action="store_true", help="poll every port from one reactor thread")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="write the reports as JSON")
+    args = parser.parse_args(argv)
+
+    _raise_file_limit()
+    reports = []
+    # The library prints every frame; keep the terminal for the report
+    with open(os.devnull, "w") as devnull:
+        for count in (int(n) for n in args.egms.split(",")):
+            with contextlib.redirect_stdout(devnull):
+                report = run_step(count, args)
+            reports.append(report)
+            cadence, latency = report["cadence"], report["event_latency_ms"]
+            print(
+                f"{count:5d} EGMs  cadence {cadence['median_hz']:6.2f} Hz (min {cadence['min_hz']:.2f}, "
+                f"p99 interval {cadence['worst_interval_p99_ms']:.0f} ms)  "
+                f"event latency p50 {latency['p50']} ms p99 {latency['p99']} ms  lost {report['events_lost']}  "
+                f"meter reads {report['meter_reads']}  "
+                f"cpu {report['gateway_cpu_percent']}%  rss {report['gateway_rss_mb']} MB"
+                + ("  DEGRADED" if cadence["degraded"] else "")
+            )
+
+    if args.output:
+        with open(args.output, "w") as output_file:
+            json.dump({"arguments": vars(args), "runs": reports}, output_file, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
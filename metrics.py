@@ -0,0 +1,326 @@
+import logging
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from error_handler import BadCRC, BadCommandIsRunning
+
+log = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+def _address(address):
+    """Label value of an EGM address, ``none`` for a handle without one"""
+    if address is None:
+        return "none"
+    return f"{address:02x}" if isinstance(address, int) else str(address)
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+        self._functions = {}
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {sorted(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def set_function(self, function, **labels):
+        """Compute the value at scrape time (must not touch the bus)"""
+        with self._lock:
+            self._functions[self._key(labels)] = function
+
+    def samples(self):
+        with self._lock:
+            values = dict(self._values)
+            functions = dict(self._functions)
+
+        for key, function in functions.items():
+            try:
+                values[key] = function()
+            except Exception as e:
+                log.error(f"Metric {self.name}{key} failed: {e}")
+
+        for key, value in sorted(values.items()):
+            yield self.name + _labels(self.labelnames, key), value
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(self._key(labels), 0)
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def value(self, **labels):
+        return self._values.get(self._key(labels), 0)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = {"counts": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state["counts"][i] += 1
+                    break
+            state["sum"] += value
+            state["count"] += 1
+
+    def time(self, **labels):
+        """Context manager observing the duration of its block"""
+        histogram = self
+
+        class _Timer:
+            def __enter__(self):
+                self.started = time.monotonic()
+
+            def __exit__(self, *exc):
+                histogram.observe(time.monotonic() - self.started, **labels)
+
+        return _Timer()
+
+    def samples(self):
+        with self._lock:
+            states = {key: (list(state["counts"]), state["sum"], state["count"]) for key, state in self._values.items()}
+
+        for key, (counts, total, count) in sorted(states.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                yield self.name + "_bucket" + _labels(self.labelnames, key, [("le", bound)]), cumulative
+            yield self.name + "_bucket" + _labels(self.labelnames, key, [("le", "+Inf")]), count
+            yield self.name + "_sum" + _labels(self.labelnames, key), total
+            yield self.name + "_count" + _labels(self.labelnames, key), count
+
+
+class Registry:
+    """Named counters, gauges and histograms rendered in the Prometheus text format
+
+    ``counter`` / ``gauge`` / ``histogram`` return the existing metric when the
+    name is already registered, so every ``Sas`` handle of a process can share
+    one registry.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics = {}
+
+    def _get(self, cls, name, documentation, labelnames, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, documentation, labelnames, **kwargs)
+            elif not isinstance(metric, cls):
+                raise ValueError(f"{name} is already registered as a {metric.kind}")
+            return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._get(Counter, name, documentation, labelnames)
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self._get(Gauge, name, documentation, labelnames)
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._get(Histogram, name, documentation, labelnames, buckets=buckets)
+
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics.values())
+
+        lines = []
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for sample, value in metric.samples():
+                lines.append(f"{sample} {value}")
+        return "\n".join(lines) + "\n"
+
+
+# Process wide registry, used when no other one is given
+REGISTRY = Registry()
+
+
+class SasMetrics:
+    """The metrics of the SAS stack, registered in ``registry``
+
+    ``Sas(metrics=registry)`` reports every long poll, ``EventStream`` the
+    exception codes of the handles that have metrics. Bus usage and queue
+    depths are read at scrape time with ``watch_bus`` and ``watch_queue``,
+    sink latency with ``timed_sink``.
+
+    Parameters
+    ----------
+    registry : Registry
+    utilization_window : float
+        Seconds covered by ``sas_bus_utilization``, whoever scrapes and how often
+    """
+
+    def __init__(self, registry=REGISTRY, utilization_window=60.0):
+        self.registry = registry
+        self.utilization_window = utilization_window
+        self.polls = registry.counter("sas_polls_total", "Long polls sent", ["address", "command"])
+        self.timeouts = registry.counter("sas_timeouts_total", "Long polls without response", ["address", "command"])
+        self.crc_failures = registry.counter("sas_crc_failures_total", "Responses with a bad CRC", ["address"])
+        self.bad_commands = registry.counter(
+            "sas_bad_command_total", "Responses to another command (BadCommandIsRunning)", ["address"]
+        )
+        self.errors = registry.counter("sas_poll_errors_total", "Long polls failed for another reason", ["address"])
+        self.latency = registry.histogram("sas_poll_latency_seconds", "Long poll round trip", ["command"])
+        self.events = registry.counter("sas_events_total", "General poll exceptions", ["address", "code"])
+        self.bus_busy = registry.counter("sas_bus_busy_seconds_total", "Time the bus was held", ["port"])
+        self.bus_waiting = registry.gauge("sas_bus_waiting", "Transactions waiting for the bus", ["port"])
+        self.bus_utilization = registry.gauge(
+            "sas_bus_utilization", "Share of the time the bus was held over the utilization window", ["port"]
+        )
+        self.queue_depth = registry.gauge("sas_queue_depth", "Items waiting in a queue", ["queue"])
+        self.sink_latency = registry.histogram("sas_sink_flush_seconds", "Sink call duration", ["sink"])
+
+    def poll(self, address, command, seconds, error=None, empty=False):
+        """Account for one long poll"""
+        address, command = _address(address), f"{command:02x}"
+        self.polls.inc(address=address, command=command)
+        self.latency.observe(seconds, command=command)
+        if empty:
+            self.timeouts.inc(address=address, command=command)
+        elif isinstance(error, BadCRC):
+            self.crc_failures.inc(address=address)
+        elif isinstance(error, BadCommandIsRunning):
+            self.bad_commands.inc(address=address)
+        elif error is not None:
+            self.errors.inc(address=address)
+
+    def event(self, address, code):
+        self.events.inc(address=_address(address), code=code)
+
+    def watch_bus(self, lock, port):
+        """Export the usage of a ``utils.BusLock``
+
+        Every scrape records a (time, busy seconds) sample; the utilization is
+        measured from the newest sample at least ``utilization_window`` old, so
+        it does not depend on when the previous scrape happened.
+        """
+        samples = deque([(time.monotonic(), lock.busy)])
+        samples_lock = threading.Lock()
+
+        def utilization():
+            now, busy = time.monotonic(), lock.busy
+            with samples_lock:
+                while len(samples) > 1 and samples[1][0] <= now - self.utilization_window:
+                    samples.popleft()
+                since, busy_since = samples[0]
+                samples.append((now, busy))
+            elapsed = now - since
+            return round((busy - busy_since) / elapsed, 4) if elapsed > 0 else 0.0
+
+        self.bus_busy.set_function(lambda: lock.busy, port=port)
+        self.bus_waiting.set_function(lambda: lock.stats()["waiting"], port=port)
+        self.bus_utilization.set_function(utilization, port=port)
+
+    def watch_queue(self, name, depth):
+        """Export a queue depth, ``depth`` being a callable (e.g. ``queue.qsize`` or ``lambda: len(deque)``)"""
+        self.queue_depth.set_function(depth, queue=name)
+
+    def timed_sink(self, name, sink):
+        """Wrap a sink callable so its duration lands in ``sas_sink_flush_seconds``"""
+
+        def timed(*args, **kwargs):
+            with self.sink_latency.time(sink=name):
+                return sink(*args, **kwargs)
+
+        return timed
+
+
+class MetricsServer:
+    """Serve a registry on http://host:port/metrics from a background thread
+
+    Scrapes only read the registry, they never touch the serial bus. Only
+    local clients can connect unless ``host`` says otherwise (e.g. "0.0.0.0").
+
+        server = MetricsServer(REGISTRY, port=9464)
+        server.start()
+    """
+
+    def __init__(self, registry=REGISTRY, host="127.0.0.1", port=9464):
+        self.registry = registry
+        registry_ref = registry
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] not in ("/metrics", "/"):
+                    self.send_error(404)
+                    return
+                body = registry_ref.render().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                log.debug(format % args)
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        self._server.daemon_threads = True
+        self.port = self._server.server_address[1]
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, name="metrics", daemon=True)
+        self._thread.start()
+        log.info(f"Metrics served on port {self.port}")
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
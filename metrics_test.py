@@ -0,0 +1,39 @@
+import time
+
+from metrics import Registry, SasMetrics
+
+
+class _Lock:
+    def __init__(self):
+        self.busy = 0.0
+
+    def stats(self):
+        return {"waiting": 0}
+
+
+def test_poll_without_address():
+    registry = Registry()
+    SasMetrics(registry).poll(None, 0x1F, 0.01)
+
+    assert 'sas_polls_total{address="none",command="1f"} 1' in registry.render()
+
+
+def test_utilization_shared_by_scrapers(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(time, "monotonic", lambda: now[0])
+    lock = _Lock()
+    metrics = SasMetrics(Registry(), utilization_window=60)
+    metrics.watch_bus(lock, "/dev/ttyS0")
+    scrape = metrics.bus_utilization._functions[("/dev/ttyS0",)]
+
+    # The bus is held half of the time, two scrapers read it every 15s, 1s apart
+    for _ in range(8):
+        now[0] += 14
+        lock.busy += 7
+        first = scrape()
+        now[0] += 1
+        lock.busy += 0.5
+        second = scrape()
+
+    assert 0.45 < first <= 0.5
+    assert 0.45 < second <= 0.5
@@ -0,0 +1,17 @@
+from dataclasses import dataclass
+from typing import Optional
+
+
+@dataclass(slots=True)
+class HandpayRecord:
+    """Handpay information (1B) plus its lifecycle on the host"""
+
+    progressive_group: int
+    level: int  # 00 = non progressive | 01-20 = progressive level | 40 = non progressive top award | 80 = cancelled credits
+    amount: int  # cents
+    partial_pay_amount: int  # cents
+    reset_id: int  # 00 = standard handpay | 01 = reset to the credit meter
+    status: str = "pending"  # pending | reset | cancelled
+    pending_at: float = 0.0  # time.time() of the 51 exception
+    reset_at: Optional[float] = None
+    duration: Optional[float] = None  # seconds from pending to reset
@@ -0,0 +1,17 @@
+from dataclasses import dataclass
+
+
+@dataclass(slots=True)
+class ValidationRecord:
+    """One entry of the enhanced validation buffer (4D)"""
+
+    validation_type: int
+    index_number: int
+    date: str  # MMDDYYYY
+    time: str  # HHMMSS
+    validation_number: str  # 16 digits
+    amount: int  # cents
+    ticket_number: int
+    validation_system_id: int
+    expiration: str
+    pool_id: int
@@ -10,4 +10,6 @@ __all__ = [
     "Meters",
     "TitoStatement",
     "AftStatements",
+    "ValidationRecord",
+    "HandpayRecord",
 ]
\ No newline at end of file
@@ -0,0 +1,180 @@
+import logging
+import queue
+import threading
+import time
+
+from utils.LatencyRecorder import LatencyRecorder
+
+log = logging.getLogger(__name__)
+
+# GPoll exceptions of the progressive controller
+NO_PROGRESSIVE_INFO = "53"
+PROGRESSIVE_WIN = "54"
+SAS_PROGRESSIVE_LEVEL_HIT = "56"
+
+
+class ProgressiveController:
+    """SAS progressive host for one or more loops
+
+    Keeps the level amounts of every progressive group and broadcasts them
+    (address 00, so one frame reaches every EGM of a loop) through each link
+    at least every ``interval`` seconds, well under the 5 seconds after which
+    the EGMs raise exception 53. A group with a single level uses 80, larger
+    groups 86.
+
+    ``tick`` is meant to run between general polls (see
+    ``EventStream.add_task``) and sends at most ``frames_per_tick`` frames,
+    the most overdue groups first, so broadcasting never starves event and
+    meter polling. ``attach`` gives every stream a ``tick`` of its own link
+    only: a link is written by the thread polling it and never by the
+    stream of another port. The controller state is shared by these
+    threads under a lock. Level hits (56) and progressive wins (54) are
+    read with 87/85 and 84 and put on ``hits``; a hit level restarts from
+    its seed.
+
+    Parameters
+    ----------
+    links : list
+        One ``igtsas.Sas`` per loop (serial port)
+    interval : float
+        Seconds between two broadcasts of the same group on a link
+    frames_per_tick : int
+        Maximum number of broadcast frames per link sent by one ``tick``
+    """
+
+    def __init__(self, links, interval=1.0, frames_per_tick=1):
+        self.links = list(links)
+        self.interval = interval
+        self.frames_per_tick = frames_per_tick
+        self.groups = {}
+        self.seeds = {}
+        self.hits = queue.Queue()
+        self.update_latency = LatencyRecorder()
+        self.cadence = LatencyRecorder()
+        self._lock = threading.RLock()
+        self._last_sent = {}  # (link, group): last broadcast
+        self._changed_at = {}  # (link, group): first change not broadcast yet
+
+    def set_level(self, group, level, amount, seed=None):
+        """Set a level amount (cents); ``seed`` is the amount it restarts from after a hit"""
+        with self._lock:
+            self.groups.setdefault(group, {})[level] = amount
+            if seed is not None:
+                self.seeds[(group, level)] = seed
+            now = time.monotonic()
+            for link in self.links:
+                self._changed_at.setdefault((link, group), now)
+
+    def contribute(self, group, level, amount):
+        """Increment a level by ``amount`` cents"""
+        with self._lock:
+            self.set_level(group, level, self.groups.get(group, {}).get(level, 0) + amount)
+
+    def broadcast(self, group, links=None):
+        """Send the current amounts of ``group`` through ``links`` (every link by default)
+
+        Only call it for links no other thread is polling, see ``attach``.
+        """
+        with self._lock:
+            levels = dict(self.groups[group])
+        links = self.links if links is None else links
+
+        for link in links:
+            if len(levels) == 1:
+                level, amount = next(iter(levels.items()))
+                link.receive_progressive_amount(group, level, amount)
+            else:
+                link.receive_multiple_progressive_levels(group, levels)
+
+            with self._lock:
+                now = time.monotonic()
+                if (link, group) in self._last_sent:
+                    self.cadence.record(now - self._last_sent[(link, group)])
+                self._last_sent[(link, group)] = now
+
+                changed_at = self._changed_at.pop((link, group), None)
+                if changed_at is not None:
+                    self.update_latency.record(now - changed_at)
+
+    def tick(self, link=None):
+        """Broadcast the groups that are due on ``link``, most overdue first
+
+        Without ``link`` every link is served, which is only safe when this
+        thread is the one polling all of them.
+
+        Returns
+        -------
+        int
+            Number of frames broadcast
+        """
+        if link is None:
+            return sum(self.tick(link) for link in list(self.links))
+
+        with self._lock:
+            now = time.monotonic()
+            due = [
+                group
+                for group in self.groups
+                if now - self._last_sent.get((link, group), 0) >= self.interval or (link, group) in self._changed_at
+            ]
+            due.sort(key=lambda group: self._last_sent.get((link, group), 0))
+
+        for group in due[: self.frames_per_tick]:
+            self.broadcast(group, [link])
+
+        return min(len(due), self.frames_per_tick)
+
+    def attach(self, events):
+        """Broadcast on the link of an ``EventStream`` between its general polls and handle its hits"""
+        sas = events.sas
+        with self._lock:
+            if sas not in self.links:
+                self.links.append(sas)
+        events.add_task(lambda: self.tick(sas))
+        events.subscribe(SAS_PROGRESSIVE_LEVEL_HIT, lambda code: self.on_level_hit(sas))
+        events.subscribe(PROGRESSIVE_WIN, lambda code: self.on_progressive_win(sas))
+        events.subscribe(NO_PROGRESSIVE_INFO, lambda code: self.on_no_progressive_info(sas))
+
+    def _hit(self, sas, group, level, amount, source):
+        self.hits.put(
+            {
+                "asset_number": sas.asset_number,
+                "group": group,
+                "level": level,
+                "amount": amount,
+                "source": source,
+                "time": time.time(),
+            }
+        )
+        seed = self.seeds.get((group, level))
+        if seed is not None:
+            self.set_level(group, level, seed)
+
+    def on_level_hit(self, sas):
+        """Read the SAS progressive win(s) after a 56 exception"""
+        wins = sas.multiple_sas_progressive_win_amounts()
+        if wins is not None:
+            for win in wins["wins"]:
+                self._hit(sas, wins["group"], win["level"], win["amount"], "87")
+            return wins
+
+        win = sas.sas_progressive_win_amount()
+        if win is not None and win["level"]:
+            self._hit(sas, win["group"], win["level"], win["amount"], "85")
+        return win
+
+    def on_progressive_win(self, sas):
+        """Read the progressive win after a 54 exception"""
+        win = sas.progressive_win_amount()
+        if win is not None:
+            self._hit(sas, win["group"], win["level"], win["amount"], "84")
+        return win
+
+    def on_no_progressive_info(self, sas=None):
+        """Broadcast every group again on the link of ``sas`` (every link by default)"""
+        log.warning("EGM reported no progressive information for 5 seconds")
+        with self._lock:
+            now = time.monotonic()
+            for link in self.links if sas is None else [sas]:
+                for group in self.groups:
+                    self._changed_at.setdefault((link, group), now)
@@ -0,0 +1,64 @@
+from igtsas import Sas
+from simulated_egm import LoopbackConnection, SimulatedEgm
+
+
+def _sas(connection, address):
+    return Sas("/dev/ttyS0", connection=connection, address=address, debug_level="CRITICAL")
+
+
+def test_single_level_acknowledged_by_address_12():
+    egm = SimulatedEgm(address=0x12)
+    sas = _sas(LoopbackConnection(egm), 0x12)
+
+    assert sas.receive_progressive_amount(0x01, 0x02, 123456, broadcast=False) is True
+    assert egm.progressive_levels == {(0x01, 0x02): 123456}
+
+
+def test_multiple_levels_acknowledged_by_address_12():
+    egm = SimulatedEgm(address=0x12)
+    sas = _sas(LoopbackConnection(egm), 0x12)
+
+    assert sas.receive_multiple_progressive_levels(0x03, {1: 5000, 2: 250000}, broadcast=False) is True
+    assert egm.progressive_levels == {(0x03, 1): 5000, (0x03, 2): 250000}
+
+
+def test_broadcast_reaches_every_egm():
+    egms = [SimulatedEgm(address=0x01), SimulatedEgm(address=0x12)]
+    sas = _sas(LoopbackConnection(egms), 0x01)
+
+    assert sas.receive_progressive_amount(0x01, 0x01, 9999) is True
+    assert sas.receive_multiple_progressive_levels(0x02, {1: 100, 3: 300}) is True
+    for egm in egms:
+        assert egm.progressive_levels == {(0x01, 1): 9999, (0x02, 1): 100, (0x02, 3): 300}
+        assert egm.bad_crc == 0
+
+
+def test_progressive_win_amount():
+    egm = SimulatedEgm(address=0x12)
+    sas = _sas(LoopbackConnection(egm), 0x12)
+    egm.hit_progressive(4, group=0x07, amount=1234567, sas=False)
+
+    assert sas.progressive_win_amount() == {"group": 0x07, "level": 4, "amount": 1234567}
+
+
+def test_sas_progressive_win_amount():
+    egm = SimulatedEgm(address=0x12)
+    sas = _sas(LoopbackConnection(egm), 0x12)
+    sas.receive_progressive_amount(0x01, 0x02, 500000, broadcast=False)
+    egm.hit_progressive(2)
+
+    assert sas.sas_progressive_win_amount() == {"group": 0x01, "level": 2, "amount": 500000}
+    assert sas.sas_progressive_win_amount()["level"] == 0
+
+
+def test_multiple_sas_progressive_win_amounts():
+    egm = SimulatedEgm(address=0x12)
+    sas = _sas(LoopbackConnection(egm), 0x12)
+    egm.hit_progressive(1, group=0x05, amount=2500)
+    egm.hit_progressive(3, group=0x05, amount=7500000)
+
+    assert sas.multiple_sas_progressive_win_amounts() == {
+        "group": 0x05,
+        "wins": [{"level": 1, "amount": 2500}, {"level": 3, "amount": 7500000}],
+    }
+    assert sas.multiple_sas_progressive_win_amounts() == {"group": 0x00, "wins": []}
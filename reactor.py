@@ -0,0 +1,405 @@
+import heapq
+import itertools
+import logging
+import os
+import selectors
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+
+import serial
+
+from error_handler import BadCommandIsRunning
+from utils import Crc
+
+log = logging.getLogger(__name__)
+
+# Line settings of the two kinds of write, as Sas._conf_event_port / Sas._conf_port set them
+EVENT_LINE = (serial.PARITY_NONE, serial.STOPBITS_TWO)
+WAKE_LINE = (serial.PARITY_MARK, serial.STOPBITS_ONE)
+BODY_LINE = (serial.PARITY_SPACE, serial.STOPBITS_ONE)
+
+# Seconds between two checks of the output queue while the wake-up bytes drain
+DRAIN_CHECK = 0.001
+
+IDLE = "idle"
+WAKING = "waking"  # Poll address and address written, waiting for them to leave the UART
+READING = "reading"
+
+
+class Request:
+    """One poll queued on a ``PortLink``; ``future`` gets the answer"""
+
+    __slots__ = ("address", "command", "size", "var_length", "no_response", "timeout", "general",
+                 "future", "frame", "buffer", "sent_at")
+
+    def __init__(self, address, command=None, size=1, var_length=False, no_response=False, timeout=None,
+                 general=False):
+        self.address = address
+        self.command = command
+        self.size = size
+        self.var_length = var_length
+        self.no_response = no_response
+        self.timeout = timeout
+        self.general = general
+        self.future = Future()
+        self.frame = None
+        self.buffer = bytearray()
+        self.sent_at = None
+
+    def expected(self):
+        """Bytes of the complete answer, None while the length byte has not arrived"""
+        if self.general or self.no_response:
+            return 1
+        if not self.var_length:
+            return self.size
+        if len(self.buffer) < 3:
+            return None
+        return 3 + self.buffer[2] + 2
+
+
+class PortLink:
+    """State machine of one serial port driven by a ``SasReactor``
+
+    Requests are served one at a time, in order. A long poll is written in
+    two steps like ``Sas._transmit``: poll address and EGM address with the
+    wake-up (mark) parity, then, once they have left the UART plus
+    ``wait_for_wake_up``, the body with space parity. The output queue of
+    the driver (``TIOCOUTQ``) is polled until it is empty, the non-blocking
+    equivalent of the ``flush`` (tcdrain) of ``Sas``: a USB adapter may hold
+    the bytes for its latency timer long after ``os.write`` returned. The answer is assembled from whatever the fd
+    returns and completed as soon as its length is reached (fixed ``size``
+    or the length byte of variable answers), so the time out only costs
+    when the EGM is really silent. Bytes arriving between two requests
+    (chirps) are counted in ``unsolicited`` and dropped.
+
+    Use ``SasReactor.add_port`` to create one.
+    """
+
+    def __init__(self, reactor, port, baudrate=19200, timeout=0.5, poll_address=0x82, wait_for_wake_up=0.0,
+                 metrics=None, connection=None):
+        self.reactor = reactor
+        self.port = port
+        self.baudrate = baudrate
+        self.timeout = timeout
+        self.poll_address = poll_address
+        self.wait_for_wake_up = wait_for_wake_up
+        self.metrics = metrics
+        # pyserial applies the termios settings (parity...), the reactor reads and writes the raw fd
+        self.connection = connection or serial.Serial(port=port, baudrate=baudrate, timeout=0)
+        self.fd = self.connection.fileno()
+        os.set_blocking(self.fd, False)
+        self.queue = deque()
+        self.state = IDLE
+        self.current = None
+        self.unsolicited = 0
+        self.completed = 0
+        self.timeouts = 0
+        self._line = None
+        self._out = b""
+        self._after_write = None
+        self._timer = None
+
+    # -- requests ---------------------------------------------------------
+
+    def submit(self, address, command, size=1, var_length=False, no_response=False, crc_need=True, timeout=None):
+        """Queue a long poll; same arguments as ``Sas._send_command``
+
+        Returns
+        -------
+        concurrent.futures.Future
+            The validated answer (command and data, no address nor CRC) like
+            ``Sas._send_command``, an int for ``no_response`` polls, None on
+            time out. A bad CRC or an answer to another command sets
+            ``BadCRC`` / ``BadCommandIsRunning``.
+        """
+        frame = [address] + list(command)
+        if crc_need:
+            frame += Crc.calculate(bytes(frame))
+        request = Request(address, list(command), size, var_length, no_response, timeout)
+        request.frame = bytes(frame)
+        self.reactor.call_soon(self._enqueue, request)
+        return request.future
+
+    def general_poll(self, address, timeout=None):
+        """Queue a general poll; the future gets the exception code ("3d") or None"""
+        request = Request(address, timeout=timeout, general=True)
+        self.reactor.call_soon(self._enqueue, request)
+        return request.future
+
+    def _enqueue(self, request):
+        self.queue.append(request)
+        if self.state == IDLE:
+            self._next()
+
+    # -- state machine ----------------------------------------------------
+
+    def _set_line(self, line):
+        # Every change is a tcsetattr, skip it when the line is already right
+        if line != self._line:
+            self.connection.parity, self.connection.stopbits = line
+            self._line = line
+
+    def _next(self):
+        while self.queue:
+            request = self.queue.popleft()
+            if request.future.set_running_or_notify_cancel():
+                break
+        else:
+            self.state, self.current = IDLE, None
+            return
+
+        self.current = request
+        self.connection.reset_input_buffer()
+        request.sent_at = time.monotonic()
+        if request.general:
+            self._set_line(EVENT_LINE)
+            self.state = READING
+            self._write(bytes([self.poll_address, 0x80 | request.address]), self._arm_timeout)
+        else:
+            self._set_line(WAKE_LINE)
+            self.state = WAKING
+            self._write(bytes([self.poll_address, request.address]), self._wake_written)
+
+    def _output_pending(self):
+        try:
+            return self.connection.out_waiting > 0
+        except (OSError, AttributeError):
+            return False
+
+    def _wake_written(self):
+        # The parity can only change once the wake-up bytes are on the wire
+        if self._output_pending():
+            if time.monotonic() - self.current.sent_at < self._timeout():
+                self._timer = self.reactor.call_later(DRAIN_CHECK, self._wake_written)
+            else:
+                self._timed_out()
+            return
+
+        # Out of the driver queue, the last bytes may still be in the UART
+        delay = 2 * 11 / self.baudrate + self.wait_for_wake_up
+        self._timer = self.reactor.call_later(delay, self._send_body)
+
+    def _send_body(self):
+        self._set_line(BODY_LINE)
+        self.state = READING
+        self._write(self.current.frame[1:], self._arm_timeout)
+
+    def _timeout(self):
+        return self.current.timeout if self.current.timeout is not None else self.timeout
+
+    def _arm_timeout(self):
+        self._timer = self.reactor.call_later(self._timeout(), self._timed_out)
+
+    def _write(self, data, then):
+        self._out, self._after_write = data, then
+        self._flush_out()
+
+    def _flush_out(self):
+        try:
+            written = os.write(self.fd, self._out)
+        except BlockingIOError:
+            written = 0
+        self._out = self._out[written:]
+        if self._out:
+            self.reactor.want_write(self, True)
+            return
+
+        self.reactor.want_write(self, False)
+        then, self._after_write = self._after_write, None
+        if then is not None:
+            then()
+
+    def on_writable(self):
+        if self._out:
+            self._flush_out()
+
+    def on_readable(self):
+        try:
+            data = os.read(self.fd, 4096)
+        except BlockingIOError:
+            return
+        if not data:
+            return
+
+        request = self.current
+        if request is None or self.state != READING:
+            self.unsolicited += len(data)
+            return
+
+        request.buffer += data
+        expected = request.expected()
+        if expected is not None and len(request.buffer) >= expected:
+            self.reactor.cancel(self._timer)
+            self._finish(bytes(request.buffer[:expected]))
+
+    def _timed_out(self):
+        self.timeouts += 1
+        self._finish(bytes(self.current.buffer), timed_out=True)
+
+    def _finish(self, response, timed_out=False):
+        request = self.current
+        elapsed = time.monotonic() - request.sent_at
+        result, error = None, None
+        try:
+            if request.general:
+                result = response[:1].hex() or None
+            elif request.no_response:
+                result = int(response.hex(), 16) if response and not timed_out else None
+            elif response and not timed_out:
+                if response[1:2] != bytes(request.command[:1]):
+                    raise BadCommandIsRunning(f"response {response.hex()} run {request.frame.hex()}")
+                result = Crc.validate(response)
+        except Exception as e:
+            error = e
+
+        self.completed += 1
+        if self.metrics is not None and not request.general:
+            self.metrics.poll(request.address, request.command[0], elapsed, error, timed_out and not response)
+        if error is not None:
+            request.future.set_exception(error)
+        else:
+            request.future.set_result(result)
+        self._next()
+
+    def close(self):
+        self.reactor.remove_port(self)
+        self.connection.close()
+
+
+class SasReactor:
+    """Drive the serial I/O of many SAS ports from one thread
+
+    Every port fd is non-blocking and registered in a selector (epoll on
+    Linux); the loop reads and writes whichever port is ready and runs the
+    timers (wake-up gaps, read deadlines), so a thread is no longer parked
+    in a blocking read per port. Work from other threads goes through
+    ``call_soon``, which wakes the loop.
+
+        reactor = SasReactor().start()
+        link = reactor.add_port("/dev/ttyUSB0", timeout=0.5)
+        code = link.general_poll(1).result()
+        credits = link.submit(1, [0x1A], size=8, crc_need=False).result()
+
+    Callbacks (``Future.add_done_callback``) run in the reactor thread and
+    must not block; they can queue the next polls.
+    """
+
+    def __init__(self):
+        self._selector = selectors.DefaultSelector()
+        self._timers = []
+        self._sequence = itertools.count()
+        self._calls = deque()
+        self._wake_read, self._wake_write = os.pipe()
+        os.set_blocking(self._wake_read, False)
+        os.set_blocking(self._wake_write, False)
+        self._selector.register(self._wake_read, selectors.EVENT_READ, None)
+        self._stop = threading.Event()
+        self._thread = None
+        self.ports = []
+
+    def add_port(self, port, **kwargs):
+        """Open ``port`` and return its ``PortLink`` (arguments: see ``PortLink``)"""
+        link = PortLink(self, port, **kwargs)
+        self.call_soon(self._register, link)
+        self.ports.append(link)
+        return link
+
+    def _register(self, link):
+        self._selector.register(link.fd, selectors.EVENT_READ, link)
+
+    def remove_port(self, link):
+        if link in self.ports:
+            self.ports.remove(link)
+            self.call_soon(self._selector.unregister, link.fd)
+
+    def want_write(self, link, enabled):
+        events = selectors.EVENT_READ | (selectors.EVENT_WRITE if enabled else 0)
+        if self._selector.get_key(link.fd).events != events:
+            self._selector.modify(link.fd, events, link)
+
+    # -- scheduling ---------------------------------------------------------
+
+    def call_soon(self, function, *args):
+        """Run ``function(*args)`` in the reactor thread (safe from any thread)"""
+        self._calls.append((function, args))
+        if threading.current_thread() is not self._thread:
+            try:
+                os.write(self._wake_write, b"\0")
+            except BlockingIOError:
+                pass  # The pipe is full, the loop is awake anyway
+
+    def call_later(self, delay, function, *args):
+        """Run ``function(*args)`` in ``delay`` seconds (reactor thread only); returns a handle for ``cancel``"""
+        timer = [time.monotonic() + delay, next(self._sequence), function, args]
+        heapq.heappush(self._timers, timer)
+        return timer
+
+    def cancel(self, timer):
+        if timer is not None:
+            timer[2] = None
+
+    def _run_calls(self):
+        for _ in range(len(self._calls)):
+            function, args = self._calls.popleft()
+            try:
+                function(*args)
+            except Exception as e:
+                log.error(f"Reactor call {function} failed: {e}", exc_info=True)
+
+    def _run_timers(self):
+        now = time.monotonic()
+        while self._timers and self._timers[0][0] <= now:
+            _, _, function, args = heapq.heappop(self._timers)
+            if function is None:
+                continue
+            try:
+                function(*args)
+            except Exception as e:
+                log.error(f"Reactor timer {function} failed: {e}", exc_info=True)
+
+    def run_once(self, max_wait=0.5):
+        self._run_calls()
+        wait = max_wait
+        if self._calls:
+            wait = 0
+        elif self._timers:
+            wait = min(max_wait, max(0.0, self._timers[0][0] - time.monotonic()))
+
+        for key, events in self._selector.select(wait):
+            if key.data is None:
+                try:
+                    while os.read(self._wake_read, 4096):
+                        pass
+                except BlockingIOError:
+                    pass
+                continue
+            try:
+                if events & selectors.EVENT_WRITE:
+                    key.data.on_writable()
+                if events & selectors.EVENT_READ:
+                    key.data.on_readable()
+            except Exception as e:
+                log.error(f"{key.data.port}: I/O failed: {e}", exc_info=True)
+
+        self._run_timers()
+
+    def run(self):
+        """Loop until ``stop``"""
+        self._thread = threading.current_thread()
+        while not self._stop.is_set():
+            self.run_once()
+
+    def start(self):
+        """Run the loop in a background thread"""
+        self._stop.clear()
+        self._thread = threading.Thread(target=self.run, name="sas-reactor", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self.call_soon(lambda: None)
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join()
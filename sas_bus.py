@@ -0,0 +1,250 @@
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import serial
+
+from igtsas import Sas
+from metrics import SasMetrics
+from utils.BusLock import BusLock
+
+log = logging.getLogger(__name__)
+
+# Poll address of the handles: 0x82 (Sas's default) is also the general poll of address 02
+POLL_ADDRESS = 0x80
+
+
+class DiscoveryCache:
+    """Addresses found on each port, kept in a JSON file between runs"""
+
+    def __init__(self, path=None):
+        self.path = path
+        self._lock = threading.Lock()
+        self._ports = {}
+        if self.path and os.path.exists(self.path):
+            with open(self.path, "r") as cache_file:
+                self._ports = json.load(cache_file)
+
+    def get(self, port):
+        with self._lock:
+            return list(self._ports.get(port, {}).get("addresses", []))
+
+    def set(self, port, addresses):
+        with self._lock:
+            self._ports[port] = {"addresses": list(addresses), "updated": time.time()}
+            if self.path:
+                tmp_path = self.path + ".tmp"
+                with open(tmp_path, "w") as cache_file:
+                    json.dump(self._ports, cache_file)
+                os.replace(tmp_path, self.path)
+
+
+class SasBus:
+    """One serial port shared by several EGMs (SAS multi-drop)
+
+    The bus owns the port and hands out one ``Sas`` handle per EGM address.
+    Every handle speaks through the same connection and the same
+    ``BusLock``, so handles can be used from different threads.
+
+        bus = SasBus("/dev/ttyUSB0")
+        bus.discover()
+        for address, code in bus.poll_round():
+            ...
+        bus.handle(3).send_meters_10_15()
+
+    Parameters
+    ----------
+    port : str
+        Serial port full address
+    timeout : float
+        Read timeout of the handles
+    baudrate : int
+    connection : serial.Serial, optional
+        Already open connection to use instead of opening ``port``
+    sas_kwargs :
+        Default ``Sas`` arguments for every handle (poll_address, denom, ...);
+        the poll address defaults to ``POLL_ADDRESS``. A poll address that is
+        the general poll of another EGM on the bus (0x82 with an EGM at 02)
+        is rejected, that EGM would answer it and lose its exceptions.
+    """
+
+    def __init__(self, port, timeout=2, baudrate=19200, connection=None, **sas_kwargs):
+        self.port = port
+        self.timeout = timeout
+        self.sas_kwargs = sas_kwargs
+        self.sas_kwargs.setdefault("poll_address", POLL_ADDRESS)
+        if connection is None:
+            connection = serial.Serial(port=port, baudrate=baudrate, timeout=timeout)
+        self.connection = connection
+        self.scheduler = BusLock()
+        if sas_kwargs.get("metrics") is not None:
+            SasMetrics(sas_kwargs["metrics"]).watch_bus(self.scheduler, port)
+        self.handles = {}
+        self.active = []
+        self._rotation = 0
+        self._prober = None
+
+    def handle(self, address, **kwargs):
+        """Return the ``Sas`` handle of the EGM at ``address`` (created on first use)"""
+        if address not in self.handles:
+            options = dict(self.sas_kwargs)
+            options.update(kwargs)
+            self._check_poll_address(options["poll_address"], set(self.active) | {address})
+            sas = Sas(
+                self.port,
+                timeout=self.timeout,
+                connection=self.connection,
+                address=address,
+                **options,
+            )
+            sas.scheduler = self.scheduler
+            self.handles[address] = sas
+
+        return self.handles[address]
+
+    @staticmethod
+    def _check_poll_address(poll_address, addresses):
+        """Reject a poll address that general polls one of several ``addresses``"""
+        if len(addresses) > 1 and poll_address & 0x7F in addresses:
+            raise ValueError(
+                f"Poll address {poll_address:02x} is the general poll of address {poll_address & 0x7F:02x} "
+                f"on a multi-drop bus, use {POLL_ADDRESS:02x}"
+            )
+
+    def _probe(self, address, timeout):
+        # One handle moved from address to address, always with POLL_ADDRESS: a
+        # configured 0x82 would make EGM 02 answer the probe of every address
+        if self._prober is None:
+            self._prober = Sas(
+                self.port,
+                timeout=self.timeout,
+                connection=self.connection,
+                poll_address=POLL_ADDRESS,
+                debug_level=self.sas_kwargs.get("debug_level", "DEBUG"),
+            )
+            self._prober.scheduler = self.scheduler
+        self._prober.address = address
+        try:
+            return self._prober.general_poll(timeout=timeout) is not None
+        except Exception as e:
+            log.debug(f"Address {address:02x}: {e}")
+            return False
+
+    def discover(self, addresses=range(0x01, 0x80), timeout=0.04, expected=None, cache=None, full_scan=False):
+        """General poll the candidate addresses and keep the ones that answer
+
+        Addresses found by a previous scan (``cache``) are probed first; when
+        all of them still answer the scan stops there unless ``full_scan``.
+        Otherwise the remaining candidates are probed with a short read
+        timeout, stopping as soon as ``expected`` EGMs were found. Probes
+        always use ``POLL_ADDRESS``, whatever the handles are configured with.
+
+        Parameters
+        ----------
+        addresses : iterable
+            Candidate addresses
+        timeout : float
+            Read timeout per address; SAS EGMs answer within 20 ms
+        expected : int, optional
+            Number of EGMs wired to the port, if known
+        cache : DiscoveryCache, optional
+        full_scan : bool
+            Probe every candidate even when the cached addresses all answer
+
+        Returns
+        -------
+        list
+            Active addresses
+        """
+        started = time.monotonic()
+        cached = cache.get(self.port) if cache is not None else []
+        found = [address for address in cached if self._probe(address, timeout)]
+
+        done = bool(cached) and len(found) == len(cached) and not full_scan
+        if expected is not None and len(found) >= expected:
+            done = True
+
+        if not done:
+            for address in addresses:
+                if address in cached:
+                    continue
+                if self._probe(address, timeout):
+                    found.append(address)
+                    if expected is not None and len(found) >= expected:
+                        break
+
+        self.active = sorted(found)
+        for address in self.active:
+            self._check_poll_address(self.handle(address).poll_address, self.active)
+        if cache is not None:
+            cache.set(self.port, self.active)
+
+        log.info(
+            f"{self.port}: active addresses {[f'{a:02x}' for a in self.active]} "
+            f"found in {time.monotonic() - started:.2f}s"
+        )
+        return self.active
+
+    def poll_round(self):
+        """One general poll per active address, starting one further each round
+
+        Yields
+        ------
+        tuple
+            (address, exception code or None)
+        """
+        if not self.active:
+            return
+
+        start = self._rotation % len(self.active)
+        self._rotation += 1
+        for address in self.active[start:] + self.active[:start]:
+            try:
+                yield address, self.handle(address).general_poll()
+            except Exception as e:
+                log.error(f"General poll of {address:02x} failed: {e}", exc_info=True)
+                yield address, None
+
+    def close(self):
+        self.connection.close()
+
+
+def discover_ports(ports, cache=None, bus_kwargs=None, **discover_kwargs):
+    """Open a ``SasBus`` per port and run their discovery in parallel threads
+
+    Parameters
+    ----------
+    ports : list
+        Serial ports full addresses
+    cache : DiscoveryCache, optional
+        Shared by every port
+    bus_kwargs : dict, optional
+        ``SasBus`` arguments
+    discover_kwargs :
+        ``SasBus.discover`` arguments
+
+    Returns
+    -------
+    dict
+        {port: SasBus} for the ports that could be opened
+    """
+    bus_kwargs = bus_kwargs or {}
+
+    def scan(port):
+        bus = SasBus(port, **bus_kwargs)
+        bus.discover(cache=cache, **discover_kwargs)
+        return bus
+
+    buses = {}
+    with ThreadPoolExecutor(max_workers=max(1, len(ports))) as pool:
+        futures = {port: pool.submit(scan, port) for port in ports}
+        for port, future in futures.items():
+            try:
+                buses[port] = future.result()
+            except Exception as e:
+                log.error(f"Discovery on {port} failed: {e}")
+
+    return buses
@@ -0,0 +1,78 @@
+import pytest
+
+from igtsas import Sas
+from sas_bus import SasBus
+from simulated_egm import LoopbackConnection, PtyEgmServer, PtySerial, SimulatedEgm
+from utils.ModelProfiles import ModelProfiles
+
+ADDRESSES = [1, 2, 5]
+
+
+@pytest.fixture
+def port():
+    server = PtyEgmServer()
+    port = server.add([SimulatedEgm(address=address) for address in ADDRESSES])
+    server.start()
+    yield port
+    server.stop()
+
+
+def _bus(port, **kwargs):
+    return SasBus(port, timeout=0.5, connection=PtySerial(port, baudrate=19200, timeout=0.5),
+                  debug_level="ERROR", **kwargs)
+
+
+def test_discover_sparse_addresses_with_address_2(port):
+    bus = _bus(port)
+    try:
+        assert bus.discover(range(1, 12), timeout=0.1) == ADDRESSES
+        assert [address for address, _ in bus.poll_round()] == ADDRESSES
+    finally:
+        bus.close()
+
+
+def test_poll_address_of_an_egm_on_the_bus_is_rejected(port):
+    bus = _bus(port, poll_address=0x82)
+    try:
+        with pytest.raises(ValueError):
+            bus.discover(range(1, 12), timeout=0.1)
+    finally:
+        bus.close()
+
+
+def test_discover_address_of_the_egm_at_address_2():
+    sas = Sas("test", connection=LoopbackConnection(SimulatedEgm(address=2)), debug_level="CRITICAL")
+
+    assert sas.discover_address() == "02"
+    assert sas.poll_address == 0x82
+
+
+def _profiles():
+    profiles = ModelProfiles()
+    profiles.put("AT000/000001/602", {"poll_address": 0x80, "wait_for_wake_up": 0.002})
+    return profiles
+
+
+def test_bus_handle_identified_on_first_poll():
+    connection = LoopbackConnection([SimulatedEgm(address=address) for address in ADDRESSES])
+    bus = SasBus("test", connection=connection, debug_level="CRITICAL", profiles=_profiles())
+    sas = bus.handle(5)
+
+    assert sas.model is None
+    assert sas.general_poll() is not None
+    assert sas.model["key"] == "AT000/000001/602"
+    assert (sas.poll_address, sas.wait_for_wake_up) == (0x80, 0.002)
+
+
+def test_silent_egm_not_identified_on_every_poll(monkeypatch):
+    sas = Sas("test", connection=LoopbackConnection(SimulatedEgm(address=1)), address=7,
+              debug_level="CRITICAL", profiles=_profiles())
+    calls = []
+    identify = sas.identify
+    monkeypatch.setattr(sas, "identify", lambda timeout: calls.append(timeout) or identify(timeout))
+
+    for _ in range(3):
+        sas.general_poll(timeout=0.01)
+
+    assert sas.model is None
+    assert len(calls) == 1
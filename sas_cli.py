@@ -0,0 +1,64 @@
+import argparse
+import json
+import sys
+
+from igtsas import Sas
+from config_handler import configHandler
+
+
+def build_sas(config_handler):
+    return Sas(
+        port=config_handler.get_config_value("connection", "serial_port"),
+        timeout=config_handler.get_config_value("connection", "timeout"),
+        poll_address=config_handler.get_config_value("events", "poll_address"),
+        denom=config_handler.get_config_value("machine", "denomination"),
+        asset_number=config_handler.get_config_value("machine", "asset_number"),
+        reg_key=config_handler.get_config_value("machine", "reg_key"),
+        pos_id=config_handler.get_config_value("machine", "pos_id"),
+        key=config_handler.get_config_value("security", "key"),
+        debug_level="ERROR",
+        perpetual=config_handler.get_config_value("connection", "infinite"),
+        profiles=config_handler.get_config_value("events", "profiles"),
+    )
+
+
+# Single machine actions run by the fleet executor, one per invocation
+ACTIONS = {
+    "meters": lambda sas, args: sas.send_meters_10_15(),
+    "startup": lambda sas, args: sas.startup(),
+    "shutdown": lambda sas, args: sas.shutdown(),
+    "enable_bill_acceptor": lambda sas, args: sas.enable_bill_acceptor(),
+    "disable_bill_acceptor": lambda sas, args: sas.disable_bill_acceptor(),
+    "enable_game": lambda sas, args: sas.en_dis_game(args.game, en_dis=True),
+    "disable_game": lambda sas, args: sas.en_dis_game(args.game, en_dis=False),
+}
+
+# Actions that need --game
+GAME_ACTIONS = {"enable_game", "disable_game"}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run one SAS action and print its result as JSON")
+    parser.add_argument("action", choices=sorted(ACTIONS))
+    parser.add_argument("--game", type=int, default=None, help="game number for enable/disable_game")
+    parser.add_argument("--config", default="/home/hercules/TWLVGaming/sasprotocol/config.yml")
+    args = parser.parse_args(argv)
+    if args.action in GAME_ACTIONS and args.game is None:
+        parser.error(f"--game is required for {args.action}")
+
+    config_handler = configHandler(args.config)
+    config_handler.read_config_file()
+
+    sas = build_sas(config_handler)
+    try:
+        sas.start()
+        result = ACTIONS[args.action](sas, args)
+    finally:
+        sas.close()
+
+    print(json.dumps({"action": args.action, "result": result}, default=str))
+    return 0 if result not in (None, False) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
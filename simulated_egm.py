@@ -0,0 +1,776 @@
+import datetime
+import logging
+import os
+import random
+import selectors
+import threading
+import time
+import tty
+from collections import deque
+
+import serial
+
+log = logging.getLogger(__name__)
+
+# Single meter long polls answered as [address, command, 4 BCD bytes, CRC]
+SINGLE_METERS = {
+    0x10: "cancelled_credits",
+    0x11: "coin_in",
+    0x12: "coin_out",
+    0x13: "drop",
+    0x14: "jackpot",
+    0x15: "games_played",
+    0x16: "games_won",
+    0x17: "games_lost",
+    0x1A: "credits",
+    0x2A: "true_coin_in",
+    0x2B: "true_coin_out",
+    0x2C: "hopper_level",
+    0x2D: "hand_paid_cancelled_credits",
+}
+
+# Long polls acknowledged with the address byte (type S)
+ACK_COMMANDS = {0x01, 0x02, 0x03, 0x04, 0x05, 0x06, 0x07, 0x08, 0x09, 0x0A, 0x0B, 0x0E, 0x2E, 0x4C, 0x7F, 0x80, 0x86}
+
+# GPoll codes of the bills the simulator accepts, by value in dollars
+BILL_CODES = {1: 0x47, 2: 0x4D, 5: 0x48, 10: 0x49, 20: 0x4A, 50: 0x4B, 100: 0x4C}
+
+# Faults the simulator can inject in its answers, see SimulatedEgm(faults=...)
+FAULTS = ("corrupt_crc", "truncate", "wrong_command", "silence", "chirp", "delay", "overflow")
+# Faults that make sense on a one byte answer (general poll, ACK)
+SHORT_ANSWER_FAULTS = ("silence", "chirp", "delay", "overflow")
+
+
+def _crc_table():
+    table = []
+    for i in range(256):
+        value = i
+        for _ in range(8):
+            value = (value >> 1) ^ 0x8408 if value & 1 else value >> 1
+        table.append(value)
+    return table
+
+
+_CRC_TABLE = _crc_table()
+
+
+def crc(payload):
+    """SAS CRC-16 (Kermit) as 2 bytes, LSB first
+
+    The EGM side computes its CRC independently of ``utils.Crc`` so the
+    simulator also checks the library's implementation.
+    """
+    value = 0
+    for byte in payload:
+        value = (value >> 8) ^ _CRC_TABLE[(value ^ byte) & 0xFF]
+    return bytes([value & 0xFF, value >> 8])
+
+
+def bcd(value, length):
+    digits = str(int(value)).rjust(length * 2, "0")[-length * 2:]
+    return bytes.fromhex(digits)
+
+
+class SimulatedEgm:
+    """A gaming machine speaking SAS, for benchmarks and load tests without hardware
+
+    The EGM answers general polls from its exception queue and the common
+    long polls (meters, credits, game info, date/time, handpay, system
+    validation, enhanced validation buffer, ticket in, AFT lock and status / interrogation / in-house transfers)
+    with frames built like
+    a real machine's. Play activity (games, bills, tickets, doors) updates
+    the meters and queues the matching exceptions; ``tick`` generates it at
+    random.
+
+    Bytes are consumed with ``receive`` and the answer is returned. The
+    host's wake-up / address / body writes may arrive separately or merged
+    in one chunk, see ``receive``.
+
+    Parameters
+    ----------
+    address : int
+        SAS address, 1 - 127
+    asset_number : int
+    serial : str
+        Up to 12 characters, reported by 54
+    game_id : str
+        2 characters, reported by 1F
+    exception_buffer : int
+        Queued exceptions kept before a 70 (exception buffer overflow)
+    seed : int, optional
+        Seed of the activity generator
+    faults : dict, optional
+        Probability of each fault (see ``FAULTS``) per answer, i.e. {"corrupt_crc": 0.01}:
+
+        * corrupt_crc - last CRC byte flipped
+        * truncate - answer cut short
+        * wrong_command - valid frame echoing another command
+        * silence - no answer
+        * chirp - stray address byte before the answer
+        * delay - the end of the answer comes ``fault_delay`` seconds later
+        * overflow - the exception queue is flooded up to a 70 (buffer overflow)
+    fault_delay : float
+        Seconds of the delay fault
+    wake_up : float
+        Seconds the EGM needs between its address and the long poll body;
+        a body arriving sooner is missed (no answer), like a slow machine
+    poll_addresses : tuple, optional
+        Poll address prefixes the EGM accepts before a long poll, any by default
+    validation_acks : bool
+        Refuse to print tickets once the 31 entries of the validation buffer
+        are waiting for a host acknowledgment (4D 00), like a real machine;
+        off by default so hosts that never read the buffer keep printing
+    """
+
+    def __init__(self, address=1, asset_number=1, serial="SIM000000001", game_id="AT",
+                 exception_buffer=20, seed=None, faults=None, fault_delay=0.05, wake_up=0.0, poll_addresses=None,
+                 validation_acks=False):
+        self.address = address
+        self.asset_number = asset_number
+        self.serial = serial
+        self.game_id = game_id
+        self.exceptions = deque()
+        self.exception_buffer = exception_buffer
+        self.meters = {name: 0 for name in SINGLE_METERS.values()}
+        self.meters.update(total_bet=0, total_win=0, games_since_power_up=0, games_since_door_close=0)
+        self.selected_game = 1
+        self.handpay = None
+        self.pending_cashout = None  # (cashout type, amount in cents) waiting for system validation
+        self.validation_numbers = []  # (system id, validation number) received with 58
+        self.validation_buffer = deque(maxlen=0x1F)  # 4D entries (index, system id, number, amount, time)
+        self.validation_index = 0
+        self.unread_validations = deque()  # Indexes not acknowledged by the host yet
+        self.validation_sent = None  # Index sent by the last 4D 00, acknowledged by the next one
+        self.validation_acks = validation_acks
+        self.ticket_in = None  # [validation data (18 digits), machine status] of the ticket inserted
+        self.refused_tickets = 0
+        self.aft_history = deque(maxlen=0x7F)
+        self.aft_index = 0
+        self.progressive_levels = {}  # (group, level): amount in cents received with 80/86
+        self.progressive_wins = deque()  # (group, level, amount) SAS progressive wins not read by 85/87 yet
+        self.progressive_win = None  # (group, level, amount) of the last non SAS progressive win (84)
+        self.broadcast_pending = False  # Broadcast address received, its body comes in the next chunk
+        self.random = random.Random(seed)
+        self.selected = False
+        self.selected_at = None
+        self.wake_up = wake_up
+        self.poll_addresses = poll_addresses
+        self.missed = 0
+        self.polls = 0
+        self.long_polls = 0
+        self.broadcasts = 0
+        self.bad_crc = 0
+        unknown = set(faults or ()) - set(FAULTS)
+        if unknown:
+            raise ValueError(f"Unknown faults {sorted(unknown)}, expected some of {FAULTS}")
+        self.faults = dict(faults or {})
+        self.fault_delay = fault_delay
+        self.injected = dict.fromkeys(FAULTS, 0)
+        self.held = deque()  # (release time, bytes) of the delayed answers
+        self._lock = threading.Lock()
+
+    # -- activity ---------------------------------------------------------
+
+    def queue_exception(self, code):
+        with self._lock:
+            if len(self.exceptions) >= self.exception_buffer:
+                if self.exceptions[-1] != 0x70:
+                    self.exceptions.append(0x70)
+                return
+            self.exceptions.append(code)
+
+    def play(self, bet=None):
+        """Play one game; returns False when the credits do not cover the bet"""
+        bet = bet if bet is not None else self.random.choice((1, 2, 3, 5))
+        if self.meters["credits"] < bet:
+            return False
+
+        win = self.random.choice((0, 0, 0, bet, bet * 2, bet * 5)) if self.random.random() < 0.9 else bet * 20
+        self.queue_exception(0x7E)
+        m = self.meters
+        m["credits"] += win - bet
+        m["coin_in"] += bet
+        m["coin_out"] += win
+        m["total_bet"] += bet
+        m["total_win"] += win
+        m["games_played"] += 1
+        m["games_since_power_up"] += 1
+        m["games_since_door_close"] += 1
+        m["games_won" if win else "games_lost"] += 1
+        self.queue_exception(0x7F)
+        return True
+
+    def insert_bill(self, dollars=20, denom=0.01):
+        credits = int(round(dollars / denom))
+        self.meters["credits"] += credits
+        self.meters["drop"] += credits
+        self.queue_exception(BILL_CODES.get(dollars, 0x4F))
+
+    def cash_out(self):
+        """Print a ticket for the credits on the machine"""
+        if not self.meters["credits"]:
+            return
+        if self.validation_acks and len(self.unread_validations) >= self.validation_buffer.maxlen:
+            # Validation buffer full of entries the host never acknowledged: no ticket
+            self.refused_tickets += 1
+            return
+        self._print_ticket(0x00, f"{self.random.randrange(10 ** 16):016d}")
+
+    def _print_ticket(self, system_id, validation_number):
+        amount = self.meters["credits"]
+        self.meters["cancelled_credits"] += amount
+        self.meters["credits"] = 0
+        self.validation_index = self.validation_index % 0x1F + 1
+        self.validation_buffer.append(
+            (self.validation_index, system_id, validation_number, amount, datetime.datetime.now())
+        )
+        if self.validation_index in self.unread_validations:
+            self.unread_validations.remove(self.validation_index)  # Overwritten unread
+        self.unread_validations.append(self.validation_index)
+        self.queue_exception(0x66)
+        self.queue_exception(0x3D)
+
+    def open_door(self):
+        self.queue_exception(0x11)
+
+    def close_door(self):
+        self.meters["games_since_door_close"] = 0
+        self.queue_exception(0x12)
+
+    def hit_handpay(self, amount):
+        self.handpay = amount
+        self.queue_exception(0x51)
+
+    def hit_progressive(self, level, group=1, amount=None, sas=True):
+        """Hit a progressive level (amount in cents, the last one received by default)
+
+        A SAS progressive win waits for 85/87 behind a 56 exception, any other
+        one is reported by 84 behind a 54.
+        """
+        if amount is None:
+            amount = self.progressive_levels.get((group, level), 0)
+        if sas:
+            self.progressive_wins.append((group, level, amount))
+            self.queue_exception(0x56)
+        else:
+            self.progressive_win = (group, level, amount)
+            self.queue_exception(0x54)
+
+    def request_validation(self, cashout_type=0x00):
+        """Cash out with system validation: the ticket waits for a 58 from the host"""
+        self.pending_cashout = (cashout_type, self.meters["credits"])
+        self.queue_exception(0x57)
+
+    def insert_ticket(self, validation_data, reject=None):
+        """Insert a ticket (18 digits: system ID and validation number); it waits in escrow for a 71
+
+        ``reject`` is the 80-8F status the EGM answers instead of redeeming
+        an authorized ticket (i.e. over its credit limit).
+        """
+        self.ticket_in = [validation_data, 0x20, reject]
+        self.queue_exception(0x67)
+
+    def _ticket_frame(self, command, status, amount=0):
+        validation_data = self.ticket_in[0] if self.ticket_in else "0" * 18
+        return self._var_frame(command, bytes([status]) + bcd(amount, 5) + bytes([0x00])
+                               + bytes.fromhex(validation_data))
+
+    def _redeem(self, body):
+        """71 answer: FF = current status, otherwise the host's transfer code for the ticket in escrow"""
+        if self.ticket_in is None:
+            return self._var_frame(0x71, bytes([0x00]))
+        code = body[2]
+        if code == 0xFF:
+            return self._ticket_frame(0x71, self.ticket_in[1])
+        if self.ticket_in[1] != 0x20:
+            return self._ticket_frame(0x71, self.ticket_in[1])
+
+        if code < 0x80 and self.ticket_in[2] is not None:
+            code = self.ticket_in[2]
+        amount = int(body[3:8].hex()) if code < 0x80 else 0
+        if code < 0x80:
+            self.meters["credits"] += amount
+            self.meters["drop"] += amount
+        # 00 = redeemed, 80-8F = rejected with the host's reason
+        self.ticket_in[1] = 0x00 if code < 0x80 else code
+        self.queue_exception(0x68)
+        return self._ticket_frame(0x71, 0x40, amount)
+
+    def tick(self, play=0.8, bill=0.05, cash_out=0.03, door=0.005):
+        """One step of random activity, each action with the given probability"""
+        r = self.random.random
+        if r() < bill or self.meters["credits"] < 5:
+            self.insert_bill(self.random.choice((1, 5, 10, 20)))
+        if r() < play:
+            self.play()
+        if r() < cash_out:
+            self.cash_out()
+        if r() < door:
+            self.open_door()
+            self.close_door()
+
+    # -- protocol ---------------------------------------------------------
+
+    def _frame(self, command, body=b""):
+        payload = bytes([self.address, command]) + body
+        return payload + crc(payload)
+
+    def _var_frame(self, command, body):
+        return self._frame(command, bytes([len(body)]) + body)
+
+    def general_poll(self):
+        self.polls += 1
+        with self._lock:
+            return bytes([self.exceptions.popleft() if self.exceptions else 0x00])
+
+    def _aft_record(self, entry):
+        position, status, transfer_type, cashable, restricted, nonrestricted, transaction_id, when = entry
+        return (
+            bytes([position, status, 0x00, transfer_type])
+            + bcd(cashable, 5) + bcd(restricted, 5) + bcd(nonrestricted, 5)
+            + bytes([0x00]) + self.asset_number.to_bytes(4, "little")
+            + bytes([len(transaction_id)]) + transaction_id
+            + bytes.fromhex(when.strftime("%m%d%Y%H%M%S"))
+            + bcd(0, 4) + bcd(0, 2)
+        )
+
+    def _aft(self, body):
+        code = body[2]
+        if code == 0xFF:
+            # Interrogation of the history buffer (00 = current / most recent)
+            index = body[3] if len(body) > 3 else 0
+            if index == 0:
+                index = self.aft_index
+            entry = next((e for e in self.aft_history if e[0] == index), None)
+            if entry is None:
+                return self._var_frame(0x72, bytes([index, 0xFF]))
+            return self._var_frame(0x72, self._aft_record(entry))
+
+        if code in (0x00, 0x01) and len(body) >= 47:
+            id_length = body[45]
+            entry = self.aft_transfer(
+                int(body[5:10].hex()), int(body[10:15].hex()), int(body[15:20].hex()),
+                transfer_type=body[4], transaction_id=bytes(body[46:46 + id_length]),
+            )
+            return self._var_frame(0x72, self._aft_record(entry))
+
+        return self._var_frame(0x72, bytes([self.aft_index, 0x40]))
+
+    def _progressive_levels(self, body):
+        """Store the level amounts of an 80 (single level) or 86 (multiple levels) frame"""
+        if body[0] == 0x80:
+            self.progressive_levels[(body[1], body[2])] = int(body[3:8].hex())
+            return
+        group, levels = body[2], body[3:2 + body[1]]
+        for pos in range(0, len(levels) - 5, 6):
+            self.progressive_levels[(group, levels[pos])] = int(levels[pos + 1:pos + 6].hex())
+
+    def _progressive_wins(self):
+        """87 answer: every pending win of the oldest group, none = group and count 00"""
+        group = self.progressive_wins[0][0] if self.progressive_wins else 0
+        wins = [win for win in self.progressive_wins if win[0] == group]
+        for win in wins:
+            self.progressive_wins.remove(win)
+        body = bytes([group, len(wins)]) + b"".join(bytes([level]) + bcd(amount, 5) for _, level, amount in wins)
+        return self._var_frame(0x87, body)
+
+    def _broadcast(self, body):
+        """Process a long poll sent to address 00 (never answered)"""
+        if len(body) < 3 or crc(bytes([0x00]) + bytes(body[:-2])) != bytes(body[-2:]):
+            self.bad_crc += 1
+            return
+        if body[0] in (0x80, 0x86):
+            self._progressive_levels(body)
+
+    def _validation_info(self, code):
+        """4D answer: 00 = oldest unread entry (acknowledging the previous one), FF = look ahead, 01-1F = index"""
+        if code == 0x00:
+            if self.validation_sent is not None and self.validation_sent in self.unread_validations:
+                self.unread_validations.remove(self.validation_sent)
+            self.validation_sent = self.unread_validations[0] if self.unread_validations else None
+            index = self.validation_sent
+        elif code == 0xFF:
+            index = self.unread_validations[0] if self.unread_validations else None
+        else:
+            index = code
+
+        entry = next((e for e in self.validation_buffer if e[0] == index), None)
+        if entry is None:
+            return self._frame(0x4D, bytes(31))
+        index, system_id, number, amount, when = entry
+        return self._frame(
+            0x4D,
+            bytes([0x00, index]) + bytes.fromhex(when.strftime("%m%d%Y%H%M%S")) + bytes.fromhex(number)
+            + bcd(amount, 5) + bcd(index, 2) + bytes([system_id]) + bytes(4) + bytes(2),
+        )
+
+    def aft_transfer(self, cashable, restricted=0, nonrestricted=0, transfer_type=0x00, transaction_id=None):
+        """Complete an AFT transfer (amounts in cents) as if the host had sent it; returns the history entry"""
+        if transaction_id is None:
+            transaction_id = f"SIM{self.random.getrandbits(32):08X}".encode()
+        if transfer_type < 0x80:
+            self.meters["credits"] += cashable + restricted + nonrestricted
+        self.aft_index = self.aft_index % 0x7F + 1
+        entry = (self.aft_index, 0x00, transfer_type, cashable, restricted, nonrestricted,
+                 transaction_id, datetime.datetime.now())
+        self.aft_history.append(entry)
+        self.queue_exception(0x69)
+        return entry
+
+    def long_poll(self, body):
+        """Answer the long poll ``body`` (command, data, CRC when present); None = no answer"""
+        self.long_polls += 1
+        command = body[0]
+        m = self.meters
+
+        if len(body) >= 3:
+            if crc(bytes([self.address]) + bytes(body[:-2])) != bytes(body[-2:]):
+                self.bad_crc += 1
+                return None
+
+        if command in (0x80, 0x86):
+            self._progressive_levels(body)
+        if command in ACK_COMMANDS:
+            return bytes([self.address])
+        if command in SINGLE_METERS:
+            return self._frame(command, bcd(m[SINGLE_METERS[command]], 4))
+        if command == 0x0F:
+            values = (m["cancelled_credits"], m["coin_in"], m["coin_out"], m["drop"], m["jackpot"], m["games_played"])
+            return self._frame(0x0F, b"".join(bcd(v, 4) for v in values))
+        if command == 0x18:
+            return self._frame(0x18, bcd(m["games_since_power_up"], 2) + bcd(m["games_since_door_close"], 2))
+        if command == 0x19:
+            values = (m["total_bet"], m["total_win"], m["drop"], m["jackpot"], m["games_played"])
+            return self._frame(0x19, b"".join(bcd(v, 4) for v in values))
+        if command == 0x1B:
+            amount = self.handpay or 0
+            return self._frame(0x1B, bytes([0, 0x40 if amount else 0]) + bcd(amount, 5) + bcd(0, 2) + bytes(11))
+        if command == 0x1F:
+            return self._frame(
+                0x1F,
+                self.game_id.encode()[:2].ljust(2) + b"000" + bytes([0x01, 0x05, 0x00]) + bytes(2)
+                + b"000001" + b"9500",
+            )
+        if command == 0x54:
+            return self._var_frame(0x54, b"602" + self.serial.encode()[:12].ljust(12))
+        if command == 0x55:
+            return self._frame(0x55, bcd(self.selected_game, 2))
+        if command == 0x57:
+            # 80 = not waiting for system validation
+            cashout_type, amount = self.pending_cashout or (0x80, 0)
+            return self._frame(0x57, bytes([cashout_type]) + bcd(amount, 5))
+        if command == 0x58:
+            if self.pending_cashout is None:
+                return self._frame(0x58, bytes([0x80]))
+            self.validation_numbers.append((body[1], body[2:10].hex()))
+            self.pending_cashout = None
+            if body[1]:
+                self._print_ticket(body[1], body[2:10].hex())
+            return self._frame(0x58, bytes([0x00]))
+        if command == 0x4D:
+            return self._validation_info(body[1])
+        if command == 0x70:
+            if self.ticket_in is None or self.ticket_in[1] != 0x20:
+                return self._var_frame(0x70, bytes([0xFF]))
+            return self._ticket_frame(0x70, 0x00)
+        if command == 0x71:
+            return self._redeem(body)
+        if command == 0x84:
+            group, level, amount = self.progressive_win or (0, 0, 0)
+            return self._frame(0x84, bytes([group, level]) + bcd(amount, 5))
+        if command == 0x85:
+            # Level 00 = no SAS progressive win pending
+            group, level, amount = self.progressive_wins.popleft() if self.progressive_wins else (0, 0, 0)
+            return self._frame(0x85, bytes([group, level]) + bcd(amount, 5))
+        if command == 0x87:
+            return self._progressive_wins()
+        if command == 0x7E:
+            return self._frame(0x7E, bytes.fromhex(datetime.datetime.now().strftime("%m%d%Y%H%M%S")))
+        if command == 0x74:
+            lock_body = (
+                self.asset_number.to_bytes(4, "little")
+                + bytes([0xFF, 0x07, 0x00, 0x80, 0x7F])
+                + bcd(m["credits"], 5) + bcd(0, 5) + bcd(0, 5) + bcd(0, 3) + bcd(0, 2)
+            )
+            return self._var_frame(0x74, lock_body)
+        if command == 0x72:
+            return self._aft(body)
+        if command == 0x94 and self.handpay:
+            self.handpay = None
+            self.queue_exception(0x52)
+            return bytes([self.address])
+
+        return None
+
+    # -- faults -----------------------------------------------------------
+
+    def _inject(self, answer):
+        """Apply at most one of the configured faults to ``answer``"""
+        if not self.faults or not answer:
+            return answer
+
+        modes = FAULTS if len(answer) > 2 else SHORT_ANSWER_FAULTS
+        r = self.random.random()
+        for mode in modes:
+            r -= self.faults.get(mode, 0)
+            if r < 0:
+                break
+        else:
+            return answer
+
+        self.injected[mode] += 1
+        if mode == "silence":
+            return b""
+        if mode == "corrupt_crc":
+            return answer[:-1] + bytes([answer[-1] ^ 0xFF])
+        if mode == "truncate":
+            return answer[:self.random.randrange(1, len(answer))]
+        if mode == "wrong_command":
+            payload = answer[:1] + bytes([answer[1] ^ 0x01]) + answer[2:-2]
+            return payload + crc(payload)
+        if mode == "chirp":
+            return bytes([self.address]) + answer
+        if mode == "delay":
+            cut = self.random.randrange(0, len(answer))
+            self.held.append((time.monotonic() + self.fault_delay, answer[cut:]))
+            return answer[:cut]
+
+        # overflow: the host falls behind a burst of events
+        for _ in range(self.exception_buffer + 1):
+            self.queue_exception(0x7E)
+        return answer
+
+    def release(self, now=None):
+        """Delayed bytes due by ``now``, in order"""
+        now = time.monotonic() if now is None else now
+        released = b""
+        while self.held and self.held[0][0] <= now:
+            released += self.held.popleft()[1]
+        return released
+
+    def next_release(self):
+        """Time the next delayed bytes are due, None if nothing is held"""
+        return self.held[0][0] if self.held else None
+
+    def receive(self, data):
+        """Consume bytes sent by the host and return the answer (possibly empty)
+
+        A byte with the wake-up bit set is a general poll when it is the last
+        one of the chunk and carries this address; otherwise it is the poll
+        address prefix of a long poll and is skipped. The address byte
+        selects the EGM; the long poll body follows in the same chunk or in
+        the next one (only the next one, ``wake_up`` seconds later at least,
+        for a slow EGM). Chunks starting with address 00 are broadcasts, their
+        body may also come in the next chunk.
+        Configured faults are applied to the answer; the delayed part of an
+        answer is then returned by ``release``.
+        """
+        data = bytes(data)
+        if self.broadcast_pending:
+            self.broadcast_pending = False
+            self._broadcast(data)
+            return b""
+        if self.selected:
+            self.selected = False
+            if time.monotonic() - self.selected_at < self.wake_up:
+                self.missed += 1
+                return b""
+            return self._inject(self.long_poll(data) or b"")
+
+        i = 0
+        while i < len(data) and data[i] & 0x80:
+            if i == len(data) - 1 and data[i] == 0x80 | self.address:
+                return self._inject(self.general_poll())
+            i += 1
+
+        if i >= len(data):
+            return b""
+        if data[i] == 0x00:
+            self.broadcasts += 1
+            if i + 1 < len(data):
+                self._broadcast(data[i + 1:])
+            else:
+                self.broadcast_pending = True
+            return b""
+        if data[i] != self.address:
+            return b""
+        if self.poll_addresses is not None and (i == 0 or data[i - 1] not in self.poll_addresses):
+            self.missed += 1
+            return b""
+
+        body = data[i + 1:]
+        if not body:
+            self.selected, self.selected_at = True, time.monotonic()
+            return b""
+        if self.wake_up > 0:
+            self.missed += 1
+            return b""
+        return self._inject(self.long_poll(body) or b"")
+
+
+class LoopbackConnection:
+    """In-process serial connection to simulated EGMs (a multi-drop bus without wires)
+
+    Every write is handed to each EGM; their answers are buffered and
+    returned by ``read``. A read never waits: when fewer bytes than asked
+    are available it returns what there is, like a timed out serial read,
+    unless ``simulate_timeouts`` is set. With ``wire_speed`` every byte costs
+    its transmission time at ``baudrate`` (11 bits per byte).
+    """
+
+    def __init__(self, egms, wire_speed=False, simulate_timeouts=False, baudrate=19200):
+        self.egms = list(egms) if isinstance(egms, (list, tuple)) else [egms]
+        self.wire_speed = wire_speed
+        self.simulate_timeouts = simulate_timeouts
+        self.baudrate = baudrate
+        self.timeout = 2
+        self.parity = "N"
+        self.stopbits = 1
+        self.is_open = True
+        self._rx = bytearray()
+
+    def _wire(self, count):
+        if self.wire_speed:
+            time.sleep(count * 11 / self.baudrate)
+
+    def write(self, data):
+        data = bytes(data)
+        self._wire(len(data))
+        for egm in self.egms:
+            self._rx += egm.receive(data)
+        return len(data)
+
+    def _release(self):
+        for egm in self.egms:
+            self._rx += egm.release()
+
+    def read(self, size=1):
+        self._release()
+        if len(self._rx) < size:
+            # Delayed bytes (fault injection) due before the timeout are waited for
+            due = [at for at in (egm.next_release() for egm in self.egms) if at is not None]
+            if due and min(due) - time.monotonic() <= (self.timeout or 0):
+                time.sleep(max(0.0, min(due) - time.monotonic()))
+                self._release()
+
+        data = bytes(self._rx[:size])
+        del self._rx[:size]
+        self._wire(len(data))
+        if len(data) < size and self.simulate_timeouts and self.timeout:
+            time.sleep(self.timeout)
+        return data
+
+    def open(self):
+        self.is_open = True
+
+    def close(self):
+        self.is_open = False
+
+    def flush(self):
+        pass
+
+    def reset_input_buffer(self):
+        self._rx.clear()
+
+    def reset_output_buffer(self):
+        pass
+
+    def send_break(self, duration=0.25):
+        pass
+
+
+class PtySerial(serial.Serial):
+    """pyserial port for the host side of a ``PtyEgmServer`` pty
+
+    Linux pseudo terminals reject the mark / space parity used for the SAS
+    wake-up bit. The parity is still tracked (and recorded by captures) but
+    the pty is configured without it. A pty cannot send a break either:
+    ``send_break`` only takes its duration, like the break of a real UART.
+
+        sas = Sas(port, connection=PtySerial(port, baudrate=19200, timeout=0.5), address=1)
+    """
+
+    def _reconfigure_port(self, force_update=False):
+        parity = self._parity
+        self._parity = serial.PARITY_NONE
+        try:
+            super()._reconfigure_port(force_update)
+        finally:
+            self._parity = parity
+
+    def send_break(self, duration=0.25):
+        if not self.is_open:
+            raise serial.PortNotOpenError()
+        time.sleep(duration)
+
+
+class PtyEgmServer:
+    """Serve simulated EGMs on pseudo terminals, all from one thread
+
+        server = PtyEgmServer()
+        port = server.add(SimulatedEgm(address=1))
+        server.start()
+        sas = Sas(port, connection=PtySerial(port, timeout=0.5), address=1)
+
+    ``add`` accepts several EGMs to put them on the same (multi-drop) port.
+    """
+
+    def __init__(self):
+        self.ports = {}
+        self._masters = {}
+        self._selector = selectors.DefaultSelector()
+        self._delaying = []  # (master, egm) of the EGMs that may hold delayed bytes
+        self._stop = threading.Event()
+        self._thread = None
+
+    def add(self, egms):
+        egms = list(egms) if isinstance(egms, (list, tuple)) else [egms]
+        master, slave = os.openpty()
+        tty.setraw(slave)
+        name = os.ttyname(slave)
+        self._masters[master] = (egms, slave)
+        self._selector.register(master, selectors.EVENT_READ, egms)
+        self._delaying.extend((master, egm) for egm in egms if egm.faults.get("delay"))
+        self.ports[name] = egms
+        return name
+
+    def _serve(self):
+        while not self._stop.is_set():
+            for key, _ in self._selector.select(self._wait()):
+                try:
+                    data = os.read(key.fd, 4096)
+                except OSError:
+                    continue
+                answer = b"".join(egm.receive(data) for egm in key.data)
+                if answer:
+                    os.write(key.fd, answer)
+
+            for master, egm in self._delaying:
+                if egm.held:
+                    released = egm.release()
+                    if released:
+                        os.write(master, released)
+
+    def _wait(self):
+        """Select timeout: until the next delayed answer is due, at most 0.1s"""
+        due = [egm.next_release() for _, egm in self._delaying if egm.held]
+        if not due:
+            return 0.1
+        return min(0.1, max(0.0, min(due) - time.monotonic()))
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._serve, name="egm-sim", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        for master, (_, slave) in self._masters.items():
+            self._selector.unregister(master)
+            os.close(master)
+            os.close(slave)
+        self._masters.clear()
+        self._delaying.clear()
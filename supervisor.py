@@ -0,0 +1,296 @@
+import json
+import logging
+import multiprocessing
+import struct
+import time
+from multiprocessing import shared_memory
+
+log = logging.getLogger(__name__)
+
+# Slot header: sequence number (odd while a write is in progress), update time, payload length
+_HEADER = struct.Struct("<QdI")
+
+
+class SnapshotTable:
+    """Fixed-size table of JSON records in shared memory
+
+    Each slot has a single writer and is guarded by a sequence lock: the
+    writer makes the sequence odd, writes the payload, then makes it even
+    again. Readers copy the slot and retry while the sequence is odd or has
+    changed during the copy, so they always get a consistent record without
+    any lock or IPC round trip.
+
+    Parameters
+    ----------
+    slots : int
+        Number of records
+    slot_size : int
+        Bytes per record, header included
+    name : str, optional
+        Attach to an existing table instead of creating one
+    """
+
+    def __init__(self, slots, slot_size=2048, name=None):
+        self.slots = slots
+        self.slot_size = slot_size
+        self.owner = name is None
+        self.shm = shared_memory.SharedMemory(name=name, create=self.owner, size=slots * slot_size)
+        if self.owner:
+            self.shm.buf[:] = bytes(len(self.shm.buf))
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    def _offset(self, slot):
+        if not 0 <= slot < self.slots:
+            raise IndexError(f"Slot {slot} out of range 0..{self.slots - 1}")
+        return slot * self.slot_size
+
+    def write(self, slot, record):
+        """Publish ``record`` (a JSON serializable dict) in ``slot``"""
+        offset = self._offset(slot)
+        payload = json.dumps(record, default=str).encode()
+        if len(payload) > self.slot_size - _HEADER.size:
+            raise ValueError(f"Record of {len(payload)} bytes does not fit a {self.slot_size} bytes slot")
+
+        buf = self.shm.buf
+        sequence = _HEADER.unpack_from(buf, offset)[0]
+        _HEADER.pack_into(buf, offset, sequence + 1, time.time(), len(payload))
+        buf[offset + _HEADER.size:offset + _HEADER.size + len(payload)] = payload
+        _HEADER.pack_into(buf, offset, sequence + 2, time.time(), len(payload))
+
+    def read(self, slot, retries=100):
+        """Consistent copy of the record in ``slot``, None if it was never written"""
+        offset = self._offset(slot)
+        buf = self.shm.buf
+        for _ in range(retries):
+            sequence, updated, length = _HEADER.unpack_from(buf, offset)
+            if sequence == 0:
+                return None
+            if sequence % 2:
+                continue
+
+            payload = bytes(buf[offset + _HEADER.size:offset + _HEADER.size + length])
+            if _HEADER.unpack_from(buf, offset)[0] == sequence:
+                record = json.loads(payload)
+                record["published_at"] = updated
+                return record
+
+        raise TimeoutError(f"Slot {slot} kept changing while being read")
+
+    def read_all(self):
+        """Records of every written slot"""
+        return [record for record in (self.read(slot) for slot in range(self.slots)) if record is not None]
+
+    def close(self):
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+def port_worker(port, first_slot, slots_per_port, table_name, table_slots, slot_size,
+                bus_kwargs, discover_kwargs, interval, meter_interval, stop):
+    """Poll every EGM of one port and publish their state (runs in its own process)"""
+    from activity import MeterScheduler
+    from sas_bus import SasBus
+
+    table = SnapshotTable(table_slots, slot_size, name=table_name)
+    bus = SasBus(port, **bus_kwargs)
+    try:
+        addresses = bus.discover(**discover_kwargs)[:slots_per_port]
+        if not addresses:
+            log.warning(f"{port}: no EGM answered")
+
+        records = {}
+        for position, address in enumerate(addresses):
+            records[address] = {
+                "port": port,
+                "address": address,
+                "state": "online",
+                "last_event": None,
+                "meters": {},
+                "meters_at": None,
+                "activity": None,
+                "health": {"polls": 0, "errors": 0, "consecutive_errors": 0, "last_error": None},
+            }
+            table.write(first_slot + position, records[address])
+
+        meters = MeterScheduler(meter_interval)
+        while not stop.is_set():
+            for address, code in bus.poll_round():
+                record = records[address]
+                health = record["health"]
+                health["polls"] += 1
+                if code is None:
+                    health["errors"] += 1
+                    health["consecutive_errors"] += 1
+                    record["state"] = "offline" if health["consecutive_errors"] >= 3 else "degraded"
+                else:
+                    health["consecutive_errors"] = 0
+                    record["state"] = "online"
+                    record["last_event"] = code
+                    meters.observe(address, code)
+
+                    if meters.due(address):
+                        try:
+                            values = bus.handle(address).send_meters_10_15()
+                        except Exception as e:
+                            values = None
+                            health["last_error"] = str(e)
+                        # An EGM with all its meters at zero answers an empty map
+                        if values is not None:
+                            meters.done(address)
+                            record["meters"] = dict(values)
+                            record["meters_at"] = time.time()
+                        else:
+                            meters.failed(address)
+                    record["activity"] = meters.classifier.state(address)
+
+                table.write(first_slot + addresses.index(address), record)
+
+            stop.wait(interval)
+    finally:
+        bus.close()
+        table.close()
+
+
+class PortSupervisor:
+    """Run one polling process per serial port and publish the results in shared memory
+
+    Every port gets its own worker process (its own interpreter, so the ports
+    use several cores and a crash stays on its port). A worker discovers the
+    EGMs of its port, general polls them in rotation, reads their meters as
+    often as their activity calls for (see ``activity.MeterScheduler``) and
+    writes one record per EGM into a ``SnapshotTable``. Dead workers are restarted with an exponential backoff,
+    reset once a worker stayed up for ``stable_after`` seconds.
+
+        supervisor = PortSupervisor(["/dev/ttyUSB0", "/dev/ttyUSB1"])
+        supervisor.start()
+        supervisor.run()        # or call supervisor.check() from your own loop
+
+    Other processes read the table with ``SnapshotTable(slots, slot_size, name=...)``.
+
+    Parameters
+    ----------
+    ports : list
+        Serial ports full addresses
+    slots_per_port : int
+        Maximum number of EGMs published per port
+    slot_size : int
+        Bytes per EGM record
+    interval : float
+        Pause between two poll rounds of a port
+    meter_interval : dict | float
+        Seconds between two meter reads of an EGM per activity class, by
+        default ``activity.METER_INTERVALS`` (10 s playing, 1 min active,
+        10 min idle); a number applies to every class
+    backoff : tuple
+        (first, maximum) restart delay in seconds
+    stable_after : float
+        Uptime after which a worker's restart delay is reset
+    discover_kwargs : dict, optional
+        ``SasBus.discover`` arguments
+    bus_kwargs :
+        ``SasBus`` arguments (timeout, baudrate, poll_address, denom...)
+    """
+
+    def __init__(self, ports, slots_per_port=16, slot_size=2048, interval=0.2, meter_interval=None,
+                 backoff=(1, 60), stable_after=300, discover_kwargs=None, **bus_kwargs):
+        self.ports = list(ports)
+        self.slots_per_port = slots_per_port
+        self.interval = interval
+        self.meter_interval = meter_interval
+        self.backoff = backoff
+        self.stable_after = stable_after
+        self.discover_kwargs = discover_kwargs or {}
+        self.bus_kwargs = bus_kwargs
+        self.table = SnapshotTable(len(self.ports) * slots_per_port, slot_size)
+        self.workers = {}
+        self.health = {
+            port: {"restarts": 0, "started_at": None, "delay": backoff[0], "restart_at": None, "exitcode": None}
+            for port in self.ports
+        }
+        self._context = multiprocessing.get_context("spawn")
+        self._stop = self._context.Event()
+
+    def _spawn(self, port):
+        index = self.ports.index(port)
+        worker = self._context.Process(
+            target=port_worker,
+            name=f"sas-{port}",
+            args=(
+                port,
+                index * self.slots_per_port,
+                self.slots_per_port,
+                self.table.name,
+                self.table.slots,
+                self.table.slot_size,
+                self.bus_kwargs,
+                self.discover_kwargs,
+                self.interval,
+                self.meter_interval,
+                self._stop,
+            ),
+            daemon=True,
+        )
+        worker.start()
+        self.workers[port] = worker
+        self.health[port]["started_at"] = time.monotonic()
+        self.health[port]["restart_at"] = None
+        log.info(f"{port}: worker started (pid {worker.pid})")
+
+    def start(self):
+        self._stop.clear()
+        for port in self.ports:
+            self._spawn(port)
+
+    def check(self):
+        """Schedule the restart of dead workers and restart the ones that are due"""
+        now = time.monotonic()
+        for port in self.ports:
+            health = self.health[port]
+            worker = self.workers.get(port)
+
+            if worker is not None and not worker.is_alive():
+                uptime = now - health["started_at"]
+                if uptime >= self.stable_after:
+                    health["delay"] = self.backoff[0]
+                health["exitcode"] = worker.exitcode
+                health["restart_at"] = now + health["delay"]
+                log.error(
+                    f"{port}: worker exited with {worker.exitcode} after {uptime:.1f}s, "
+                    f"restarting in {health['delay']:.1f}s"
+                )
+                health["delay"] = min(health["delay"] * 2, self.backoff[1])
+                self.workers[port] = None
+            elif worker is None and health["restart_at"] is not None and now >= health["restart_at"]:
+                health["restarts"] += 1
+                self._spawn(port)
+
+    def snapshot(self):
+        """Latest record of every EGM, with the health of their port worker"""
+        records = self.table.read_all()
+        for record in records:
+            record["worker"] = {
+                "alive": bool(self.workers.get(record["port"]) and self.workers[record["port"]].is_alive()),
+                "restarts": self.health[record["port"]]["restarts"],
+            }
+        return records
+
+    def run(self, period=1.0):
+        """Watch the workers until ``stop``"""
+        while not self._stop.is_set():
+            self.check()
+            self._stop.wait(period)
+
+    def stop(self, timeout=5):
+        self._stop.set()
+        for worker in self.workers.values():
+            if worker is None:
+                continue
+            worker.join(timeout)
+            if worker.is_alive():
+                worker.terminate()
+                worker.join()
+        self.table.close()
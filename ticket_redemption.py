@@ -0,0 +1,274 @@
+import logging
+import sqlite3
+import threading
+import time
+from collections import deque
+
+from utils.LatencyRecorder import LatencyRecorder
+
+log = logging.getLogger(__name__)
+
+# GPoll exceptions driving the ticket in flow
+TICKET_INSERTED = "67"
+TICKET_TRANSFER_COMPLETE = "68"
+
+# 71 transfer codes
+TRANSFER_CASHABLE = 0x00
+TRANSFER_RESTRICTED = 0x01
+TRANSFER_NONRESTRICTED = 0x02
+REJECT_NOT_IN_SYSTEM = 0x82
+REJECT_PENDING = 0x83
+REJECT_ALREADY_REDEEMED = 0x84
+TICKET_STATUS = 0xFF
+
+# 71 machine status
+REDEEMED = 0x00
+WAITING_FOR_71 = 0x20
+REDEMPTION_PENDING = 0x40
+
+# 70 ticket status
+TICKET_IN_ESCROW = 0x00
+
+# Validation types (4D) to the transfer code used to redeem them
+VALIDATION_TYPE_TRANSFER_CODE = {
+    0x00: TRANSFER_CASHABLE,
+    0x01: TRANSFER_RESTRICTED,
+    0x02: TRANSFER_CASHABLE,
+    0x03: TRANSFER_RESTRICTED,
+}
+
+ISSUED = "issued"
+PENDING = "pending"
+REDEEMED_STATUS = "redeemed"
+
+
+class TicketStore:
+    """Local ticket store standing in for the cage system
+
+    Tickets are kept in a dict keyed by the 16 digits validation number, so a
+    lookup never leaves the process; every change is written through to
+    SQLite so the store survives restarts. ``add_validation_record`` can be
+    used directly as the ``TitoSync`` sink to register printed tickets.
+
+    Parameters
+    ----------
+    path : str
+        SQLite database file (":memory:" for a throwaway store)
+    """
+
+    def __init__(self, path=":memory:"):
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(
+            """CREATE TABLE IF NOT EXISTS tickets (
+                validation_number TEXT PRIMARY KEY,
+                amount INTEGER NOT NULL,
+                transfer_code INTEGER NOT NULL,
+                status TEXT NOT NULL,
+                updated_at REAL NOT NULL
+            )"""
+        )
+        self._db.commit()
+        self._index = {
+            row[0]: {"amount": row[1], "transfer_code": row[2], "status": row[3]}
+            for row in self._db.execute(
+                "SELECT validation_number, amount, transfer_code, status FROM tickets"
+            )
+        }
+
+    def _write(self, validation_number):
+        ticket = self._index[validation_number]
+        self._db.execute(
+            "INSERT OR REPLACE INTO tickets VALUES (?, ?, ?, ?, ?)",
+            (validation_number, ticket["amount"], ticket["transfer_code"], ticket["status"], time.time()),
+        )
+        self._db.commit()
+
+    def add(self, validation_number, amount, transfer_code=TRANSFER_CASHABLE):
+        """Register an issued ticket (amount in cents)"""
+        with self._lock:
+            self._index[validation_number] = {
+                "amount": amount,
+                "transfer_code": transfer_code,
+                "status": ISSUED,
+            }
+            self._write(validation_number)
+
+    def add_validation_record(self, record):
+        """Register a ``ValidationRecord`` read from the EGM validation buffer"""
+        transfer_code = VALIDATION_TYPE_TRANSFER_CODE.get(record.validation_type)
+        if transfer_code is None:
+            return
+
+        self.add(record.validation_number, record.amount, transfer_code)
+
+    def lookup(self, validation_number):
+        """Return a copy of the ticket dict, or None if unknown"""
+        ticket = self._index.get(validation_number)
+        return dict(ticket) if ticket else None
+
+    def set_status(self, validation_number, status):
+        with self._lock:
+            if validation_number in self._index:
+                self._index[validation_number]["status"] = status
+                self._write(validation_number)
+
+    def close(self):
+        self._db.close()
+
+
+class TicketRedemption:
+    """Event driven ticket in pipeline (70 / 71)
+
+    ============  =====================================================
+    Stage         Trigger
+    ============  =====================================================
+    read          GPoll 67: read the ticket in escrow (70)
+    lookup        validation number looked up in the ``TicketStore``
+    authorize     71 with the transfer code (or a reject code)
+    complete      GPoll 68: 71 status poll until the EGM reports the
+                  final machine status
+    ============  =====================================================
+
+    Authorized tickets wait in ``pending`` until their transfer completes.
+    A ticket goes back to issued only when the EGM explicitly rejected it
+    (80-8F); when the outcome is unknown (no status answer, still pending
+    after ``max_status_polls``, or no 68 within ``pending_timeout``) the EGM
+    may have redeemed it, so it stays pending in the store, refused if
+    inserted again, and is put on ``review`` for an operator. Each stage
+    duration, and the whole 67 to completion time, is kept in ``latency``.
+
+    Parameters
+    ----------
+    sas : igtsas.Sas
+        Started connection to the EGM
+    store : TicketStore
+    max_status_polls : int
+        Maximum number of 71 status polls while the redemption is pending
+    pending_timeout : float
+        Seconds an authorized ticket waits for its 68 before going to ``review``
+    """
+
+    def __init__(self, sas, store, max_status_polls=10, pending_timeout=60):
+        self.sas = sas
+        self.store = store
+        self.max_status_polls = max_status_polls
+        self.pending_timeout = pending_timeout
+        self.pending = deque()
+        self.review = deque()
+        self.latency = {
+            stage: LatencyRecorder() for stage in ("read", "lookup", "authorize", "complete", "total")
+        }
+
+    def attach(self, events):
+        """Subscribe to the ticket in exceptions on an ``EventStream``"""
+        events.subscribe(TICKET_INSERTED, self.on_ticket_inserted)
+        events.subscribe(TICKET_TRANSFER_COMPLETE, self.on_transfer_complete)
+
+    def on_ticket_inserted(self, code=TICKET_INSERTED):
+        """Read, look up and authorize the ticket in escrow
+
+        Returns
+        -------
+        Mixed
+            dict | None - the 71 answer
+        """
+        self.expire()
+        started = time.monotonic()
+        with self.latency["read"].time():
+            ticket = self.sas.ticket_validation_data()
+
+        if not ticket or ticket["ticket_status"] != TICKET_IN_ESCROW or "validation_data" not in ticket:
+            log.warning(f"Ticket in: nothing in escrow ({ticket})")
+            return None
+
+        validation_number = ticket["validation_data"][-16:]
+        with self.latency["lookup"].time():
+            known = self.store.lookup(validation_number)
+
+        amount = 0
+        if known is None:
+            transfer_code = REJECT_NOT_IN_SYSTEM
+        elif known["status"] == REDEEMED_STATUS:
+            transfer_code = REJECT_ALREADY_REDEEMED
+        elif known["status"] == PENDING:
+            transfer_code = REJECT_PENDING
+        else:
+            transfer_code = known["transfer_code"]
+            amount = known["amount"]
+
+        with self.latency["authorize"].time():
+            answer = self.sas.redeem_ticket(
+                transfer_code=transfer_code,
+                transfer_amount=amount,
+                parsing_code=ticket["parsing_code"],
+                validation_data=ticket["validation_data"],
+            )
+
+        if transfer_code < 0x80:
+            self.store.set_status(validation_number, PENDING)
+            self.pending.append(
+                {"validation_number": validation_number, "amount": amount, "started": started}
+            )
+
+        log.info(f"Ticket {validation_number}: transfer code {transfer_code:02x}, answer {answer}")
+        return answer
+
+    def expire(self, now=None):
+        """Move the pending tickets that never got their 68 to ``review``"""
+        now = time.monotonic() if now is None else now
+        while self.pending and now - self.pending[0]["started"] >= self.pending_timeout:
+            self._to_review(self.pending.popleft(), "no transfer complete (68)")
+
+    def _to_review(self, ticket, reason):
+        # The EGM may have redeemed it: keep it pending so it cannot be redeemed twice
+        log.warning(f"Ticket {ticket['validation_number']}: {reason}, outcome unknown, kept pending for review")
+        self.review.append(dict(ticket, reason=reason))
+
+    def _take_pending(self, status):
+        """The pending ticket ``status`` is about; the oldest one when the status does not tell"""
+        validation_data = (status or {}).get("validation_data")
+        if validation_data:
+            for ticket in self.pending:
+                if ticket["validation_number"] == validation_data[-16:]:
+                    self.pending.remove(ticket)
+                    return ticket
+            # A 68 for a ticket that was not authorized (rejected at once)
+            return None
+        return self.pending.popleft()
+
+    def on_transfer_complete(self, code=TICKET_TRANSFER_COMPLETE):
+        """Fetch the final status of the pending ticket
+
+        Returns
+        -------
+        Mixed
+            dict | None - the last 71 status answer
+        """
+        self.expire()
+        if not self.pending:
+            return None
+
+        status = None
+        with self.latency["complete"].time():
+            for _ in range(self.max_status_polls):
+                status = self.sas.redeem_ticket(transfer_code=TICKET_STATUS)
+                if status is None or status["machine_status"] not in (WAITING_FOR_71, REDEMPTION_PENDING):
+                    break
+
+        ticket = self._take_pending(status)
+        if ticket is None:
+            return status
+
+        machine_status = status["machine_status"] if status is not None else None
+        if machine_status == REDEEMED:
+            self.store.set_status(ticket["validation_number"], REDEEMED_STATUS)
+        elif machine_status is not None and 0x80 <= machine_status <= 0x8F:
+            # Rejected by the EGM: the ticket can be inserted again
+            self.store.set_status(ticket["validation_number"], ISSUED)
+        else:
+            self._to_review(ticket, f"machine status {status}")
+
+        self.latency["total"].record(time.monotonic() - ticket["started"])
+        log.info(f"Ticket {ticket['validation_number']} transfer complete: {status}")
+        return status
@@ -0,0 +1,83 @@
+from igtsas import Sas
+from simulated_egm import LoopbackConnection, SimulatedEgm
+from ticket_redemption import ISSUED, PENDING, REDEEMED_STATUS, TicketRedemption, TicketStore
+
+VALIDATION_NUMBER = "1234567890123456"
+
+
+def _redemption(egm, amount=2000):
+    sas = Sas("test", connection=LoopbackConnection(egm), address=egm.address, debug_level="CRITICAL")
+    store = TicketStore()
+    store.add(VALIDATION_NUMBER, amount)
+    return TicketRedemption(sas, store)
+
+
+def test_ticket_redeemed():
+    egm = SimulatedEgm(address=1)
+    redemption = _redemption(egm)
+    egm.insert_ticket("01" + VALIDATION_NUMBER)
+
+    redemption.on_ticket_inserted()
+    assert redemption.store.lookup(VALIDATION_NUMBER)["status"] == PENDING
+    status = redemption.on_transfer_complete()
+
+    assert status["machine_status"] == 0x00
+    assert redemption.store.lookup(VALIDATION_NUMBER)["status"] == REDEEMED_STATUS
+    assert egm.meters["credits"] == 2000
+    assert not redemption.pending and not redemption.review
+
+
+def test_ticket_rejected_by_the_egm_can_be_inserted_again():
+    egm = SimulatedEgm(address=1)
+    redemption = _redemption(egm)
+    egm.insert_ticket("01" + VALIDATION_NUMBER, reject=0x86)
+
+    redemption.on_ticket_inserted()
+    status = redemption.on_transfer_complete()
+
+    assert status["machine_status"] == 0x86
+    assert redemption.store.lookup(VALIDATION_NUMBER)["status"] == ISSUED
+    assert egm.meters["credits"] == 0
+
+
+def test_unknown_ticket_is_rejected_by_the_host():
+    egm = SimulatedEgm(address=1)
+    redemption = _redemption(egm)
+    egm.insert_ticket("01" + "9" * 16)
+
+    redemption.on_ticket_inserted()
+    assert not redemption.pending
+    assert redemption.on_transfer_complete() is None
+    assert egm.ticket_in[1] == 0x82
+
+
+def test_status_timeout_keeps_the_ticket_pending():
+    egm = SimulatedEgm(address=1)
+    redemption = _redemption(egm)
+    egm.insert_ticket("01" + VALIDATION_NUMBER)
+    redemption.on_ticket_inserted()
+
+    egm._redeem = lambda body: None  # The 71 status polls go unanswered
+    assert redemption.on_transfer_complete() is None
+
+    assert redemption.store.lookup(VALIDATION_NUMBER)["status"] == PENDING
+    assert [ticket["validation_number"] for ticket in redemption.review] == [VALIDATION_NUMBER]
+
+    # Inserted again, the ticket is refused instead of being redeemed a second time
+    del egm._redeem
+    egm.insert_ticket("01" + VALIDATION_NUMBER)
+    redemption.on_ticket_inserted()
+    assert egm.ticket_in[1] == 0x83
+
+
+def test_pending_ticket_without_68_expires_to_review():
+    egm = SimulatedEgm(address=1)
+    redemption = _redemption(egm)
+    egm.insert_ticket("01" + VALIDATION_NUMBER)
+    redemption.on_ticket_inserted()
+
+    redemption.expire(now=redemption.pending[0]["started"] + redemption.pending_timeout)
+
+    assert not redemption.pending
+    assert len(redemption.review) == 1
+    assert redemption.store.lookup(VALIDATION_NUMBER)["status"] == PENDING
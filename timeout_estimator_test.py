@@ -0,0 +1,41 @@
+from utils.TimeoutEstimator import TimeoutEstimator
+
+METERS, HANDPAY = 0x1A, 0x1B
+
+
+def _learned(estimator, address=1):
+    for _ in range(estimator.min_samples):
+        estimator.observe(address, METERS, 0.01, 8, 8)
+    return estimator
+
+
+def test_slow_command_widens_its_deadline():
+    estimator = _learned(TimeoutEstimator(floor=0.05, ceiling=2.0))
+    slow = 0.3
+    assert estimator.deadline(1, HANDPAY) < slow
+
+    timeouts = 0
+    while estimator.deadline(1, HANDPAY) < slow:
+        estimator.observe(1, HANDPAY, estimator.deadline(1, HANDPAY), 0, 24)
+        estimator.observe(1, METERS, 0.01, 8, 8)
+        timeouts += 1
+        assert timeouts < 10
+
+    # Answering in full keeps the widened deadline until the command has its own
+    estimator.observe(1, HANDPAY, slow, 24, 24)
+    assert estimator.deadline(1, HANDPAY) >= slow
+    for _ in range(estimator.min_samples):
+        estimator.observe(1, HANDPAY, slow, 24, 24)
+    assert slow < estimator.deadline(1, HANDPAY) <= estimator.ceiling
+
+
+def test_dead_egm_keeps_failing_fast():
+    estimator = _learned(TimeoutEstimator(floor=0.05, ceiling=2.0))
+    deadline = estimator.deadline(1, METERS)
+
+    for _ in range(10):
+        estimator.observe(1, METERS, deadline, 0, 8)
+        estimator.observe(1, HANDPAY, deadline, 0, 24)
+
+    assert estimator.deadline(1, METERS) == deadline
+    assert estimator.deadline(1, HANDPAY) == deadline
@@ -0,0 +1,79 @@
+import logging
+
+from utils.SeenIndex import SeenIndex
+
+log = logging.getLogger(__name__)
+
+# GPoll exceptions that add an entry to the validation buffer
+TICKET_PRINTED = "3d"
+HANDPAY_VALIDATED = "3e"
+
+
+class TitoSync:
+    """Event driven sync of the EGM enhanced validation buffer (4D)
+
+    On every ticket printed / handpay validated exception the engine drains
+    the unread entries of the buffer with function code 00: each 00 returns
+    the oldest entry the host has not acknowledged yet and acknowledges the
+    one returned by the previous 00. An entry is therefore acknowledged
+    only once it was handed to ``sink``, and the EGM frees its slot; entries
+    never acknowledged would fill the 31 entries buffer, after which the EGM
+    refuses to print tickets. Records are deduplicated by validation number
+    (an acknowledgment lost before a restart makes the EGM send the entry
+    again) and handed to ``sink`` as ``models.ValidationRecord.ValidationRecord``.
+
+    Parameters
+    ----------
+    sas : igtsas.Sas
+        Started connection to the EGM
+    sink : callable
+        Called with each new ValidationRecord
+    index : utils.SeenIndex.SeenIndex, optional
+        Synced validation numbers; pass one with a ``path`` to survive restarts
+    """
+
+    BUFFER_SIZE = 0x1F
+    READ_CURRENT = 0x00
+
+    def __init__(self, sas, sink, index=None):
+        self.sas = sas
+        self.sink = sink
+        self.index = index if index is not None else SeenIndex(max_size=1024)
+
+    def attach(self, events):
+        """Subscribe to the exceptions that trigger a sync on an ``EventStream``"""
+        events.subscribe([TICKET_PRINTED, HANDPAY_VALIDATED], self.on_event)
+
+    def on_event(self, code):
+        self.sync()
+
+    def _emit(self, record):
+        if record.validation_number in self.index:
+            return False
+
+        self.sink(record)
+        self.index.add(record.validation_number)
+        return True
+
+    def sync(self):
+        """Read and acknowledge the validation entries added since the last sync
+
+        Returns
+        -------
+        int
+            Number of records handed to the sink
+        """
+        count = 0
+        try:
+            # One read more than the buffer holds: the empty answer acknowledges the last entry
+            for _ in range(self.BUFFER_SIZE + 1):
+                record = self.sas.enhanced_validation_record(self.READ_CURRENT)
+                if record is None:
+                    break
+
+                count += self._emit(record)
+        finally:
+            self.index.save()
+
+        log.info(f"TITO sync: {count} new validation records")
+        return count
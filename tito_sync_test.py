@@ -0,0 +1,62 @@
+from igtsas import Sas
+from simulated_egm import LoopbackConnection, SimulatedEgm
+from tito_sync import TitoSync
+
+
+def _sync(egm, records):
+    sas = Sas("test", connection=LoopbackConnection(egm), address=egm.address, debug_level="CRITICAL")
+    return TitoSync(sas, records.append)
+
+
+def _print_tickets(egm, count):
+    for _ in range(count):
+        egm.insert_bill(5)
+        egm.cash_out()
+
+
+def test_sync_acknowledges_the_records_it_read():
+    egm = SimulatedEgm(address=1, seed=1)
+    records = []
+    tito = _sync(egm, records)
+    _print_tickets(egm, 3)
+
+    assert tito.sync() == 3
+    assert [record.amount for record in records] == [500, 500, 500]
+    assert not egm.unread_validations
+    assert tito.sync() == 0
+
+
+def test_validation_buffer_never_fills():
+    egm = SimulatedEgm(address=1, seed=1, validation_acks=True)
+    records = []
+    tito = _sync(egm, records)
+
+    for _ in range(2 * TitoSync.BUFFER_SIZE):
+        _print_tickets(egm, 1)
+        tito.sync()
+
+    assert len(records) == 2 * TitoSync.BUFFER_SIZE
+    assert len({record.validation_number for record in records}) == len(records)
+    assert egm.refused_tickets == 0
+
+
+def test_unacknowledged_buffer_refuses_tickets():
+    egm = SimulatedEgm(address=1, seed=1, validation_acks=True)
+    _print_tickets(egm, TitoSync.BUFFER_SIZE + 1)
+
+    assert egm.refused_tickets == 1
+
+
+def test_record_sent_again_is_not_emitted_twice():
+    egm = SimulatedEgm(address=1, seed=1)
+    records = []
+    tito = _sync(egm, records)
+    _print_tickets(egm, 2)
+    assert tito.sync() == 2
+
+    # The acknowledgment of a record was lost: the EGM sends it again
+    egm.unread_validations.append(records[-1].index_number)
+
+    assert tito.sync() == 0
+    assert len(records) == 2
+    assert not egm.unread_validations
@@ -0,0 +1,138 @@
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+
+from error_handler import BusTimeout
+from utils.LatencyRecorder import LatencyRecorder
+
+
+class BusLock:
+    """Fair, reentrant lock around complete SAS transactions
+
+    Only one thread owns the bus at a time; the owner may acquire it again
+    (e.g. ``aft_jp`` calling ``selected_game_number``) without deadlocking.
+    Waiters are queued per key (the EGM address) and the bus is handed over
+    round-robin between keys, FIFO within a key: threads sharing one ``Sas``
+    are served in arrival order, and on a multi-drop bus a chatty EGM cannot
+    starve the others.
+
+    Contention is measured: ``wait`` and ``hold`` record how long transactions
+    waited for and kept the bus, see ``stats``.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._waiters = OrderedDict()
+        self._owner = None
+        self._depth = 0
+        self._acquired_at = None
+        self.transactions = 0
+        self.contended = 0
+        self.timeouts = 0
+        self.busy = 0.0  # Seconds the bus was held, all transactions together
+        self.wait = LatencyRecorder()
+        self.hold = LatencyRecorder()
+
+    def _grant(self, owner):
+        self._owner = owner
+        self._depth = 1
+        self._acquired_at = time.monotonic()
+
+    def acquire(self, key=None, timeout=None):
+        """Wait for the bus
+
+        Parameters
+        ----------
+        key : hashable
+            Fairness group, usually the EGM address
+        timeout : float, optional
+            Seconds to wait before giving up, forever if None
+
+        Raises
+        ------
+        BusTimeout
+            The bus was not granted within ``timeout``
+        """
+        me = threading.get_ident()
+        with self._lock:
+            if self._owner == me:
+                self._depth += 1
+                return
+
+            self.transactions += 1
+            if self._owner is None:
+                self._grant(me)
+                self.wait.record(0.0)
+                return
+
+            self.contended += 1
+            granted = threading.Event()
+            waiter = (granted, me)
+            self._waiters.setdefault(key, deque()).append(waiter)
+
+        started = time.monotonic()
+        if not granted.wait(timeout):
+            with self._lock:
+                # The bus may have been handed over between the timeout and this lock
+                if not granted.is_set():
+                    queue = self._waiters[key]
+                    queue.remove(waiter)
+                    if not queue:
+                        del self._waiters[key]
+                    self.timeouts += 1
+                    raise BusTimeout(f"Bus not granted within {timeout}s")
+
+        self.wait.record(time.monotonic() - started)
+
+    def release(self):
+        with self._lock:
+            if self._owner != threading.get_ident():
+                raise RuntimeError("Releasing a bus lock owned by another thread")
+
+            self._depth -= 1
+            if self._depth:
+                return
+
+            held = time.monotonic() - self._acquired_at
+            self.hold.record(held)
+            self.busy += held
+            if not self._waiters:
+                self._owner = None
+                return
+
+            # Hand the bus to the oldest key in the rotation, then move it to the back
+            key, queue = next(iter(self._waiters.items()))
+            granted, owner = queue.popleft()
+            if queue:
+                self._waiters.move_to_end(key)
+            else:
+                del self._waiters[key]
+            self._grant(owner)
+            granted.set()
+
+    def owned(self):
+        """True if the calling thread holds the bus"""
+        return self._owner == threading.get_ident()
+
+    @contextmanager
+    def slot(self, key=None, timeout=None):
+        self.acquire(key, timeout)
+        try:
+            yield
+        finally:
+            self.release()
+
+    def stats(self):
+        """Contention metrics: transaction counts and wait / hold summaries in ms"""
+        with self._lock:
+            waiting = sum(len(queue) for queue in self._waiters.values())
+
+        return {
+            "transactions": self.transactions,
+            "contended": self.contended,
+            "timeouts": self.timeouts,
+            "waiting": waiting,
+            "wait": self.wait.summary(),
+            "hold": self.hold.summary(),
+        }
@@ -58,6 +58,6 @@ def validate(check=None, init=0, sigbit=Endianness.LITTLE_ENDIAN):
     my_crc = calculate(check[0:-2], init=init, sigbit=sigbit)
 
     if rcvd_crc != my_crc:
-        raise BadCRC(hex(check))
+        raise BadCRC(bytes(check).hex())
     else:
         return check[1:-2]
\ No newline at end of file
@@ -75,4 +75,42 @@ def deprecated(reason):
         return new_func2
 
     else:
-        raise TypeError(repr(type(reason)))
\ No newline at end of file
+        raise TypeError(repr(type(reason)))
+
+def coalesced(window=0.0):
+    """
+    Share identical concurrent long polls of a ``Sas`` handle.
+
+    Calls with the same arguments made while one is in flight wait for it
+    instead of sending their own transaction (see ``utils.SingleFlight``).
+    ``window`` also serves the result to identical calls made within that
+    many seconds; it can be changed per poll with
+    ``sas.coalesce_windows["current_credits"] = 0.05``.
+    """
+
+    def decorator(func):
+        signature = inspect.signature(func)
+
+        @functools.wraps(func)
+        def wrapper(self, *args, **kwargs):
+            # The bus owner must not wait for a flight that is itself waiting for the bus
+            if self.scheduler is not None and self.scheduler.owned():
+                return func(self, *args, **kwargs)
+
+            bound = signature.bind(self, *args, **kwargs)
+            bound.apply_defaults()
+            key = (self.address, func.__name__, tuple(bound.arguments.items())[1:])
+            try:
+                hash(key)
+            except TypeError:
+                return func(self, *args, **kwargs)
+
+            return self.single_flight.do(
+                key,
+                lambda: func(self, *args, **kwargs),
+                self.coalesce_windows.get(func.__name__, window),
+            )
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,55 @@
+import time
+from collections import deque
+from contextlib import contextmanager
+
+
+class LatencyRecorder:
+    """Keep the last ``max_samples`` durations (in seconds) and summarize them"""
+
+    def __init__(self, max_samples=1000):
+        self.samples = deque(maxlen=max_samples)
+        self.count = 0
+
+    def record(self, seconds):
+        self.samples.append(seconds)
+        self.count += 1
+
+    @contextmanager
+    def time(self):
+        """Record the duration of the ``with`` block"""
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.record(time.monotonic() - start)
+
+    @staticmethod
+    def _rank(ordered, p):
+        return ordered[max(0, min(len(ordered) - 1, int(round(p / 100 * len(ordered))) - 1))]
+
+    def percentile(self, p):
+        """Nearest rank percentile (0-100) of the kept samples, None if empty"""
+        if not self.samples:
+            return None
+
+        return self._rank(sorted(self.samples), p)
+
+    def summary(self):
+        """Dict of count / min / avg / p50 / p95 / p99 / max, in milliseconds"""
+        if not self.samples:
+            return {"count": self.count}
+
+        ordered = sorted(self.samples)
+
+        def ms(value):
+            return round(value * 1000, 3)
+
+        return {
+            "count": self.count,
+            "min": ms(ordered[0]),
+            "avg": ms(sum(ordered) / len(ordered)),
+            "p50": ms(self._rank(ordered, 50)),
+            "p95": ms(self._rank(ordered, 95)),
+            "p99": ms(self._rank(ordered, 99)),
+            "max": ms(ordered[-1]),
+        }
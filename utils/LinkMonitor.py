@@ -0,0 +1,170 @@
+import logging
+import random
+import threading
+import time
+
+log = logging.getLogger(__name__)
+
+UP = "up"
+DEGRADED = "degraded"
+DOWN = "down"
+RECONNECTING = "reconnecting"
+
+# Poll failures, as reported to ``LinkMonitor.record``
+FAILURES = ("timeout", "crc", "bad_command", "chirp", "error")
+
+
+class LinkMonitor:
+    """State of the link to an EGM, driven by the outcome of its polls
+
+    Consecutive failures (timeouts, bad CRCs, wrong commands, I/O errors)
+    take the link from ``up`` to ``degraded`` and then ``down``; a chirp (the
+    EGM sending its address because it does not hear the host) degrades it
+    at once. While the link is down, polls fail immediately instead of each
+    waiting for its timeout, and a background thread calls ``reconnect``
+    with an exponential, jittered backoff, the link being ``reconnecting``
+    during each attempt. The first good poll or successful attempt brings
+    it back ``up``.
+
+        sas.link.subscribe(lambda old, new, reason: print(f"{old} -> {new}: {reason}"))
+
+    Parameters
+    ----------
+    reconnect : callable
+        Called from the background thread while the link is down; returns True once the EGM answers
+    degraded_after : int
+        Consecutive failures before ``degraded``
+    down_after : int
+        Consecutive failures before ``down``
+    backoff : tuple
+        (first, max) seconds between two reconnect attempts
+    jitter : float
+        Each delay is randomized by +/- this fraction, so that the ports of a
+        gateway do not all retry at the same time
+    name : str
+        For the logs and the reconnect thread
+    """
+
+    def __init__(self, reconnect, degraded_after=2, down_after=5, backoff=(0.5, 30), jitter=0.5, name="link"):
+        self.reconnect = reconnect
+        self.degraded_after = degraded_after
+        self.down_after = down_after
+        self.backoff = backoff
+        self.jitter = jitter
+        self.name = name
+        self.state = UP
+        self.reason = None
+        self.changed_at = time.monotonic()
+        self.consecutive = 0
+        self.last_failure = None
+        self.failures = dict.fromkeys(FAILURES, 0)
+        self.attempts = 0
+        self._handlers = []
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def subscribe(self, handler):
+        """Call ``handler(old_state, new_state, reason)`` on every change, from the polling or reconnect thread"""
+        self._handlers.append(handler)
+
+    def unsubscribe(self, handler):
+        if handler in self._handlers:
+            self._handlers.remove(handler)
+
+    def _set(self, state, reason):
+        with self._lock:
+            old = self.state
+            if old == state:
+                return
+            self.state, self.reason, self.changed_at = state, reason, time.monotonic()
+
+        log.log(logging.WARNING if state in (DOWN, DEGRADED) else logging.INFO,
+                f"{self.name}: link {old} -> {state} ({reason})")
+        for handler in list(self._handlers):
+            try:
+                handler(old, state, reason)
+            except Exception as e:
+                log.error(f"Link handler {handler} failed: {e}", exc_info=True)
+
+    def record(self, failure=None):
+        """Account for one poll
+
+        Parameters
+        ----------
+        failure : str, optional
+            None for a good answer, otherwise one of ``FAILURES``
+        """
+        if failure is None:
+            self.consecutive = 0
+            if self.state == DEGRADED:
+                self._set(UP, "poll answered")
+            return
+
+        self.consecutive += 1
+        self.last_failure = failure
+        self.failures[failure] += 1
+        # Polls of the reconnect attempts do not move the state, the reconnect loop does
+        if self.state in (DOWN, RECONNECTING):
+            return
+
+        if self.consecutive >= self.down_after:
+            self.mark_down(f"{self.consecutive} failed polls, last: {failure}")
+        elif self.state == UP and (self.consecutive >= self.degraded_after or failure == "chirp"):
+            self._set(DEGRADED, f"{self.consecutive} failed polls, last: {failure}")
+
+    def blocked(self):
+        """True when polls should fail fast (link down), except for the reconnect thread's own polls"""
+        return self.state in (DOWN, RECONNECTING) and threading.current_thread() is not self._thread
+
+    def mark_down(self, reason):
+        """Take the link down and start reconnecting in the background"""
+        self._set(DOWN, reason)
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._reconnect_loop, name=f"reconnect-{self.name}", daemon=True)
+            self._thread.start()
+
+    def _delay(self, attempt):
+        first, longest = self.backoff
+        delay = min(longest, first * 2 ** attempt)
+        return delay * (1 + self.jitter * (2 * random.random() - 1))
+
+    def _reconnect_loop(self):
+        attempt = 0
+        while not self._stop.is_set():
+            self._set(RECONNECTING, f"attempt {attempt + 1}")
+            self.attempts += 1
+            try:
+                ok = self.reconnect()
+            except Exception as e:
+                log.debug(f"{self.name}: reconnect attempt failed: {e}")
+                ok = False
+
+            if ok:
+                self.consecutive = 0
+                self._set(UP, f"reconnected after {attempt + 1} attempt(s)")
+                return
+
+            delay = self._delay(attempt)
+            self._set(DOWN, f"reconnect attempt {attempt + 1} failed, next in {delay:.1f}s")
+            attempt += 1
+            self._stop.wait(delay)
+
+    def close(self):
+        """Stop the reconnect thread"""
+        self._stop.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join()
+
+    def summary(self):
+        return {
+            "state": self.state,
+            "reason": self.reason,
+            "since": round(time.monotonic() - self.changed_at, 1),
+            "consecutive_failures": self.consecutive,
+            "failures": dict(self.failures),
+            "reconnect_attempts": self.attempts,
+        }
@@ -0,0 +1,66 @@
+import json
+import os
+import threading
+
+
+class ModelProfiles:
+    """Calibrated line settings per EGM model, with optional JSON persistence
+
+    Profiles are written by ``calibration.Calibrator`` and applied by
+    ``Sas`` (``profiles=``) once it has identified the model of its EGM.
+    The key is built by ``model_key`` from the 1F game information and the
+    54 SAS version, so one calibration serves every cabinet of the model;
+    the serials of the calibrated cabinets are kept in the profile.
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self._profiles = {}
+        self._lock = threading.Lock()
+
+        if self.path and os.path.exists(self.path):
+            self.load()
+
+    @staticmethod
+    def model_key(game_id, additional_id, paytable_id, sas_version):
+        """i.e. "AT000/000001/602" """
+        return f"{game_id}{additional_id}/{paytable_id}/{sas_version}"
+
+    def __contains__(self, key):
+        return key in self._profiles
+
+    def __len__(self):
+        return len(self._profiles)
+
+    def get(self, key):
+        """The profile of model ``key``, None if it was never calibrated"""
+        return self._profiles.get(key)
+
+    def settings(self):
+        """Distinct (poll_address, wait_for_wake_up) of the stored profiles, shortest wake up first"""
+        return sorted({(profile["poll_address"], profile["wait_for_wake_up"]) for profile in self._profiles.values()},
+                      key=lambda setting: (setting[1], setting[0]))
+
+    def put(self, key, profile, serial=None):
+        """Store the profile of model ``key``, remembering the cabinet ``serial`` it was measured on"""
+        with self._lock:
+            serials = list(self._profiles.get(key, {}).get("serials", []))
+            if serial and serial not in serials:
+                serials.append(serial)
+            self._profiles[key] = dict(profile, serials=serials)
+
+    def load(self):
+        """Load the profiles stored by ``save``"""
+        with open(self.path, "r") as profiles_file:
+            self._profiles.update(json.load(profiles_file))
+
+    def save(self):
+        """Atomically write the profiles to ``path`` (no-op for memory only stores)"""
+        if not self.path:
+            return
+
+        with self._lock:
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "w") as profiles_file:
+                json.dump(self._profiles, profiles_file, indent=2, sort_keys=True)
+            os.replace(tmp_path, self.path)
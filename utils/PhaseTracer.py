@@ -0,0 +1,171 @@
+import json
+import math
+import threading
+import time
+from array import array
+
+# Phases of one long poll, between consecutive marks taken in Sas._transmit
+PHASES = ("conf_port", "frame", "wake_up", "wake_up_sleep", "write", "read", "crc")
+
+
+class Histogram:
+    """Log-linear (HDR style) histogram of integer microseconds
+
+    Values are bucketed by power of two, each power split in
+    ``2 ** sub_bits`` linear sub-buckets, so every value is kept with a
+    relative error below ``2 ** -sub_bits`` (3% by default) whatever its
+    magnitude, in a few hundred buckets at most.
+    """
+
+    def __init__(self, sub_bits=5):
+        self.sub_bits = sub_bits
+        self.counts = {}
+        self.count = 0
+        self.min = None
+        self.max = None
+
+    def _index(self, value):
+        magnitude = max(0, value.bit_length() - self.sub_bits)
+        return magnitude, value >> magnitude
+
+    def record(self, value):
+        value = max(0, int(value))
+        index = self._index(value)
+        self.counts[index] = self.counts.get(index, 0) + 1
+        self.count += 1
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def percentile(self, p):
+        """Value (us) under which ``p`` percent of the samples fall, None if empty"""
+        if not self.count:
+            return None
+
+        target = max(1, math.ceil(p / 100 * self.count))
+        seen = 0
+        for magnitude, sub in sorted(self.counts):
+            seen += self.counts[(magnitude, sub)]
+            if seen >= target:
+                # Upper bound of the bucket, clamped to the largest value seen
+                return min(self.max, ((sub + 1) << magnitude) - 1)
+
+        return self.max
+
+    def summary(self):
+        return {
+            "count": self.count,
+            "min": self.min,
+            "p50": self.percentile(50),
+            "p90": self.percentile(90),
+            "p99": self.percentile(99),
+            "max": self.max,
+        }
+
+
+class PhaseTracer:
+    """Per phase timing of the long polls sent by a ``Sas`` handle
+
+    ``Sas._transmit`` takes a monotonic (``perf_counter``) timestamp at every
+    phase boundary (see ``PHASES``). Each transaction is stored in a
+    preallocated ring of the last ``capacity`` transactions and its phase
+    durations are added to per command histograms. When ``Sas.tracer`` is None the only cost left
+    in the hot path is a None check per phase.
+
+        sas.tracer = PhaseTracer()
+        ...
+        sas.tracer.summary("0f")["read"]["p99"]    # microseconds
+        sas.tracer.export("/tmp/phases.jsonl")
+
+    Parameters
+    ----------
+    capacity : int
+        Transactions kept in the ring
+    """
+
+    def __init__(self, capacity=4096):
+        self.capacity = capacity
+        self._width = len(PHASES) + 1
+        self._marks = array("d", [math.nan]) * (capacity * self._width)
+        self._commands = array("H", [0]) * capacity
+        self._next = 0
+        self.recorded = 0
+        self.histograms = {}
+        self._lock = threading.Lock()
+
+    def begin(self):
+        """Marks of a new transaction: its start time, then one NaN per phase boundary"""
+        return [time.perf_counter()] + [math.nan] * len(PHASES)
+
+    def record(self, command, marks):
+        """Store one transaction
+
+        Parameters
+        ----------
+        command : int
+            Command byte
+        marks : list
+            From ``begin``; phases not reached (failed transaction, no CRC to check) stay NaN
+        """
+        with self._lock:
+            slot = self._next
+            self._next = (slot + 1) % self.capacity
+            self.recorded += 1
+            self._commands[slot] = command
+            base = slot * self._width
+            self._marks[base:base + self._width] = array("d", marks)
+
+            histograms = self.histograms.get(command)
+            if histograms is None:
+                histograms = self.histograms[command] = {phase: Histogram() for phase in PHASES + ("total",)}
+            last = marks[0]
+            for i, phase in enumerate(PHASES):
+                if not math.isnan(marks[i + 1]):
+                    if not math.isnan(marks[i]):
+                        histograms[phase].record((marks[i + 1] - marks[i]) * 1e6)
+                    last = marks[i + 1]
+            histograms["total"].record((last - marks[0]) * 1e6)
+
+    def _row(self, slot):
+        base = slot * self._width
+        marks = self._marks[base:base + self._width]
+        phases = {}
+        for i, phase in enumerate(PHASES):
+            if not math.isnan(marks[i]) and not math.isnan(marks[i + 1]):
+                phases[phase] = round((marks[i + 1] - marks[i]) * 1e6, 1)
+        return {"command": f"{self._commands[slot]:02x}", "start": marks[0], "phases_us": phases}
+
+    def recent(self, n=None):
+        """Last ``n`` transactions (all the ring by default), oldest first"""
+        with self._lock:
+            kept = min(self.recorded, self.capacity)
+            n = kept if n is None else min(n, kept)
+            return [self._row((self._next - n + i) % self.capacity) for i in range(n)]
+
+    def percentile(self, command, phase, p):
+        """Percentile in microseconds of one phase of one command (hex string or int)"""
+        if isinstance(command, str):
+            command = int(command, 16)
+        histograms = self.histograms.get(command)
+        return histograms[phase].percentile(p) if histograms else None
+
+    def summary(self, command=None):
+        """Histogram summaries per phase, for one command or {command: ...} for all of them"""
+        with self._lock:
+            if command is not None:
+                if isinstance(command, str):
+                    command = int(command, 16)
+                histograms = self.histograms.get(command, {})
+                return {phase: histogram.summary() for phase, histogram in histograms.items()}
+
+            return {
+                f"{cmd:02x}": {phase: histogram.summary() for phase, histogram in histograms.items()}
+                for cmd, histograms in self.histograms.items()
+            }
+
+    def export(self, path):
+        """Write the ring as JSON lines, one transaction per line; returns the number of lines"""
+        rows = self.recent()
+        with open(path, "w") as export_file:
+            for row in rows:
+                export_file.write(json.dumps(row) + "\n")
+        return len(rows)
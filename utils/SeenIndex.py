@@ -0,0 +1,56 @@
+import json
+import os
+from collections import OrderedDict
+
+
+class SeenIndex:
+    """Bounded set of already processed ids with optional JSON persistence
+
+    Used by the bulk readers to stop as soon as they reach records that were
+    synced by a previous run. Oldest ids are evicted first once ``max_size``
+    is reached, so the file never grows past the EGM buffer sizes we care about.
+    """
+
+    def __init__(self, path=None, max_size=4096):
+        self.path = path
+        self.max_size = max_size
+        self._ids = OrderedDict()
+
+        if self.path and os.path.exists(self.path):
+            self.load()
+
+    def __contains__(self, key):
+        return key in self._ids
+
+    def __len__(self):
+        return len(self._ids)
+
+    def __iter__(self):
+        """Ids from the oldest to the most recent"""
+        return iter(self._ids)
+
+    def add(self, key):
+        """Remember an id, evicting the oldest one if the index is full"""
+        if key in self._ids:
+            self._ids.move_to_end(key)
+            return
+
+        self._ids[key] = None
+        while len(self._ids) > self.max_size:
+            self._ids.popitem(last=False)
+
+    def load(self):
+        """Load the ids stored by ``save``"""
+        with open(self.path, "r") as index_file:
+            for key in json.load(index_file):
+                self.add(key)
+
+    def save(self):
+        """Atomically write the ids to ``path`` (no-op for memory only indexes)"""
+        if not self.path:
+            return
+
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as index_file:
+            json.dump(list(self._ids), index_file)
+        os.replace(tmp_path, self.path)
@@ -0,0 +1,71 @@
+import copy
+import threading
+import time
+
+
+class _Flight:
+    __slots__ = ("done", "result", "error", "finished_at", "waiters")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.finished_at = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """Share one execution between identical concurrent calls
+
+    The first caller of a key runs the function, callers arriving while it
+    is in flight wait for it and get a copy of its result (or its exception).
+    With a ``window`` the finished result is also served to identical calls
+    made within ``window`` seconds of its completion.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._inflight = {}
+        self._recent = {}
+        self.calls = 0
+        self.executions = 0
+
+    def do(self, key, function, window=0.0):
+        with self._lock:
+            self.calls += 1
+            recent = self._recent.get(key)
+            if recent is not None:
+                if time.monotonic() - recent.finished_at < window:
+                    return copy.copy(recent.result)
+                del self._recent[key]
+
+            flight = self._inflight.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._inflight[key] = _Flight()
+                self.executions += 1
+            else:
+                flight.waiters += 1
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return copy.copy(flight.result)
+
+        try:
+            flight.result = function()
+            return flight.result
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            flight.finished_at = time.monotonic()
+            with self._lock:
+                del self._inflight[key]
+                if window > 0 and flight.error is None:
+                    self._recent[key] = flight
+            flight.done.set()
+
+    def stats(self):
+        return {"calls": self.calls, "executions": self.executions, "coalesced": self.calls - self.executions}
@@ -0,0 +1,114 @@
+import threading
+
+from utils.LatencyRecorder import LatencyRecorder
+
+
+class TimeoutEstimator:
+    """Read deadlines learned from the observed response latency
+
+    Latencies are kept per (address, command) in rolling windows. The
+    deadline of a command is its p99 times ``margin``, bounded by ``floor``
+    and ``ceiling``. Commands without enough samples yet (e.g. the ACK of a
+    rare ``shutdown``) use the p99 of every command of the same address, and
+    the default timeout until that one has enough samples too.
+
+    A truncated response means the deadline was too short: the deadline of
+    the command is doubled (up to ``ceiling``) until it answers in full
+    and has a deadline of its own. So is an empty response when the EGM
+    answered other commands since the previous miss of this one: the
+    command is slower than the rest, not the EGM gone. An empty response
+    is never a latency sample, and a dead EGM, answering nothing, keeps
+    failing fast instead of pushing its deadline up.
+
+    Parameters
+    ----------
+    margin : float
+        Multiplier applied to the p99
+    floor, ceiling : float
+        Deadline bounds in seconds
+    min_samples : int
+        Samples needed before a percentile is trusted
+    window : int
+        Samples kept per key
+    """
+
+    def __init__(self, margin=1.5, floor=0.05, ceiling=2.0, min_samples=20, window=200):
+        self.margin = margin
+        self.floor = floor
+        self.ceiling = ceiling
+        self.min_samples = min_samples
+        self.window = window
+        self._lock = threading.Lock()
+        self._latency = {}
+        self._deadlines = {}
+        self._widen = {}
+        self._answers = {}  # address: full answers so far
+        self._missed_at = {}  # (address, command): answers of the address at its last miss
+        self.misses = {}
+
+    def _recorder(self, key):
+        if key not in self._latency:
+            self._latency[key] = LatencyRecorder(self.window)
+        return self._latency[key]
+
+    def _compute(self, key):
+        recorder = self._latency.get(key)
+        if recorder is None or len(recorder.samples) < self.min_samples:
+            return None
+
+        return min(self.ceiling, max(self.floor, recorder.percentile(99) * self.margin))
+
+    def deadline(self, address, command, default=None):
+        """Read timeout in seconds for ``command`` sent to ``address``"""
+        with self._lock:
+            deadline = self._deadlines.get((address, command))
+            if deadline is None:
+                deadline = self._deadlines.get((address, None))
+            if deadline is None:
+                return default if default is not None else self.ceiling
+
+            return min(self.ceiling, deadline * self._widen.get((address, command), 1))
+
+    def observe(self, address, command, seconds, received, expected):
+        """Account for one read
+
+        Parameters
+        ----------
+        seconds : float
+            Time spent reading
+        received, expected : int
+            Bytes read and bytes asked for
+        """
+        key = (address, command)
+        with self._lock:
+            if received == 0:
+                self.misses[key] = self.misses.get(key, 0) + 1
+                answers = self._answers.get(address, 0)
+                if key in self._missed_at and answers > self._missed_at[key]:
+                    self._widen[key] = min(self._widen.get(key, 1) * 2, 64)
+                self._missed_at[key] = answers
+                return
+
+            if received < expected:
+                self._widen[key] = min(self._widen.get(key, 1) * 2, 64)
+                return
+
+            self._answers[address] = self._answers.get(address, 0) + 1
+            if key in self._deadlines:
+                self._widen.pop(key, None)
+            for recorder_key in (key, (address, None)):
+                recorder = self._recorder(recorder_key)
+                recorder.record(seconds)
+                # Sorting the window on every read is wasteful, refresh every few samples
+                if recorder.count % 10 == 0 or recorder_key not in self._deadlines:
+                    deadline = self._compute(recorder_key)
+                    if deadline is not None:
+                        self._deadlines[recorder_key] = deadline
+
+    def summary(self):
+        """{(address, command): {"deadline": s, "latency": LatencyRecorder.summary()}}"""
+        with self._lock:
+            return {
+                key: {"deadline": self._deadlines.get(key), "latency": recorder.summary()}
+                for key, recorder in self._latency.items()
+            }
@@ -0,0 +1,211 @@
+import logging
+import os
+import secrets
+import threading
+import time
+from collections import deque
+
+from utils.LatencyRecorder import LatencyRecorder
+from utils.SeenIndex import SeenIndex
+
+log = logging.getLogger(__name__)
+
+SYSTEM_VALIDATION_REQUEST = "57"
+VALIDATION_DENIED = 0x00
+
+
+class ValidationNumberPool:
+    """Pre-generated pool of unique 16 digits validation numbers
+
+    A background thread keeps at least ``low_water`` numbers ready so a
+    cashout never waits on generation or disk I/O. Every generated number is
+    appended to the log at ``path`` *before* it enters the pool: numbers left
+    in the pool at shutdown are simply never used again, which keeps them
+    unique across restarts without persisting each ``take``. A refill only
+    appends its own numbers; the log is rewritten with the ``max_numbers``
+    most recent ones once it has grown to twice that.
+
+    Parameters
+    ----------
+    path : str, optional
+        Log of every number generated, one per line
+    size : int
+        Numbers generated per refill
+    low_water : int
+        Refill as soon as fewer numbers are available
+    max_numbers : int
+        Generated numbers remembered to avoid reusing them
+    """
+
+    def __init__(self, path=None, size=100, low_water=20, max_numbers=100000):
+        self.path = path
+        self.size = size
+        self.low_water = low_water
+        self.max_numbers = max_numbers
+        self.generated = SeenIndex(max_size=max_numbers)
+        self._log = None
+        self._logged = 0  # Lines in the log
+        if self.path:
+            if os.path.exists(self.path):
+                with open(self.path, "r") as log_file:
+                    for line in log_file:
+                        if line.strip():
+                            self.generated.add(line.strip())
+                            self._logged += 1
+            self._log = open(self.path, "a")
+        self._pool = deque()
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self.refill()
+
+    def _new_number(self):
+        while True:
+            number = f"{secrets.randbelow(10 ** 16):016d}"
+            if number not in self.generated:
+                return number
+
+    def _persist(self, numbers):
+        """Append ``numbers`` to the log (already in ``generated``), durably"""
+        if self._log is None:
+            return
+
+        if self._logged + len(numbers) > 2 * self.max_numbers:
+            # Compact: only the remembered numbers, the new ones included
+            self._log.close()
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "w") as log_file:
+                log_file.writelines(f"{number}\n" for number in self.generated)
+                log_file.flush()
+                os.fsync(log_file.fileno())
+            os.replace(tmp_path, self.path)
+            self._log = open(self.path, "a")
+            self._logged = len(self.generated)
+            return
+
+        self._log.write("".join(f"{number}\n" for number in numbers))
+        self._log.flush()
+        os.fsync(self._log.fileno())
+        self._logged += len(numbers)
+
+    def refill(self):
+        """Top the pool up to ``size`` numbers, persisting them first"""
+        with self._lock:
+            missing = self.size - len(self._pool)
+            if missing <= 0:
+                return
+
+            numbers = []
+            for _ in range(missing):
+                number = self._new_number()
+                self.generated.add(number)
+                numbers.append(number)
+            self._persist(numbers)
+            self._pool.extend(numbers)
+
+    def take(self):
+        """Pop a validation number; generates one on the spot if the pool ran dry"""
+        try:
+            number = self._pool.popleft()
+        except IndexError:
+            log.warning("Validation number pool empty, generating synchronously")
+            self.refill()
+            number = self._pool.popleft()
+
+        if len(self._pool) < self.low_water:
+            self._wake.set()
+
+        return number
+
+    def __len__(self):
+        return len(self._pool)
+
+    def start(self):
+        """Start the background refill thread"""
+        if self._thread and self._thread.is_alive():
+            return
+
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="validation-pool", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+        if self._thread:
+            self._thread.join()
+
+    def close(self):
+        """Stop the refill thread and close the log"""
+        self.stop()
+        if self._log is not None:
+            self._log.close()
+            self._log = None
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wake.wait()
+            self._wake.clear()
+            if not self._stop.is_set():
+                self.refill()
+
+
+class ValidationResponder:
+    """Answer system validation requests (GPoll 57) as soon as they are polled
+
+    On a 57 exception the responder reads the pending cashout (57), then
+    sends a validation number from the pool (58). Time from the event
+    dispatch to the EGM acknowledgment is kept in ``latency``.
+
+    Parameters
+    ----------
+    sas : igtsas.Sas
+        Started connection to the EGM
+    pool : ValidationNumberPool
+    system_id : int
+        Validation System ID Code sent with every approved cashout
+    approve : callable, optional
+        Called with the pending cashout dict; returning False denies the validation
+    """
+
+    def __init__(self, sas, pool, system_id=0x01, approve=None):
+        self.sas = sas
+        self.pool = pool
+        self.system_id = system_id
+        self.approve = approve
+        self.latency = LatencyRecorder()
+        self.last_result = None
+
+    def attach(self, events):
+        """Subscribe to system validation requests on an ``EventStream``"""
+        events.subscribe(SYSTEM_VALIDATION_REQUEST, self.on_event)
+
+    def on_event(self, code):
+        self.respond()
+
+    def respond(self):
+        """Validate the pending cashout
+
+        Returns
+        -------
+        Mixed
+            str | none - rcv_validation_number status (00 = ack | 80 = not in cashout | 81 = rejected)
+        """
+        start = time.monotonic()
+        cashout = self.sas.pending_cashout_info()
+        if cashout is None:
+            log.error("System validation: no pending cashout info")
+            return None
+
+        if self.approve is not None and not self.approve(cashout):
+            status = self.sas.rcv_validation_number(VALIDATION_DENIED, 0)
+            number = None
+        else:
+            number = self.pool.take()
+            status = self.sas.rcv_validation_number(self.system_id, number)
+
+        self.latency.record(time.monotonic() - start)
+        self.last_result = {"cashout": cashout, "validation_number": number, "status": status}
+        log.info(f"System validation {number} answered with status {status}")
+        return status
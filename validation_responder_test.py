@@ -0,0 +1,59 @@
+from igtsas import Sas
+from simulated_egm import LoopbackConnection, SimulatedEgm
+from validation_responder import ValidationNumberPool, ValidationResponder
+
+
+def _responder(egm, **kwargs):
+    sas = Sas("test", connection=LoopbackConnection(egm), address=egm.address, debug_level="CRITICAL")
+    return ValidationResponder(sas, ValidationNumberPool(size=5, low_water=1), **kwargs)
+
+
+def test_pending_cashout_is_validated():
+    egm = SimulatedEgm(address=1)
+    egm.insert_bill(20)
+    egm.request_validation(cashout_type=0x01)
+    responder = _responder(egm, system_id=0x02)
+
+    assert responder.respond() == "00"
+    cashout = responder.last_result["cashout"]
+    assert cashout["cashout_type"] == 1
+    assert cashout["cashout_amount"] == 2000
+    assert egm.validation_numbers == [(0x02, responder.last_result["validation_number"])]
+    assert egm.pending_cashout is None
+
+
+def test_denied_validation():
+    egm = SimulatedEgm(address=1)
+    egm.insert_bill(5)
+    egm.request_validation()
+    responder = _responder(egm, approve=lambda cashout: False)
+
+    assert responder.respond() == "00"
+    assert responder.last_result["validation_number"] is None
+    assert egm.validation_numbers == [(0x00, "0000000000000000")]
+
+
+def test_pool_appends_its_numbers_and_survives_restarts(tmp_path):
+    path = str(tmp_path / "validation_numbers.log")
+    first = ValidationNumberPool(path, size=10, low_water=2)
+    taken = {first.take() for _ in range(10)}
+    first.close()
+
+    second = ValidationNumberPool(path, size=10, low_water=2)
+    assert not taken & {second.take() for _ in range(10)}
+    second.close()
+    with open(path) as log_file:
+        assert len(log_file.read().split()) == 20  # One refill of 10 per pool, appended
+
+
+def test_pool_log_is_compacted(tmp_path):
+    path = str(tmp_path / "validation_numbers.log")
+    pool = ValidationNumberPool(path, size=10, low_water=2, max_numbers=25)
+    for _ in range(60):
+        pool.take()
+    pool.close()
+
+    with open(path) as log_file:
+        numbers = log_file.read().split()
+    assert len(numbers) <= 2 * 25
+    assert len(set(numbers)) == len(numbers)
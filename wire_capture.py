@@ -0,0 +1,229 @@
+import logging
+import os
+import struct
+import threading
+import time
+from dataclasses import dataclass
+
+log = logging.getLogger(__name__)
+
+MAGIC = b"SASCAP\x02"
+_FILE_HEADER = struct.Struct("<d")  # Wall clock time of the first record
+_RECORD = struct.Struct("<QBcH")  # Microseconds since the start of the file, direction, parity, length
+# Version 1 files: 32 bits microseconds since the previous record (idle gaps over ~71 minutes were clamped)
+_MAGIC_V1 = b"SASCAP\x01"
+_RECORD_V1 = struct.Struct("<IBcH")
+
+TX = 0
+RX = 1
+
+
+@dataclass(slots=True)
+class CaptureRecord:
+    at: float  # Seconds since the start of the file (monotonic)
+    direction: int  # TX or RX
+    parity: str  # Serial parity when the bytes went through ("M" wake-up, "S" data, "N" general poll)
+    data: bytes
+
+
+class CaptureWriter:
+    """Append the bytes of a serial session to a compact binary file
+
+    Each record is a 12 bytes header (microseconds since the start of the
+    file, direction, parity, length) followed by the bytes. The records are
+    flushed to the file every ``flush_interval`` seconds, so a crash loses
+    at most the last ones. When the file exceeds
+    ``max_bytes`` it is renamed ``path.1`` (older ones shifted up to
+    ``path.<backups>``) and a new file is started. A capture already at
+    ``path`` is rotated the same way on start, so a process restart keeps
+    it (unless ``backups`` is 0).
+    """
+
+    def __init__(self, path, max_bytes=16 * 1024 * 1024, backups=5, flush_interval=1.0):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._file = None
+        self._started = None
+        self._flushed = None
+        if os.path.exists(self.path) and os.path.getsize(self.path):
+            self._shift()
+        self._open()
+
+    def _open(self):
+        self._file = open(self.path, "wb")
+        self._file.write(MAGIC + _FILE_HEADER.pack(time.time()))
+        self._file.flush()
+        self._started = self._flushed = time.monotonic()
+
+    def _shift(self):
+        """Move the file at ``path`` to ``path.1``, the older backups one up"""
+        for i in range(self.backups - 1, 0, -1):
+            if os.path.exists(f"{self.path}.{i}"):
+                os.replace(f"{self.path}.{i}", f"{self.path}.{i + 1}")
+        if self.backups:
+            os.replace(self.path, f"{self.path}.1")
+
+    def _rotate(self):
+        self._file.close()
+        self._shift()
+        self._open()
+
+    def record(self, direction, parity, data):
+        with self._lock:
+            if self._file.tell() >= self.max_bytes:
+                self._rotate()
+            now = time.monotonic()
+            at = int((now - self._started) * 1e6)
+            self._file.write(_RECORD.pack(at, direction, parity.encode()[:1] or b"N", len(data)) + data)
+            if now - self._flushed >= self.flush_interval:
+                self._file.flush()
+                self._flushed = now
+
+    def flush(self):
+        with self._lock:
+            self._file.flush()
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+
+def read_capture(path):
+    """Yield the ``CaptureRecord`` of a capture file (current or version 1), in order"""
+    with open(path, "rb") as capture_file:
+        magic = capture_file.read(len(MAGIC))
+        if magic not in (MAGIC, _MAGIC_V1):
+            raise ValueError(f"{path} is not a SAS capture")
+        record = _RECORD if magic == MAGIC else _RECORD_V1
+        capture_file.read(_FILE_HEADER.size)
+
+        at = 0.0
+        while True:
+            header = capture_file.read(record.size)
+            if len(header) < record.size:
+                return
+            time_us, direction, parity, length = record.unpack(header)
+            # Version 1 stored the delta since the previous record
+            at = time_us / 1e6 if magic == MAGIC else at + time_us / 1e6
+            yield CaptureRecord(at, direction, parity.decode(), capture_file.read(length))
+
+
+class CaptureConnection:
+    """Serial connection wrapper recording every byte written and read
+
+    Everything else (timeout, parity, flush...) goes to the wrapped
+    connection untouched.
+    """
+
+    def __init__(self, connection, writer):
+        object.__setattr__(self, "_connection", connection)
+        object.__setattr__(self, "_writer", writer)
+
+    def _parity(self):
+        return str(getattr(self._connection, "parity", "N"))
+
+    def write(self, data):
+        data = bytes(data)
+        self._writer.record(TX, self._parity(), data)
+        return self._connection.write(data)
+
+    def read(self, size=1):
+        data = self._connection.read(size)
+        self._writer.record(RX, self._parity(), bytes(data))
+        return data
+
+    def close(self):
+        self._writer.flush()
+        self._connection.close()
+
+    def __getattr__(self, name):
+        return getattr(self._connection, name)
+
+    def __setattr__(self, name, value):
+        setattr(self._connection, name, value)
+
+
+class ReplayConnection:
+    """Serial connection replaying a capture, to feed ``Sas`` or a parser with real traffic
+
+        sas = Sas("replay", connection=ReplayConnection(read_capture("floor.cap")), address=1)
+
+    Reads return the recorded chunks in order; writes consume the recorded
+    ones and count the differences in ``mismatches``. With ``speed`` the
+    reads are paced like the recording (2.0 = twice as fast), otherwise they
+    return as fast as possible.
+
+    Parameters
+    ----------
+    records : iterable
+        ``CaptureRecord`` (e.g. ``read_capture(path)``)
+    speed : float, optional
+    """
+
+    def __init__(self, records, speed=None):
+        self.records = list(records)
+        self.speed = speed
+        self.position = 0
+        self.mismatches = 0
+        self.timeout = None
+        self.parity = "N"
+        self.stopbits = 1
+        self.baudrate = 19200
+        self.is_open = True
+        self._started = None
+
+    @property
+    def done(self):
+        return self.position >= len(self.records)
+
+    def _pace(self, record):
+        if self.speed is None:
+            return
+        if self._started is None:
+            self._started = time.monotonic() - record.at / self.speed
+        delay = self._started + record.at / self.speed - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+
+    def write(self, data):
+        data = bytes(data)
+        if self.done or self.records[self.position].direction != TX:
+            self.mismatches += 1
+            return len(data)
+
+        record = self.records[self.position]
+        self.position += 1
+        if record.data != data:
+            self.mismatches += 1
+            log.debug(f"Replay write {data.hex()} differs from the capture {record.data.hex()}")
+        return len(data)
+
+    def read(self, size=1):
+        if self.done or self.records[self.position].direction != RX:
+            return b""
+
+        record = self.records[self.position]
+        self.position += 1
+        self._pace(record)
+        return record.data
+
+    def open(self):
+        self.is_open = True
+
+    def close(self):
+        self.is_open = False
+
+    def flush(self):
+        pass
+
+    def reset_input_buffer(self):
+        pass
+
+    def reset_output_buffer(self):
+        pass
+
+    def send_break(self, duration=0.25):
+        pass
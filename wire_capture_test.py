@@ -0,0 +1,45 @@
+import struct
+import time
+
+from wire_capture import RX, TX, CaptureWriter, read_capture
+
+
+def test_idle_gap_longer_than_71_minutes(tmp_path, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(time, "monotonic", lambda: now[0])
+    path = str(tmp_path / "floor.cap")
+    writer = CaptureWriter(path)
+    writer.record(TX, "M", b"\x81")
+    now[0] += 3 * 3600
+    writer.record(RX, "N", b"\x00")
+    writer.close()
+
+    records = list(read_capture(path))
+
+    assert [record.at for record in records] == [0.0, 3 * 3600.0]
+    assert [(record.direction, record.parity, record.data) for record in records] == [(TX, "M", b"\x81"), (RX, "N", b"\x00")]
+
+
+def test_records_flushed_without_close(tmp_path, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(time, "monotonic", lambda: now[0])
+    path = str(tmp_path / "floor.cap")
+    writer = CaptureWriter(path, flush_interval=1.0)
+    writer.record(TX, "M", b"\x01\x1f")
+    now[0] += 1.5
+    writer.record(RX, "S", b"\x01")
+
+    assert [record.data for record in read_capture(path)] == [b"\x01\x1f", b"\x01"]
+    writer.close()
+
+
+def test_read_version_1_capture(tmp_path):
+    path = tmp_path / "old.cap"
+    record = struct.Struct("<IBcH")
+    path.write_bytes(
+        b"SASCAP\x01" + struct.pack("<d", 0.0)
+        + record.pack(0, TX, b"M", 1) + b"\x81"
+        + record.pack(2500, RX, b"N", 1) + b"\x00"
+    )
+
+    assert [(r.at, r.data) for r in read_capture(str(path))] == [(0.0, b"\x81"), (0.0025, b"\x00")]